@@ -1,3 +1,4 @@
+import sys
 import json
 import argparse
 from pathlib import Path
@@ -6,6 +7,16 @@ from collections import defaultdict
 
 import metadata
 
+# ビルドキャッシュとプロファイラはアプリ側のscripts/build_cache.py、src/python/profiling.pyを使う
+sys.path.insert(0, str(Path(__file__).resolve().parents[2] / "scripts"))
+sys.path.insert(0, str(Path(__file__).resolve().parents[2] / "src" / "python"))
+from build_cache import MANIFEST_NAME, BuildManifest  # noqa: E402
+from profiling import Profiler  # noqa: E402
+
+EMOJI_JA_PATH = Path("data/emoji_ja.json")
+KEYWORD2EMOJI_PATH = Path("data/keyword2emoji_ja.json")
+GROUP2EMOJI_PATH = Path("data/group2emoji_ja.json")
+
 
 def parse_ldml_annotation(filepath):
     ldml_file = Path(filepath)
@@ -44,7 +55,12 @@ def parse_emoji_test(filepath, translate=True):
             if line[0] == "#" or line.strip() == "":
                 continue
 
-            codepoints = line.split(";")[0].strip()
+            # 例: 1F600 ; fully-qualified # 😀 E1.0 grinning face
+            codepoints, rest = line.split(";", 1)
+            codepoints = codepoints.strip()
+            status, comment = rest.split("#", 1)
+            version_marker = comment.split()[1]
+            version = float(version_marker[1:]) if version_marker.startswith("E") else None
             if " " in codepoints:
                 emoji = "".join([chr(int(c, 16)) for c in codepoints.split(" ")])
             else:
@@ -56,7 +72,8 @@ def parse_emoji_test(filepath, translate=True):
                 if subgroup_name and subgroup_name in metadata.subgroup:
                     subgroup_name = metadata.subgroup[subgroup_name]
 
-            emoji_dict[emoji] = {"group": group_name, "subgroup": subgroup_name}
+            emoji_dict[emoji] = {"group": group_name, "subgroup": subgroup_name,
+                                 "status": status.strip(), "version": version}
     return emoji_dict
 
 
@@ -82,15 +99,7 @@ def dump_to_json(d, filepath):
         json.dump(d, f, ensure_ascii=False, indent=4)
 
 
-if __name__ == '__main__':
-    parser = argparse.ArgumentParser()
-    parser.add_argument("--annotation", type=str,  default='data/unicode/ja.xml', help='CJK Annotations file')
-    parser.add_argument("--full_emoji", type=str,  default='data/unicode/emoji-test.txt', help='Full Emoji List')
-    args = parser.parse_args()
-
-    emoji_ja = parse_ldml_annotation(args.annotation)
-    emoji_group = parse_emoji_test(args.full_emoji, translate=True)
-
+def merge_emoji_data(emoji_ja, emoji_group):
     # 国旗を追加する(REGIONAL INDICATORのペア)
     for emoji, short_name in metadata.flag.items():
         if emoji in emoji_group:
@@ -99,16 +108,75 @@ if __name__ == '__main__':
             emoji_group[emoji]["keywords"] = metadata.flag_keyword
             emoji_ja[emoji] = emoji_group[emoji]
 
+    # CLDRのキーはU+FE0Fを省いた表記なので、状態は完全修飾形（FE0F付き）のものを記録する
+    fully_qualified = {emoji.replace("\ufe0f", ""): meta for emoji, meta in emoji_group.items()
+                       if meta["status"] == "fully-qualified"}
+
     # emoji_jaとemoji_groupをマージする
     output = {}
     for emoji, meta in emoji_ja.items():
         output[emoji] = meta
         if emoji in emoji_group:
             output[emoji].update(emoji_group[emoji])
+            qualified = fully_qualified.get(emoji.replace("\ufe0f", ""))
+            if qualified is not None:
+                output[emoji].update({"status": qualified["status"], "version": qualified["version"]})
         else:
-            output[emoji].update({"group": "", "subgroup": ""})
+            output[emoji].update({"group": "", "subgroup": "", "status": None, "version": None})
+    return output
+
+
+def build(annotation, full_emoji, force=False, profiler=None):
+    """入力とビルダーが前回と同じなら、出力済みのステージを省略する"""
+    profiler = profiler or Profiler(enabled=False)
+    manifest = BuildManifest(Path("data") / MANIFEST_NAME)
+    key = manifest.stage_key([Path(annotation), Path(full_emoji),
+                              Path(metadata.__file__), Path(__file__)])
+    parse_fresh = not force and manifest.is_fresh("parse", key, [EMOJI_JA_PATH])
+    derived_fresh = not force and manifest.is_fresh("derived", key, [KEYWORD2EMOJI_PATH, GROUP2EMOJI_PATH])
+    if parse_fresh and derived_fresh:
+        print("入力に変更がないため出力をそのまま使います（--forceで作り直し）")
+        return
+
+    with profiler.stage("parse emoji-test"):
+        emoji_group = parse_emoji_test(full_emoji, translate=True)
+
+    if parse_fresh:
+        # 派生データだけ作り直す。merge_emoji_dataはemoji_jaの辞書に国旗とグループを書き足すので、
+        # emoji_ja.jsonはマージ後のemoji_jaと同じ内容になる
+        with profiler.stage("load json"), open(EMOJI_JA_PATH, "r", encoding="utf-8") as f:
+            emoji_ja = json.load(f)
+    else:
+        manifest.invalidate("parse")
+        with profiler.stage("parse XML"):
+            emoji_ja = parse_ldml_annotation(annotation)
+        with profiler.stage("merge"):
+            output = merge_emoji_data(emoji_ja, emoji_group)
+        with profiler.stage("dump"):
+            dump_to_json(output, EMOJI_JA_PATH)
+        manifest.record("parse", key, [EMOJI_JA_PATH])
+
+    if not derived_fresh:
+        manifest.invalidate("derived")
+        with profiler.stage("derive"):
+            keyword2emoji = make_keyword2emoji(emoji_ja)
+            group2emoji = make_group2emoji(emoji_group)
+        with profiler.stage("dump"):
+            dump_to_json(keyword2emoji, KEYWORD2EMOJI_PATH)
+            dump_to_json(group2emoji, GROUP2EMOJI_PATH)
+        manifest.record("derived", key, [KEYWORD2EMOJI_PATH, GROUP2EMOJI_PATH])
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--annotation", type=str,  default='data/unicode/ja.xml', help='CJK Annotations file')
+    parser.add_argument("--full_emoji", type=str,  default='data/unicode/emoji-test.txt', help='Full Emoji List')
+    parser.add_argument("--force", action="store_true", help='入力が変わっていなくても作り直す')
+    parser.add_argument("--profile", action="store_true", help='ステージごとの処理時間とメモリのピークを表示')
+    parser.add_argument("--profile-output", metavar="FILE", help='cProfileの結果をpstats形式で保存する（--profileと併用）')
+    args = parser.parse_args()
 
-    # 出力
-    dump_to_json(output, "data/emoji_ja.json")
-    dump_to_json(make_keyword2emoji(emoji_ja), "data/keyword2emoji_ja.json")
-    dump_to_json(make_group2emoji(emoji_group), "data/group2emoji_ja.json")
+    profiler = Profiler(enabled=args.profile, pstats_path=args.profile_output)
+    with profiler:
+        build(args.annotation, args.full_emoji, force=args.force, profiler=profiler)
+    profiler.report()
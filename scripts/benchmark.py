@@ -0,0 +1,305 @@
+"""
+EmojiDataとseed_dbのベンチマーク。
+合成した大規模カタログ（1万〜100万件）をseed_db.pyのスキーマで作成し、
+各操作のレイテンシ（p50/p95/p99）を計測してJSONで出力する。
+
+使用例:
+    python scripts/benchmark.py --sizes 10000,100000 --history 1000000 --output bench.json
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import logging
+import math
+import platform
+import random
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Any, Callable, Dict, List
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT_DIR / 'scripts'))
+sys.path.insert(0, str(ROOT_DIR / 'src' / 'python'))
+
+import seed_db  # noqa: E402
+from custom_emoji import StoredImage  # noqa: E402
+from emoji_data import EmojiData, USER_SCHEMA  # noqa: E402
+
+# カタカナ・ひらがなから合成キーワードを作る
+KANA = [chr(c) for c in range(0x30A2, 0x30F3)] + [chr(c) for c in range(0x3042, 0x3093)]
+
+def percentile(samples: List[float], pct: float) -> float:
+    """
+    最近傍順位法でパーセンタイルを求める
+
+    Args:
+        samples: ソート済みのサンプル
+        pct: パーセンタイル（0〜100）
+
+    Returns:
+        パーセンタイル値
+    """
+    if not samples:
+        return 0.0
+    rank = max(0, min(len(samples) - 1, math.ceil(pct / 100 * len(samples)) - 1))
+    return samples[rank]
+
+def summarize(samples_ms: List[float]) -> Dict[str, float]:
+    """
+    計測値（ミリ秒）を集計する
+    """
+    samples = sorted(samples_ms)
+    return {
+        'n': len(samples),
+        'min_ms': round(samples[0], 4) if samples else 0.0,
+        'mean_ms': round(sum(samples) / len(samples), 4) if samples else 0.0,
+        'p50_ms': round(percentile(samples, 50), 4),
+        'p95_ms': round(percentile(samples, 95), 4),
+        'p99_ms': round(percentile(samples, 99), 4),
+        'max_ms': round(samples[-1], 4) if samples else 0.0,
+    }
+
+def generate_vocabulary(n_keywords: int, rng: random.Random) -> List[str]:
+    """
+    重複のない合成キーワードを生成する
+    """
+    vocabulary = set()
+    while len(vocabulary) < n_keywords:
+        vocabulary.add(''.join(rng.choice(KANA) for _ in range(rng.randint(2, 6))))
+    return sorted(vocabulary)
+
+def generate_catalog(n_emojis: int, n_keywords: int, seed: int = 0) -> Dict[str, Dict[str, Any]]:
+    """
+    emoji_ja.jsonと同じ形式の合成カタログを生成する
+
+    Args:
+        n_emojis: 絵文字数
+        n_keywords: キーワードの語彙数
+        seed: 乱数シード
+
+    Returns:
+        unicode文字列をキーとする絵文字データの辞書
+    """
+    rng = random.Random(seed)
+    vocabulary = generate_vocabulary(n_keywords, rng)
+    groups = [f"グループ{g}" for g in range(10)]
+
+    catalog = {}
+    for i in range(n_emojis):
+        # 私用領域の2文字で一意な疑似絵文字を作る
+        unicode = chr(0xF0000 + i % 0xFFFD) + chr(0x100000 + i // 0xFFFD)
+        # 実データと同様に一部のキーワードへ偏らせる
+        keywords = list({vocabulary[min(int(rng.paretovariate(1.2)) - 1, n_keywords - 1)]
+                         if rng.random() < 0.3 else rng.choice(vocabulary)
+                         for _ in range(rng.randint(3, 6))})
+        group = rng.choice(groups)
+        catalog[unicode] = {
+            'keywords': keywords,
+            'short_name': f"{keywords[0]}{i}",
+            'group': group,
+            'subgroup': f"{group}-{rng.randint(0, 9)}",
+            'status': 'fully-qualified' if rng.random() < 0.9 else 'unqualified',
+            'version': rng.choice((0.6, 1.0, 5.0, 11.0, 13.0, 14.0, 15.0)),
+        }
+    return catalog
+
+def seed_catalog(db_path: Path, catalog: Dict[str, Dict[str, Any]]) -> float:
+    """
+    seed_dbの関数でカタログを作成し、所要時間（秒）を返す
+    """
+    start = time.perf_counter()
+    # 進捗表示は計測対象外のノイズになるので捨てる
+    with contextlib.redirect_stdout(io.StringIO()):
+        conn = seed_db.create_database(db_path)
+        seed_db.import_data(conn, catalog)
+        seed_db.create_indexes(conn)
+        seed_db.build_neighbors(conn)
+        seed_db.build_category_counts(conn)
+        seed_db.build_category_pages(conn)
+    conn.close()
+    return time.perf_counter() - start
+
+def seed_user_data(db_path: Path, n_emojis: int, n_history: int,
+                   n_favorites: int, seed: int = 0) -> None:
+    """
+    利用者データベースに履歴とお気に入りの合成データを一括挿入する
+    """
+    rng = random.Random(seed)
+    conn = sqlite3.connect(db_path)
+    conn.executescript(USER_SCHEMA)
+    base = datetime(2024, 1, 1)
+
+    def history_rows():
+        for i in range(n_history):
+            yield (rng.randint(1, n_emojis), (base + timedelta(seconds=i * 7)).strftime('%Y-%m-%d %H:%M:%S'))
+
+    conn.executemany('INSERT INTO history (emoji_id, used_at) VALUES (?, ?)', history_rows())
+    conn.executemany(
+        'INSERT INTO favorites (emoji_id, position) VALUES (?, ?)',
+        ((emoji_id, position) for position, emoji_id
+         in enumerate(rng.sample(range(1, n_emojis + 1), min(n_favorites, n_emojis))))
+    )
+    conn.commit()
+    conn.close()
+
+def seed_custom_emojis(emoji_data: EmojiData, n_custom: int, vocabulary: List[str], seed: int = 0) -> None:
+    """
+    合成したカスタム絵文字を登録する（画像は保存せず、ハッシュだけの行を作る）
+    """
+    rng = random.Random(seed)
+    batch_size = 5000
+    for start in range(0, n_custom, batch_size):
+        images = [StoredImage(f"custom{i}", f"{i:064x}", 'image/png')
+                  for i in range(start, min(start + batch_size, n_custom))]
+        emoji_data.add_custom_emojis(images, {image.name: rng.sample(vocabulary, 3) for image in images})
+
+def time_operation(func: Callable[[], Any], iterations: int, warmup: int = 3) -> Dict[str, float]:
+    """
+    操作を繰り返し実行してレイテンシを集計する
+    """
+    for _ in range(warmup):
+        func()
+    samples = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        func()
+        samples.append((time.perf_counter() - start) * 1000)
+    return summarize(samples)
+
+def benchmark_size(n_emojis: int, args: argparse.Namespace, work_dir: Path) -> List[Dict[str, Any]]:
+    """
+    1つのカタログサイズについて全操作を計測する
+    """
+    n_keywords = args.keywords or max(100, n_emojis // 2)
+    rng = random.Random(args.seed)
+    db_path = work_dir / f"bench_{n_emojis}.db"
+    user_db_path = work_dir / f"bench_{n_emojis}_user.db"
+
+    print(f"[{n_emojis}件] カタログを生成中 (キーワード {n_keywords} 語)...", file=sys.stderr)
+    catalog = generate_catalog(n_emojis, n_keywords, args.seed)
+    seed_seconds = seed_catalog(db_path, catalog)
+    vocabulary = sorted({k for data in catalog.values() for k in data['keywords']})
+    del catalog
+
+    print(f"[{n_emojis}件] 履歴 {args.history} 件を投入中...", file=sys.stderr)
+    seed_user_data(user_db_path, n_emojis, args.history, args.favorites, args.seed)
+
+    results = [{
+        'size': n_emojis,
+        'operation': 'seed',
+        **summarize([seed_seconds * 1000]),
+    }]
+
+    emoji_data = EmojiData(str(user_db_path), catalog_path=str(db_path),
+                           custom_dir=str(work_dir / f"bench_{n_emojis}_custom"))
+    it = args.iterations
+    if args.custom:
+        print(f"[{n_emojis}件] カスタム絵文字 {args.custom} 件を登録中...", file=sys.stderr)
+        seed_custom_emojis(emoji_data, args.custom, vocabulary, args.seed)
+
+    def search_substring():
+        word = rng.choice(vocabulary)
+        emoji_data.search_emojis(query=word[:2])
+
+    def search_paged():
+        emoji_data.search_emojis(offset=rng.randint(0, max(0, n_emojis - 100)))
+
+    operations = {
+        'search_emojis': search_substring,
+        'search_emojis_offset': search_paged,
+        'search_emojis_custom': lambda: emoji_data.search_emojis(query=rng.choice(vocabulary)[:2],
+                                                                 include_custom=True),
+        'search_faceted': lambda: emoji_data.search_faceted(rng.choice(vocabulary)[:2]),
+        'get_emoji_by_id': lambda: emoji_data.get_emoji_by_id(rng.randint(1, n_emojis)),
+        'get_favorites': lambda: emoji_data.get_favorites(),
+        'get_recent_emojis': lambda: emoji_data.get_recent_emojis(),
+        'get_next_emojis': lambda: emoji_data.get_next_emojis(rng.randint(1, n_emojis)),
+        'add_to_history': lambda: emoji_data.add_to_history(rng.randint(1, n_emojis)),
+    }
+
+    try:
+        for name, func in operations.items():
+            if args.only and name not in args.only:
+                continue
+            print(f"[{n_emojis}件] {name} を計測中...", file=sys.stderr)
+            results.append({'size': n_emojis, 'operation': name, **time_operation(func, it)})
+    finally:
+        emoji_data.close()
+
+    if not args.keep:
+        db_path.unlink()
+        user_db_path.unlink()
+    return results
+
+def git_revision() -> str:
+    """
+    現在のコミットハッシュを取得する（取得できなければ空文字）
+    """
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', 'HEAD'], cwd=ROOT_DIR,
+            capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ''
+
+def main():
+    parser = argparse.ArgumentParser(description='EmojiData / seed_db ベンチマーク')
+    parser.add_argument('--sizes', default='10000,100000',
+                        help='カンマ区切りのカタログサイズ (例: 10000,100000,1000000)')
+    parser.add_argument('--keywords', type=int, default=0,
+                        help='キーワード語彙数 (0ならサイズの半分)')
+    parser.add_argument('--history', type=int, default=1000000, help='履歴の行数')
+    parser.add_argument('--favorites', type=int, default=500, help='お気に入りの件数')
+    parser.add_argument('--custom', type=int, default=0,
+                        help='search_emojis_customの計測で登録するカスタム絵文字の件数')
+    parser.add_argument('--iterations', type=int, default=200, help='操作ごとの計測回数')
+    parser.add_argument('--only', nargs='*', help='計測する操作名を限定する')
+    parser.add_argument('--seed', type=int, default=0, help='乱数シード')
+    parser.add_argument('--output', '-o', help='結果JSONの出力先 (省略時は標準出力)')
+    parser.add_argument('--work-dir', help='DBを作成するディレクトリ (省略時は一時ディレクトリ)')
+    parser.add_argument('--keep', action='store_true', help='作成したDBを削除しない')
+    args = parser.parse_args()
+
+    # 履歴追加ごとのINFOログは計測の邪魔になる
+    logging.getLogger('emoji-data').setLevel(logging.WARNING)
+
+    sizes = [int(s) for s in args.sizes.split(',') if s.strip()]
+    results = []
+    with contextlib.ExitStack() as stack:
+        if args.work_dir:
+            work_dir = Path(args.work_dir)
+            work_dir.mkdir(parents=True, exist_ok=True)
+        else:
+            work_dir = Path(stack.enter_context(tempfile.TemporaryDirectory(prefix='emoji-bench-')))
+        for size in sizes:
+            results.extend(benchmark_size(size, args, work_dir))
+
+    report = {
+        'meta': {
+            'revision': git_revision(),
+            'timestamp': datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'sqlite': sqlite3.sqlite_version,
+            'platform': platform.platform(),
+            'args': vars(args),
+        },
+        'results': results,
+    }
+
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        Path(args.output).write_text(text + '\n', encoding='utf-8')
+        print(f"結果を {args.output} に保存しました", file=sys.stderr)
+    else:
+        print(text)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+"""
+ビルド成果物のキャッシュ。
+各ステージの入力（データファイル・ビルダーのソース・オプション）の内容ハッシュをマニフェストに記録し、
+入力も出力も前回から変わっていなければステージを省略する。
+
+使用例:
+    manifest = BuildManifest(Path('data/.build_manifest.json'))
+    key = manifest.stage_key([input_path, Path(__file__)], locale='ja')
+    if not manifest.is_fresh('seed', key, [output_path]):
+        build()
+        manifest.record('seed', key, [output_path])
+"""
+
+import hashlib
+import json
+import os
+from pathlib import Path
+from typing import Any, Dict, Iterable, Optional
+
+# マニフェストの形式やキーの計算方法を変えたら上げる。古いマニフェストはすべて無効になる
+MANIFEST_VERSION = 1
+
+# マニフェストの既定のファイル名（出力ディレクトリに置く）
+MANIFEST_NAME = '.build_manifest.json'
+
+def file_digest(path: Path, chunk_size: int = 1 << 20) -> Optional[str]:
+    """
+    ファイル内容のSHA-256を求める
+
+    Args:
+        path: ファイルのパス
+        chunk_size: 一度に読み込むバイト数
+
+    Returns:
+        16進数のハッシュ値。ファイルがなければNone
+    """
+    digest = hashlib.sha256()
+    try:
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(chunk_size), b''):
+                digest.update(chunk)
+    except FileNotFoundError:
+        return None
+    return digest.hexdigest()
+
+class BuildManifest:
+    """
+    ステージごとの入力キーと出力ハッシュを記録するマニフェスト
+    """
+
+    def __init__(self, path: Path):
+        """
+        Args:
+            path: マニフェストのJSONファイルのパス
+        """
+        self.path = Path(path)
+        self._stages: Dict[str, Dict[str, Any]] = {}
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            if data.get('version') == MANIFEST_VERSION:
+                self._stages = data.get('stages', {})
+        except (FileNotFoundError, ValueError):
+            pass
+
+    def stage_key(self, inputs: Iterable[Path], **params: Any) -> str:
+        """
+        ステージの入力からキーを計算する
+
+        Args:
+            inputs: 入力ファイル（データとビルダーのソース）のパス
+            params: 出力に影響するオプション
+
+        Returns:
+            入力の内容ハッシュとオプションをまとめたハッシュ値
+        """
+        digest = hashlib.sha256()
+        for path in inputs:
+            digest.update(Path(path).name.encode('utf-8'))
+            digest.update(b'\0')
+            digest.update((file_digest(path) or 'missing').encode('ascii'))
+            digest.update(b'\0')
+        digest.update(json.dumps(params, sort_keys=True, ensure_ascii=False).encode('utf-8'))
+        return digest.hexdigest()
+
+    def is_fresh(self, stage: str, key: str, outputs: Iterable[Path]) -> bool:
+        """
+        前回と同じ入力で作られた出力がそのまま残っているか
+
+        Args:
+            stage: ステージ名
+            key: stage_keyで計算したキー
+            outputs: ステージの出力ファイルのパス
+
+        Returns:
+            ステージを省略できる場合はTrue
+        """
+        entry = self._stages.get(stage)
+        if entry is None or entry.get('key') != key:
+            return False
+        recorded = entry.get('outputs', {})
+        outputs = [str(path) for path in outputs]
+        if sorted(outputs) != sorted(recorded):
+            return False
+        # 出力が手で書き換えられたり消されたりしていないかも確かめる
+        return all(file_digest(Path(path)) == recorded[path] for path in outputs)
+
+    def record(self, stage: str, key: str, outputs: Iterable[Path]) -> None:
+        """
+        ステージの完了を記録し、マニフェストを保存する
+
+        Args:
+            stage: ステージ名
+            key: stage_keyで計算したキー
+            outputs: ステージの出力ファイルのパス
+        """
+        self._stages[stage] = {
+            'key': key,
+            'outputs': {str(path): file_digest(Path(path)) for path in outputs},
+        }
+        self.save()
+
+    def invalidate(self, stage: str) -> None:
+        """
+        ステージの記録を消す（次回は必ず実行される）
+        """
+        if self._stages.pop(stage, None) is not None:
+            self.save()
+
+    def save(self) -> None:
+        """
+        マニフェストを書き出す。途中で中断しても壊れないよう一時ファイルから置き換える
+        """
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_name(self.path.name + '.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'version': MANIFEST_VERSION, 'stages': self._stages}, f,
+                      ensure_ascii=False, indent=2, sort_keys=True)
+        os.replace(tmp_path, self.path)
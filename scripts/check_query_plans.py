@@ -0,0 +1,265 @@
+"""
+EmojiDataが発行するSQLのクエリプランの回帰チェック。
+代表的な操作を一通り実行してクエリフックで文を収集し（StatementRegistry）、
+各文のEXPLAIN QUERY PLANについて次を確かめる。
+
+- 大きなテーブル（LARGE_TABLES）をインデックスなしで全件走査していないこと
+  （意図的な全件走査はALLOWED_SCANSに理由とともに登録する）
+- プランがスナップショット（scripts/query_plans.txt）と一致すること
+
+インデックスやSQLを変えてプランが変わった場合は、差分を確認してから --update でスナップショットを更新する。
+プランはSQLiteのバージョンでも変わりうるので、スナップショットの先頭に作成時のバージョンを記録する。
+
+使用例:
+    python scripts/check_query_plans.py            # チェック（失敗すると終了コード1）
+    python scripts/check_query_plans.py --update   # スナップショットを更新
+"""
+
+import argparse
+import difflib
+import logging
+import re
+import sqlite3
+import sys
+import tempfile
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Tuple
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT_DIR / 'src' / 'python'))
+
+from custom_emoji import StoredImage  # noqa: E402
+from emoji_data import EmojiData, QueryEvent  # noqa: E402
+
+DEFAULT_CATALOG = ROOT_DIR / 'data' / 'emojis.db'
+DEFAULT_SNAPSHOT = Path(__file__).resolve().parent / 'query_plans.txt'
+
+# 行数が絵文字数・履歴件数に比例して増えるテーブル
+LARGE_TABLES = {
+    'emojis', 'keywords', 'emoji_keywords', 'emoji_neighbors',
+    'history', 'emoji_transitions',
+    'custom_emojis', 'custom_keywords', 'custom_keyword_suffixes',
+}
+
+# 意図的な全件走査: (ケース名, テーブル名) → 理由
+ALLOWED_SCANS = {
+    ('search_emojis: 条件なし', 'emojis'): '一覧表示は全件が対象',
+    ('search_emojis: あいまい検索', 'emojis'): '部分一致とあいまい一致のOR結合',
+    ('search_emojis: カスタム絵文字・あいまい検索', 'emojis'): '部分一致とあいまい一致のOR結合',
+    ('search_emojis: カスタムグループ', 'custom_emojis'): 'カスタム絵文字の一覧表示は全件が対象',
+    ('query_emojis: OR', 'emojis'): '別の列どうしのORはインデックスを1つに絞れない',
+    ('get_unicode_map', 'emojis'): 'カタログ全体の対応表を作る',
+    ('get_keyword_entries', 'emoji_keywords'): 'カタログ全体の対応表を作る',
+    ('get_usage_counts', 'history'): '全履歴を集計する',
+    ('get_next_emojis: 直前の履歴から', 'history'): 'ORDER BY id DESC LIMIT 1 は末尾の1行だけ読む',
+}
+
+# プランの「SCAN 名前」。USING INDEX / COVERING INDEX を伴わないものが全件走査
+_SCAN = re.compile(r'^SCAN (?P<name>\S+)(?P<rest>.*)$')
+# FROM / JOIN の後のテーブル名と別名
+_TABLE_REF = re.compile(
+    r'\b(?:FROM|JOIN)\s+(?:(?:main|catalog|temp)\.)?(?P<table>\w+)(?:\s+(?:AS\s+)?(?P<alias>\w+))?',
+    re.IGNORECASE,
+)
+_SQL_KEYWORDS = {'where', 'join', 'left', 'inner', 'cross', 'on', 'group', 'order', 'limit',
+                 'union', 'using', 'natural', 'as', 'select', 'window'}
+
+def normalize_sql(sql: str) -> str:
+    """
+    空白をまとめて1行にする（スナップショットと登録のキー）
+    """
+    return ' '.join(sql.split())
+
+class StatementRegistry:
+    """
+    クエリフックとしてEmojiDataが実行した文を集める。
+    同じ文は最初に実行したケースとパラメータで代表させる
+    """
+
+    def __init__(self):
+        self.case = ''
+        self.statements: Dict[Tuple[str, str], Tuple[str, Tuple[object, ...]]] = {}
+
+    def __call__(self, event: QueryEvent) -> None:
+        self.statements.setdefault((event.method, normalize_sql(event.sql)), (self.case, event.params))
+
+    def __len__(self) -> int:
+        return len(self.statements)
+
+def table_aliases(sql: str) -> Dict[str, str]:
+    """
+    SQL中の別名（とテーブル名自身）から実テーブル名への辞書を作る
+    """
+    aliases = {}
+    for match in _TABLE_REF.finditer(sql):
+        table = match.group('table').lower()
+        aliases[table] = table
+        alias = match.group('alias')
+        if alias and alias.lower() not in _SQL_KEYWORDS:
+            aliases[alias.lower()] = table
+    return aliases
+
+def full_scans(sql: str, plan: List[str]) -> List[str]:
+    """
+    プランから大きなテーブルの全件走査を探す
+
+    Returns:
+        全件走査しているテーブル名のリスト
+    """
+    aliases = table_aliases(sql)
+    tables = []
+    for detail in plan:
+        match = _SCAN.match(detail)
+        if match is None or 'INDEX' in match.group('rest'):
+            continue
+        table = aliases.get(match.group('name').lower(), match.group('name').lower())
+        if table in LARGE_TABLES:
+            tables.append(table)
+    return tables
+
+def emoji_id(emoji_data: EmojiData, text: str) -> int:
+    """
+    テスト用の絵文字IDを引く
+    """
+    return emoji_data.lookup_by_unicode(text)['id']
+
+# アプリとCLIが使う操作: (ケース名, 操作)。ケース名はスナップショットの見出しと許可リストのキーになる
+CASES: List[Tuple[str, Callable[[EmojiData], Any]]] = [
+    ('lookup_by_unicode', lambda d: d.lookup_by_unicode('👍🏽')),
+    ('lookup_many_by_unicode', lambda d: d.lookup_many_by_unicode(['😀', '👍🏽'])),
+    ('add_to_history', lambda d: (d.add_to_history(emoji_id(d, '😀')), d.add_to_history(emoji_id(d, '🐱')))),
+    ('add_many_to_history', lambda d: d.add_many_to_history([(emoji_id(d, '😀'), None),
+                                                             (emoji_id(d, '🐱'), '2025-01-01 00:00:00')])),
+    ('add_to_favorites', lambda d: d.add_to_favorites(emoji_id(d, '😀'))),
+    ('add_favorites', lambda d: d.add_favorites([emoji_id(d, '🐱')])),
+    ('reorder_favorites', lambda d: d.reorder_favorites([emoji_id(d, '🐱'), emoji_id(d, '😀')])),
+    ('remove_favorites', lambda d: d.remove_favorites([emoji_id(d, '😀')])),
+    ('get_emoji_by_id', lambda d: d.get_emoji_by_id(1)),
+    ('search_emojis: 条件なし', lambda d: d.search_emojis()),
+    ('search_emojis: キーワード', lambda d: d.search_emojis(query='ねこ')),
+    ('search_emojis: 対応バージョン', lambda d: d.search_emojis(query='ねこ', max_version=13.0,
+                                                              qualified_only=True)),
+    ('search_emojis: グループ', lambda d: d.search_emojis(group='動物と自然')),
+    ('search_emojis: あいまい検索', lambda d: d.search_emojis(query='ねこ', fuzzy=True)),
+    ('query_emojis: AND/NOT', lambda d: d.query_emojis('猫 -顔 is:fav')),
+    ('query_emojis: OR', lambda d: d.query_emojis('group:動物と自然 OR version:1.0')),
+    ('query_emojis: サブグループ', lambda d: d.query_emojis('subgroup:動物-哺乳類')),
+    ('search_faceted', lambda d: d.search_faceted('ねこ')),
+    ('search_faceted: グループ', lambda d: d.search_faceted('ねこ', group='動物と自然')),
+    ('get_category_tree', lambda d: d.get_category_tree()),
+    ('get_category_page', lambda d: d.get_category_page('動物と自然', page=1)),
+    ('get_related', lambda d: d.get_related(1)),
+    ('get_unicode_map', lambda d: d.get_unicode_map()),
+    ('get_keyword_entries', lambda d: d.get_keyword_entries()),
+    ('get_usage_counts', lambda d: d.get_usage_counts()),
+    ('get_emoji_categories', lambda d: d.get_emoji_categories()),
+    ('get_emoji_categories: 対応バージョン', lambda d: d.get_emoji_categories(max_version=13.0,
+                                                                          qualified_only=True)),
+    ('get_favorites', lambda d: d.get_favorites()),
+    ('get_recent_emojis', lambda d: d.get_recent_emojis()),
+    ('get_next_emojis: 直前の履歴から', lambda d: d.get_next_emojis()),
+    ('get_next_emojis', lambda d: d.get_next_emojis(1)),
+    ('get_top_emojis: 今日', lambda d: d.get_top_emojis('day')),
+    ('get_top_emojis: 今週', lambda d: d.get_top_emojis('week')),
+    ('get_trending', lambda d: d.get_trending()),
+    ('get_change_versions', lambda d: d.get_change_versions()),
+    ('add_custom_emojis', lambda d: d.add_custom_emojis([StoredImage('party_parrot', '0' * 64, 'image/png'),
+                                                         StoredImage('neko', '1' * 64, 'image/png')])),
+    ('search_emojis: カスタム絵文字', lambda d: d.search_emojis(query='ねこ', include_custom=True)),
+    ('search_emojis: カスタム絵文字・あいまい検索', lambda d: d.search_emojis(query='ねこ', fuzzy=True,
+                                                                          include_custom=True)),
+    ('search_emojis: カスタムグループ', lambda d: d.search_emojis(group='カスタム', include_custom=True)),
+    ('get_custom_emoji', lambda d: d.get_custom_emoji('party_parrot')),
+    ('remove_custom_emojis', lambda d: d.remove_custom_emojis(['neko'])),
+]
+
+def collect_plans(catalog_path: Path) -> List[Tuple[str, str, str, List[str]]]:
+    """
+    一時的な利用者データベースで各ケースを実行し、文ごとのプランを取得する
+
+    Returns:
+        (ケース名, メソッド名, SQL, プラン) のリスト（実行順）
+    """
+    registry = StatementRegistry()
+    with tempfile.TemporaryDirectory(prefix='emoji-plans-') as work_dir:
+        emoji_data = EmojiData(str(Path(work_dir) / 'user.db'), catalog_path=str(catalog_path))
+        try:
+            # 準備のための逆引きは記録しない
+            emoji_id(emoji_data, '😀')
+            emoji_data.add_query_hook(registry)
+            for case, operation in CASES:
+                registry.case = case
+                operation(emoji_data)
+            emoji_data.remove_query_hook(registry)
+
+            conn = emoji_data.connect()
+            results = []
+            for (method, sql), (case, params) in registry.statements.items():
+                rows = conn.execute(f"EXPLAIN QUERY PLAN {sql}", params).fetchall()
+                results.append((case, method, sql, [row[-1] for row in rows]))
+            return results
+        finally:
+            emoji_data.close()
+
+def format_snapshot(results: List[Tuple[str, str, str, List[str]]]) -> str:
+    """
+    レビューしやすいテキスト形式にする
+    """
+    lines = [f"# EXPLAIN QUERY PLAN スナップショット (SQLite {sqlite3.sqlite_version})",
+             '# scripts/check_query_plans.py --update で更新する', '']
+    for case, method, sql, plan in results:
+        lines.append(f"## {case} ({method})" if case != method else f"## {case}")
+        lines.append(sql)
+        lines.extend(f"  {detail}" for detail in plan)
+        lines.append('')
+    return '\n'.join(lines)
+
+def snapshot_body(text: str) -> List[str]:
+    """
+    比較に使う行を返す。SQLiteのバージョンなどを書いた先頭のコメント行は除く
+    """
+    lines = text.splitlines(keepends=True)
+    while lines and lines[0].startswith('# '):
+        lines.pop(0)
+    return lines
+
+def main():
+    parser = argparse.ArgumentParser(description='EmojiDataのクエリプラン回帰チェック')
+    parser.add_argument('--catalog', default=str(DEFAULT_CATALOG), help='カタログデータベースのパス')
+    parser.add_argument('--snapshot', default=str(DEFAULT_SNAPSHOT), help='スナップショットファイルのパス')
+    parser.add_argument('--update', action='store_true', help='スナップショットを書き換える')
+    args = parser.parse_args()
+
+    logging.getLogger('emoji-data').setLevel(logging.WARNING)
+
+    results = collect_plans(Path(args.catalog))
+    print(f"{len(results)}個の文のプランを取得しました", file=sys.stderr)
+
+    failed = False
+    for case, method, sql, plan in results:
+        for table in full_scans(sql, plan):
+            if (case, table) in ALLOWED_SCANS:
+                continue
+            failed = True
+            print(f"全件走査 ({case}): {table}\n  {sql}\n  " + '\n  '.join(plan), file=sys.stderr)
+
+    snapshot_path = Path(args.snapshot)
+    text = format_snapshot(results)
+    if args.update:
+        snapshot_path.write_text(text, encoding='utf-8')
+        print(f"スナップショットを更新しました: {snapshot_path}", file=sys.stderr)
+    else:
+        expected = snapshot_path.read_text(encoding='utf-8') if snapshot_path.exists() else ''
+        if snapshot_body(expected) != snapshot_body(text):
+            failed = True
+            sys.stderr.writelines(difflib.unified_diff(
+                snapshot_body(expected), snapshot_body(text),
+                fromfile=str(snapshot_path), tofile='現在のプラン'
+            ))
+            print("\nプランがスナップショットと異なります。意図した変更なら --update で更新してください",
+                  file=sys.stderr)
+
+    sys.exit(1 if failed else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,265 @@
+"""
+EmojiDataの同時アクセス負荷試験。
+複数のスレッドまたはプロセスが同じ利用者データベースに対して、インクリメンタル検索の入力
+（キーワードの先頭から1文字ずつ伸ばした検索）と、思考時間、コピー（履歴への追加）、
+お気に入りの追加・削除を繰り返し、スループット・レイテンシ（p50/p99）・
+ロック待ち（SQLITE_BUSYの再試行回数と待ち時間）を集計してJSONで出力する。
+
+入力はkeywordsテーブルから合成するほか、記録したセッションをJSON Linesで与えられる
+（1行1セッション: {"keys": ["ね", "ねこ"], "think_ms": [120, 300], "copy": "🐱"}。
+think_msとcopyは省略可）。
+
+使用例:
+    python scripts/load_test.py --workers 16 --duration 30 --output load.json
+    python scripts/load_test.py --mode thread --workers 4 --sessions sessions.jsonl
+"""
+
+import argparse
+import json
+import logging
+import multiprocessing
+import platform
+import random
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT_DIR / 'scripts'))
+sys.path.insert(0, str(ROOT_DIR / 'src' / 'python'))
+
+from benchmark import git_revision, summarize  # noqa: E402
+from emoji_data import EmojiData  # noqa: E402
+
+DEFAULT_CATALOG = ROOT_DIR / 'data' / 'emojis.db'
+
+def load_sessions(path: Path) -> List[Dict[str, Any]]:
+    """
+    記録したセッションを読み込む
+    """
+    sessions = []
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                session = json.loads(line)
+                if session.get('keys'):
+                    sessions.append(session)
+    return sessions
+
+def load_keywords(catalog_path: Path) -> List[str]:
+    """
+    合成セッションの元にする正規化済みキーワードを読み込む
+    """
+    conn = sqlite3.connect(f"file:{catalog_path}?mode=ro", uri=True)
+    try:
+        return [row[0] for row in conn.execute("SELECT keyword_norm FROM keywords WHERE keyword_norm != ''")]
+    finally:
+        conn.close()
+
+def synthetic_session(keywords: List[str], rng: random.Random) -> Dict[str, Any]:
+    """
+    キーワードを1文字ずつ入力するセッションを作る（全部打ち切らずに見つかることも多い）
+    """
+    keyword = rng.choice(keywords)
+    typed = rng.randint(1, len(keyword))
+    return {'keys': [keyword[:n] for n in range(1, typed + 1)]}
+
+def think(mean_ms: float, rng: random.Random, deadline: float) -> None:
+    """
+    指数分布の思考時間だけ待つ（終了時刻は越えない）
+    """
+    if mean_ms > 0:
+        time.sleep(max(0.0, min(rng.expovariate(1000 / mean_ms), deadline - time.perf_counter())))
+
+def run_worker(worker_id: int, args: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    1人の利用者としてセッションを繰り返す
+
+    Args:
+        worker_id: ワーカー番号（乱数シードに使う）
+        args: コマンドライン引数の辞書
+
+    Returns:
+        操作ごとのレイテンシ（ミリ秒）、エラー数、EmojiDataのロック待ち統計
+    """
+    logging.getLogger('emoji-data').setLevel(logging.WARNING)
+    rng = random.Random(args['seed'] * 100003 + worker_id)
+    sessions = load_sessions(Path(args['sessions'])) if args['sessions'] else None
+    keywords = None if sessions else load_keywords(Path(args['catalog']))
+    emoji_data = EmojiData(args['db'], catalog_path=args['catalog'], busy_timeout=args['busy_timeout'])
+
+    samples: Dict[str, List[float]] = {}
+    errors: Dict[str, int] = {}
+    completed = 0
+
+    def timed(name: str, func, *func_args):
+        start = time.perf_counter()
+        result = func(*func_args)
+        samples.setdefault(name, []).append((time.perf_counter() - start) * 1000)
+        if result is False:
+            errors[name] = errors.get(name, 0) + 1
+        return result
+
+    deadline = time.perf_counter() + args['duration']
+    try:
+        while time.perf_counter() < deadline:
+            session = rng.choice(sessions) if sessions else synthetic_session(keywords, rng)
+            think_times = session.get('think_ms') or []
+            results = []
+            for i, prefix in enumerate(session['keys']):
+                results = timed('search', emoji_data.search_emojis, prefix, None, args['limit'])
+                think(think_times[i] if i < len(think_times) else args['think_ms'], rng, deadline)
+                if time.perf_counter() >= deadline:
+                    break
+            else:
+                copied = None
+                if session.get('copy'):
+                    copied = emoji_data.lookup_by_unicode(session['copy'])
+                elif results and rng.random() < args['copy_rate']:
+                    copied = rng.choice(results[:5])
+                if copied:
+                    timed('add_to_history', emoji_data.add_to_history, copied['id'])
+                    if rng.random() < args['favorite_rate']:
+                        if copied['is_favorite']:
+                            timed('remove_from_favorites', emoji_data.remove_from_favorites, copied['id'])
+                        else:
+                            timed('add_to_favorites', emoji_data.add_to_favorites, copied['id'])
+                if rng.random() < args['recent_rate']:
+                    timed('get_recent_emojis', emoji_data.get_recent_emojis)
+                completed += 1
+                think(args['session_pause_ms'], rng, deadline)
+        stats = emoji_data.stats()
+    finally:
+        emoji_data.close()
+
+    return {
+        'samples': samples,
+        'errors': errors,
+        'sessions': completed,
+        'busy': {method: (s['busy_retries'], s['lock_wait_ms']) for method, s in stats.items()
+                 if s['busy_retries']},
+    }
+
+def run_load(args: argparse.Namespace) -> List[Dict[str, Any]]:
+    """
+    ワーカーを並行して走らせ、結果を集める
+    """
+    worker_args = vars(args)
+    if args.mode == 'process':
+        with multiprocessing.Pool(args.workers) as pool:
+            return pool.starmap(run_worker, [(i, worker_args) for i in range(args.workers)])
+
+    results: List[Optional[Dict[str, Any]]] = [None] * args.workers
+
+    def target(i: int) -> None:
+        results[i] = run_worker(i, worker_args)
+
+    threads = [threading.Thread(target=target, args=(i,)) for i in range(args.workers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return [result for result in results if result is not None]
+
+def aggregate(results: List[Dict[str, Any]], elapsed: float) -> Dict[str, Any]:
+    """
+    ワーカーごとの結果を操作ごとに合算する
+    """
+    samples: Dict[str, List[float]] = {}
+    errors: Dict[str, int] = {}
+    busy: Dict[str, List[float]] = {}
+    for result in results:
+        for name, values in result['samples'].items():
+            samples.setdefault(name, []).extend(values)
+        for name, n in result['errors'].items():
+            errors[name] = errors.get(name, 0) + n
+        for method, (retries, wait_ms) in result['busy'].items():
+            total = busy.setdefault(method, [0, 0.0])
+            total[0] += retries
+            total[1] += wait_ms
+
+    operations = {
+        name: {
+            'throughput_per_s': round(len(values) / elapsed, 2),
+            'errors': errors.get(name, 0),
+            **summarize(values),
+        }
+        for name, values in sorted(samples.items())
+    }
+    total_ops = sum(len(values) for values in samples.values())
+    return {
+        'elapsed_s': round(elapsed, 3),
+        'sessions': sum(result['sessions'] for result in results),
+        'operations_total': total_ops,
+        'throughput_per_s': round(total_ops / elapsed, 2),
+        'errors': sum(errors.values()),
+        'busy_retries': sum(retries for retries, _ in busy.values()),
+        'lock_wait_ms': round(sum(wait_ms for _, wait_ms in busy.values()), 3),
+        'lock_wait_by_method': {method: {'busy_retries': retries, 'lock_wait_ms': round(wait_ms, 3)}
+                                for method, (retries, wait_ms) in sorted(busy.items())},
+        'operations': operations,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description='EmojiData 同時アクセス負荷試験')
+    parser.add_argument('--workers', type=int, default=8, help='同時に操作する利用者数')
+    parser.add_argument('--mode', choices=('process', 'thread'), default='process',
+                        help='利用者ごとにプロセスを分けるか、スレッドにするか')
+    parser.add_argument('--duration', type=float, default=30.0, help='実行時間（秒）')
+    parser.add_argument('--catalog', default=str(DEFAULT_CATALOG), help='カタログデータベースのパス')
+    parser.add_argument('--db', help='利用者データベースのパス (省略時は一時ファイル)')
+    parser.add_argument('--sessions', help='記録したセッションのJSON Linesファイル (省略時は合成)')
+    parser.add_argument('--think-ms', type=float, default=150.0, help='キー入力の間隔の平均（ミリ秒）')
+    parser.add_argument('--session-pause-ms', type=float, default=1000.0,
+                        help='セッションの間隔の平均（ミリ秒）')
+    parser.add_argument('--copy-rate', type=float, default=0.7, help='セッションの最後にコピーする確率')
+    parser.add_argument('--favorite-rate', type=float, default=0.05,
+                        help='コピーした絵文字のお気に入りを切り替える確率')
+    parser.add_argument('--recent-rate', type=float, default=0.2, help='最近使った絵文字を表示する確率')
+    parser.add_argument('--limit', type=int, default=100, help='検索1回の最大件数')
+    parser.add_argument('--busy-timeout', type=float, default=5.0, help='ロック待ちの上限（秒）')
+    parser.add_argument('--seed', type=int, default=0, help='乱数シード')
+    parser.add_argument('--output', '-o', help='結果JSONの出力先 (省略時は標準出力)')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix='emoji-load-') as work_dir:
+        if not args.db:
+            args.db = str(Path(work_dir) / 'user.db')
+        # スキーマの作成はワーカーの開始前に済ませておく
+        logging.getLogger('emoji-data').setLevel(logging.WARNING)
+        setup = EmojiData(args.db, catalog_path=args.catalog)
+        setup.connect()
+        setup.close()
+
+        print(f"{args.workers}ワーカー ({args.mode}) で{args.duration}秒間実行中...", file=sys.stderr)
+        start = time.perf_counter()
+        results = run_load(args)
+        summary = aggregate(results, time.perf_counter() - start)
+
+    report = {
+        'meta': {
+            'revision': git_revision(),
+            'timestamp': datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'sqlite': sqlite3.sqlite_version,
+            'platform': platform.platform(),
+            'args': vars(args),
+        },
+        'summary': summary,
+    }
+
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        Path(args.output).write_text(text + '\n', encoding='utf-8')
+        print(f"結果を {args.output} に保存しました", file=sys.stderr)
+    else:
+        print(text)
+
+if __name__ == "__main__":
+    main()
@@ -1,13 +1,32 @@
+import argparse
+import heapq
 import json
+import math
 import os
 import sqlite3
+import sys
 import time
 from pathlib import Path
 
-def create_database():
+# 検索語と同じ正規化をキーワードにも適用するため、アプリ側のモジュールを使う
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'src' / 'python'))
+from text_normalize import emoji_key, normalize_query, normalize_text  # noqa: E402
+from category_pages import CATEGORY_PAGE_SIZE, encode_page  # noqa: E402
+from build_cache import MANIFEST_NAME, BuildManifest  # noqa: E402
+from profiling import Profiler  # noqa: E402
+
+# 既定の入出力パス（リポジトリのルートから実行する前提）
+DB_PATH = Path('data/emojis.db')
+EMOJI_DATA_PATH = Path('emoji-ja-20250319/data/emoji_ja.json')
+
+# 関連絵文字として保存する件数
+NEIGHBOR_COUNT = 10
+# これより多くの絵文字に付いているキーワードは関連度の計算に使わない（ほぼ情報がなく、計算量だけ増える）
+NEIGHBOR_MAX_DF = 1000
+
+def create_database(db_path=DB_PATH):
     """データベースとテーブルを作成する"""
-    # データベースファイルへのパスを取得
-    db_path = Path('data/emojis.db')
+    db_path = Path(db_path)
     
     # データベースディレクトリが存在しない場合は作成
     db_path.parent.mkdir(exist_ok=True)
@@ -21,14 +40,42 @@ def create_database():
     cursor = conn.cursor()
     
     # テーブル作成
+    # グループ・サブグループは名前を1行ずつ持つ小さな表にし、絵文字からは整数のIDで参照する。
+    # sort_orderはカタログ（emoji_ja.json）で最初に現れた順。グループのない記号類は名前が空文字列の行
+    cursor.execute('''
+    CREATE TABLE groups (
+      id INTEGER PRIMARY KEY,
+      name TEXT NOT NULL UNIQUE,
+      sort_order INTEGER NOT NULL
+    )
+    ''')
+    
+    # emoji_countはサブグループの絵文字数（空の検索でのカテゴリの木）
+    cursor.execute('''
+    CREATE TABLE subgroups (
+      id INTEGER PRIMARY KEY,
+      group_id INTEGER NOT NULL,
+      name TEXT NOT NULL,
+      sort_order INTEGER NOT NULL,
+      emoji_count INTEGER NOT NULL DEFAULT 0,
+      UNIQUE (group_id, name),
+      FOREIGN KEY (group_id) REFERENCES groups (id)
+    )
+    ''')
+    
     cursor.execute('''
     CREATE TABLE emojis (
       id INTEGER PRIMARY KEY AUTOINCREMENT,
       unicode TEXT NOT NULL,
+      unicode_key TEXT NOT NULL,
       short_name TEXT NOT NULL,
-      group_name TEXT,
-      subgroup TEXT,
-      created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+      group_id INTEGER NOT NULL,
+      subgroup_id INTEGER NOT NULL,
+      status TEXT,
+      emoji_version REAL,
+      created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+      FOREIGN KEY (group_id) REFERENCES groups (id),
+      FOREIGN KEY (subgroup_id) REFERENCES subgroups (id)
     )
     ''')
     
@@ -36,10 +83,21 @@ def create_database():
     CREATE TABLE keywords (
       id INTEGER PRIMARY KEY AUTOINCREMENT,
       keyword TEXT NOT NULL UNIQUE,
+      keyword_norm TEXT NOT NULL,
       created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
     )
     ''')
     
+    # 正規化したキーワード（とローマ字をかなにした形）の全接尾辞。部分一致検索を接頭辞の範囲検索として索引で引く
+    cursor.execute('''
+    CREATE TABLE keyword_suffixes (
+      suffix TEXT NOT NULL,
+      keyword_id INTEGER NOT NULL,
+      PRIMARY KEY (suffix, keyword_id),
+      FOREIGN KEY (keyword_id) REFERENCES keywords (id) ON DELETE CASCADE
+    ) WITHOUT ROWID
+    ''')
+    
     cursor.execute('''
     CREATE TABLE emoji_keywords (
       emoji_id INTEGER NOT NULL,
@@ -50,50 +108,134 @@ def create_database():
     )
     ''')
     
+    # キーワードの共起から求めた関連絵文字（上位NEIGHBOR_COUNT件）
     cursor.execute('''
-    CREATE TABLE favorites (
-      id INTEGER PRIMARY KEY AUTOINCREMENT,
+    CREATE TABLE emoji_neighbors (
       emoji_id INTEGER NOT NULL,
-      created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-      FOREIGN KEY (emoji_id) REFERENCES emojis (id) ON DELETE CASCADE
-    )
+      rank INTEGER NOT NULL,
+      neighbor_id INTEGER NOT NULL,
+      score REAL NOT NULL,
+      PRIMARY KEY (emoji_id, rank)
+    ) WITHOUT ROWID
     ''')
     
+    # カテゴリの一覧ページを事前にエンコードしたJSON（category_pages.pyの形式）。
+    # グループ全体のページはsubgroup_idが0。payloadが大きいのでWITHOUT ROWIDにはしない
     cursor.execute('''
-    CREATE TABLE history (
-      id INTEGER PRIMARY KEY AUTOINCREMENT,
-      emoji_id INTEGER NOT NULL,
-      used_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-      FOREIGN KEY (emoji_id) REFERENCES emojis (id) ON DELETE CASCADE
+    CREATE TABLE category_pages (
+      group_id INTEGER NOT NULL,
+      subgroup_id INTEGER NOT NULL,
+      page INTEGER NOT NULL,
+      payload BLOB NOT NULL,
+      min_id INTEGER NOT NULL,
+      id_bits BLOB NOT NULL,
+      flag_ids BLOB NOT NULL,
+      flag_offsets BLOB NOT NULL,
+      PRIMARY KEY (group_id, subgroup_id, page)
     )
     ''')
     
-    # インデックス作成
+    conn.commit()
+    return conn
+
+def create_indexes(conn):
+    """
+    検索用のインデックスを作成する。
+    データを入れる前に作ると挿入のたびに更新されるので、import_dataの後で一度に作る
+    """
+    cursor = conn.cursor()
     cursor.execute('CREATE INDEX idx_emojis_unicode ON emojis(unicode)')
+    # 異体字セレクタと肌の色を除いた照合用のキー。貼り付けられた絵文字の逆引きに使う
+    cursor.execute('CREATE INDEX idx_emojis_unicode_key ON emojis(unicode_key)')
     cursor.execute('CREATE INDEX idx_emojis_short_name ON emojis(short_name)')
-    cursor.execute('CREATE INDEX idx_emojis_group ON emojis(group_name)')
-    cursor.execute('CREATE INDEX idx_emojis_subgroup ON emojis(subgroup)')
+    # グループ・サブグループでの絞り込みとカテゴリごとの一覧を、テーブルを読まずに索引だけで引く
+    cursor.execute('CREATE INDEX idx_emojis_category ON emojis(group_id, subgroup_id, id)')
+    # カテゴリ一覧を表示可否の条件で絞り込むときにテーブルを読まずに済むよう、グループの列も含める
+    cursor.execute('CREATE INDEX idx_emojis_support ON emojis(status, emoji_version, group_id)')
     cursor.execute('CREATE INDEX idx_keywords_keyword ON keywords(keyword)')
-    cursor.execute('CREATE INDEX idx_history_used_at ON history(used_at)')
-    
+    cursor.execute('CREATE INDEX idx_keywords_keyword_norm ON keywords(keyword_norm)')
+    cursor.execute('CREATE INDEX idx_emoji_keywords_keyword ON emoji_keywords(keyword_id)')
     conn.commit()
-    return conn
 
-def import_data(conn):
-    """emoji_ja.jsonからデータをインポート"""
-    cursor = conn.cursor()
-    
-    # emoji_ja.jsonファイルを開く
-    emoji_data_path = Path('emoji-ja-20250319/data/emoji_ja.json')
+def load_emoji_data(emoji_data_path=EMOJI_DATA_PATH):
+    """emoji_ja.jsonを読み込む。見つからない場合はNoneを返す"""
+    emoji_data_path = Path(emoji_data_path)
     if not emoji_data_path.exists():
         print(f"エラー: {emoji_data_path} が見つかりません")
-        return
+        return None
     
     with open(emoji_data_path, 'r', encoding='utf-8') as f:
-        emoji_data = json.load(f)
+        return json.load(f)
+
+def load_emoji_support():
+    """
+    emoji_ja.jsonに状態とバージョンがない場合の代替として、emojiパッケージの
+    unicode → (状態, 絵文字バージョン) の対応表を作る。パッケージがなければ空の辞書を返す
+    
+    カタログのキーはU+FE0Fを省いた表記なので、完全修飾形（FE0F付き）がある絵文字は
+    FE0Fを省いた表記にもその状態を対応付ける。
+    """
+    try:
+        import emoji
+    except ImportError:
+        print("警告: emojiパッケージがインストールされていないため、状態とバージョンを記録できない絵文字があります")
+        return {}
+    
+    statuses = {value: name.replace('_', '-') for name, value in emoji.STATUS.items()}
+    support = {
+        unicode: (statuses.get(data.get('status')), float(data['E']) if 'E' in data else None)
+        for unicode, data in emoji.EMOJI_DATA.items()
+    }
+    for unicode, (status, emoji_version) in list(support.items()):
+        if status == 'fully-qualified' and '\ufe0f' in unicode:
+            support[unicode.replace('\ufe0f', '')] = (status, emoji_version)
+    return support
+
+def emoji_package_version():
+    """
+    load_emoji_supportが代替に使うemojiパッケージのバージョン。パッケージがなければNone
+    """
+    try:
+        import emoji
+    except ImportError:
+        return None
+    return getattr(emoji, '__version__', 'unknown')
+
+def emoji_support(unicode, data, fallback):
+    """
+    絵文字の状態（emoji-test.txtのfully-qualifiedなど）と絵文字バージョンを決める
+    
+    グループのない記号類は絵文字フォントがなくても表示できるのでバージョン0とする。
+    どちらの情報源にもない絵文字は不明（NULL）のままにし、バージョンでの絞り込みでは除外される。
+    """
+    if 'status' in data:
+        status, emoji_version = data['status'], data.get('version')
+    else:
+        status, emoji_version = fallback.get(unicode, (None, None))
+    if status is None and not data.get('group'):
+        emoji_version = 0.0
+    return status, emoji_version
+
+def import_data(conn, emoji_data=None):
+    """emoji_ja.jsonからデータをインポート
+    
+    emoji_dataを渡した場合はファイルを読まずにその辞書（emoji_ja.jsonと同じ形式）を使う。
+    """
+    cursor = conn.cursor()
+    
+    if emoji_data is None:
+        emoji_data = load_emoji_data()
+        if emoji_data is None:
+            return
     
     # キーワード辞書を初期化（重複を避けるため）
     keyword_dict = {}
+    # グループ名 → ID、(グループID, サブグループ名) → ID
+    group_ids = {}
+    subgroup_ids = {}
+    
+    # parse_unicode_files.pyが状態とバージョンを出力していない古いデータ向けの代替
+    fallback = {} if all('status' in data for data in emoji_data.values()) else load_emoji_support()
     
     # 各絵文字をデータベースに挿入
     print("絵文字データをインポート中...")
@@ -108,11 +250,24 @@ def import_data(conn):
         short_name = data.get('short_name', '')
         group_name = data.get('group', '')
         subgroup = data.get('subgroup', '')
+        status, emoji_version = emoji_support(unicode, data, fallback)
+        
+        # 初めて現れたグループ・サブグループはその順で登録する
+        group_id = group_ids.get(group_name)
+        if group_id is None:
+            cursor.execute('INSERT INTO groups (name, sort_order) VALUES (?, ?)', (group_name, len(group_ids)))
+            group_id = group_ids[group_name] = cursor.lastrowid
+        subgroup_id = subgroup_ids.get((group_id, subgroup))
+        if subgroup_id is None:
+            cursor.execute('INSERT INTO subgroups (group_id, name, sort_order) VALUES (?, ?, ?)',
+                           (group_id, subgroup, len(subgroup_ids)))
+            subgroup_id = subgroup_ids[group_id, subgroup] = cursor.lastrowid
         
         # 絵文字レコードを挿入
         cursor.execute(
-            'INSERT INTO emojis (unicode, short_name, group_name, subgroup) VALUES (?, ?, ?, ?)',
-            (unicode, short_name, group_name, subgroup)
+            'INSERT INTO emojis (unicode, unicode_key, short_name, group_id, subgroup_id, status, emoji_version) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?)',
+            (unicode, emoji_key(unicode), short_name, group_id, subgroup_id, status, emoji_version)
         )
         emoji_id = cursor.lastrowid
         
@@ -124,8 +279,20 @@ def import_data(conn):
             
         for keyword in keywords:
             if keyword not in keyword_dict:
-                cursor.execute('INSERT INTO keywords (keyword) VALUES (?)', (keyword,))
-                keyword_dict[keyword] = cursor.lastrowid
+                keyword_norm = normalize_text(keyword)
+                cursor.execute(
+                    'INSERT INTO keywords (keyword, keyword_norm) VALUES (?, ?)',
+                    (keyword, keyword_norm)
+                )
+                keyword_id = cursor.lastrowid
+                keyword_dict[keyword] = keyword_id
+                # 検索語のローマ字はかなに変換されるので、英字のキーワード（ufoなど）は
+                # ローマ字として読んだかなの形も索引に入れる
+                cursor.executemany(
+                    'INSERT OR IGNORE INTO keyword_suffixes (suffix, keyword_id) VALUES (?, ?)',
+                    [(form[i:], keyword_id)
+                     for form in {keyword_norm, normalize_query(keyword)} for i in range(len(form))]
+                )
             
             # 絵文字とキーワードを関連付け
             cursor.execute(
@@ -142,22 +309,224 @@ def import_data(conn):
     print(f"合計 {count} 件の絵文字をインポートしました")
     print(f"合計 {len(keyword_dict)} 件のキーワードをインポートしました")
 
+def _neighbors_sparse(emoji_ids, keyword_ids, k, max_df, batch_size=4096):
+    """
+    TF-IDFで重み付けした絵文字×キーワードの疎行列の積からコサイン類似度の上位k件を求める
+    
+    Returns:
+        (emoji_id, rank, neighbor_id, score) のタプルを返すイテレータ
+    """
+    import numpy as np
+    from scipy import sparse
+    
+    emojis, rows = np.unique(np.asarray(emoji_ids), return_inverse=True)
+    _, cols = np.unique(np.asarray(keyword_ids), return_inverse=True)
+    matrix = sparse.csr_matrix(
+        (np.ones(len(rows)), (rows, cols)), shape=(len(emojis), cols.max() + 1)
+    )
+    
+    df = np.asarray((matrix > 0).sum(axis=0)).ravel()
+    idf = np.log((1 + len(emojis)) / (1 + df)) + 1
+    idf[df > max_df] = 0
+    weighted = matrix.multiply(idf).tocsr()
+    norms = np.sqrt(np.asarray(weighted.multiply(weighted).sum(axis=1)).ravel())
+    norms[norms == 0] = 1
+    normalized = sparse.diags(1 / norms) @ weighted
+    normalized_t = normalized.T.tocsr()
+    
+    for start in range(0, len(emojis), batch_size):
+        similarity = (normalized[start:start + batch_size] @ normalized_t).tocoo()
+        row, col, score = similarity.row, similarity.col, similarity.data
+        # 自分自身と類似度0の組を除く
+        keep = (row + start != col) & (score > 0)
+        row, col, score = row[keep], col[keep], score[keep].round(6)
+        # 行ごとに類似度の降順（同点は絵文字ID順）に並べ、先頭k件を取り出す
+        order = np.lexsort((emojis[col], -score, row))
+        row, col, score = row[order], col[order], score[order]
+        first = np.searchsorted(row, row, side='left')
+        rank = np.arange(len(row)) - first
+        top = rank < k
+        yield from zip(
+            emojis[row[top] + start].tolist(), rank[top].tolist(),
+            emojis[col[top]].tolist(), score[top].tolist()
+        )
+
+def _neighbors_python(emoji_ids, keyword_ids, k, max_df):
+    """
+    NumPy/SciPyがない環境向けに、転置インデックスで同じ類似度を求める
+    """
+    emoji_keywords = {}
+    postings = {}
+    for emoji_id, keyword_id in zip(emoji_ids, keyword_ids):
+        emoji_keywords.setdefault(emoji_id, []).append(keyword_id)
+        postings.setdefault(keyword_id, []).append(emoji_id)
+    
+    n = len(emoji_keywords)
+    weight = {
+        keyword_id: (math.log((1 + n) / (1 + len(ids))) + 1 if len(ids) <= max_df else 0.0)
+        for keyword_id, ids in postings.items()
+    }
+    norm = {
+        emoji_id: math.sqrt(sum(weight[kw] ** 2 for kw in kws)) or 1.0
+        for emoji_id, kws in emoji_keywords.items()
+    }
+    
+    for emoji_id in sorted(emoji_keywords):
+        scores = {}
+        for keyword_id in emoji_keywords[emoji_id]:
+            w = weight[keyword_id] ** 2
+            if not w:
+                continue
+            for other in postings[keyword_id]:
+                if other != emoji_id:
+                    scores[other] = scores.get(other, 0.0) + w
+        top = heapq.nsmallest(
+            k, ((-round(score / (norm[emoji_id] * norm[other]), 6), other)
+                for other, score in scores.items())
+        )
+        for rank, (neg_score, other) in enumerate(top):
+            yield emoji_id, rank, other, -neg_score
+
+def build_neighbors(conn, k=NEIGHBOR_COUNT, max_df=NEIGHBOR_MAX_DF):
+    """キーワードの共起（TF-IDFコサイン類似度）から各絵文字の関連絵文字を計算して保存"""
+    print("関連絵文字を計算中...")
+    pairs = conn.execute('SELECT emoji_id, keyword_id FROM emoji_keywords ORDER BY emoji_id').fetchall()
+    if not pairs:
+        return
+    emoji_ids, keyword_ids = zip(*pairs)
+    
+    try:
+        import numpy  # noqa: F401
+        import scipy.sparse  # noqa: F401
+        neighbors = _neighbors_sparse(emoji_ids, keyword_ids, k, max_df)
+    except ImportError:
+        print("警告: numpy/scipyがインストールされていないため、低速な方法で計算します")
+        neighbors = _neighbors_python(emoji_ids, keyword_ids, k, max_df)
+    
+    conn.execute('DELETE FROM emoji_neighbors')
+    conn.executemany(
+        'INSERT INTO emoji_neighbors (emoji_id, rank, neighbor_id, score) VALUES (?, ?, ?, ?)',
+        neighbors
+    )
+    conn.commit()
+    count = conn.execute('SELECT COUNT(*) FROM emoji_neighbors').fetchone()[0]
+    print(f"合計 {count} 件の関連絵文字を保存しました")
+
+def build_category_counts(conn):
+    """サブグループごとの絵文字数を集計する（グループのない記号類は空文字列のグループ）"""
+    conn.execute('''
+    UPDATE subgroups SET emoji_count = (
+      SELECT COUNT(*) FROM emojis e WHERE e.group_id = subgroups.group_id AND e.subgroup_id = subgroups.id
+    )
+    ''')
+    conn.commit()
+    count = conn.execute('SELECT COUNT(*) FROM subgroups').fetchone()[0]
+    print(f"合計 {count} 件のサブグループを集計しました")
+
+def build_category_pages(conn, page_size=CATEGORY_PAGE_SIZE):
+    """グループ・サブグループごとの一覧をsearch_emojis(group=...)と同じ並びでページに分けてエンコードする"""
+    conn.execute('DELETE FROM category_pages')
+    keywords = {}
+    for emoji_id, keyword in conn.execute('''
+    SELECT ek.emoji_id, k.keyword FROM emoji_keywords ek JOIN keywords k ON k.id = ek.keyword_id
+    ORDER BY ek.emoji_id, ek.keyword_id
+    '''):
+        keywords.setdefault(emoji_id, []).append(keyword)
+    
+    # グループ全体のページはサブグループID 0、サブグループ名None
+    listings = {}
+    for emoji_id, unicode, short_name, group_id, subgroup_id, group_name, subgroup in conn.execute('''
+    SELECT e.id, e.unicode, e.short_name, e.group_id, e.subgroup_id, g.name, s.name
+    FROM emojis e
+    JOIN groups g ON g.id = e.group_id
+    JOIN subgroups s ON s.id = e.subgroup_id
+    ORDER BY e.short_name, e.id
+    '''):
+        emoji = {'id': emoji_id, 'unicode': unicode, 'short_name': short_name, 'group_name': group_name,
+                 'subgroup': subgroup, 'keywords': keywords.get(emoji_id, [])}
+        listings.setdefault((group_id, 0, group_name, None), []).append(emoji)
+        if subgroup:
+            listings.setdefault((group_id, subgroup_id, group_name, subgroup), []).append(emoji)
+    
+    rows = []
+    for (group_id, subgroup_id, group_name, subgroup), emojis in listings.items():
+        pages = (len(emojis) + page_size - 1) // page_size
+        for page in range(pages):
+            encoded = encode_page(emojis[page * page_size:(page + 1) * page_size], group_name,
+                                  subgroup, page, pages, len(emojis))
+            rows.append((group_id, subgroup_id, page) + tuple(encoded))
+    conn.executemany(
+        'INSERT INTO category_pages (group_id, subgroup_id, page, payload, min_id, id_bits, flag_ids, flag_offsets) '
+        'VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+        rows
+    )
+    conn.commit()
+    print(f"合計 {len(rows)} ページのカテゴリ一覧をエンコードしました")
+
+def seed_inputs():
+    """データベースの内容に影響する入力ファイル（データとビルダーのソース）"""
+    python_dir = Path(__file__).resolve().parent.parent / 'src' / 'python'
+    return [EMOJI_DATA_PATH, Path(__file__).resolve(), python_dir / 'text_normalize.py',
+            python_dir / 'category_pages.py']
+
 def main():
+    parser = argparse.ArgumentParser(description='絵文字データベースを作成')
+    parser.add_argument('--force', action='store_true', help='入力が変わっていなくても作り直す')
+    parser.add_argument('--profile', action='store_true', help='ステージごとの処理時間とメモリのピークを表示')
+    parser.add_argument('--profile-output', metavar='FILE', help='cProfileの結果をpstats形式で保存する（--profileと併用）')
+    args = parser.parse_args()
+    
     start_time = time.time()
-    print("絵文字データベースの作成を開始します...")
     
-    # データベース作成
-    conn = create_database()
+    # 入力もデータベースも前回から変わっていなければ何もしない
+    manifest = BuildManifest(DB_PATH.parent / MANIFEST_NAME)
+    # 状態とバージョンの代替に使うemojiパッケージが更新されたら作り直す
+    key = manifest.stage_key(seed_inputs(), neighbor_count=NEIGHBOR_COUNT, neighbor_max_df=NEIGHBOR_MAX_DF,
+                             emoji_package=emoji_package_version())
+    if not args.force and manifest.is_fresh('seed', key, [DB_PATH]):
+        print(f"入力に変更がないため {DB_PATH} をそのまま使います（--forceで作り直し）")
+        return
+    manifest.invalidate('seed')
     
-    # データのインポート
-    import_data(conn)
+    print("絵文字データベースの作成を開始します...")
     
-    # データベース接続を閉じる
-    conn.close()
+    profiler = Profiler(enabled=args.profile, pstats_path=args.profile_output)
+    with profiler:
+        # データベース作成
+        with profiler.stage('create tables'):
+            conn = create_database()
+        
+        # データのインポート
+        with profiler.stage('load json'):
+            emoji_data = load_emoji_data()
+        if emoji_data is not None:
+            with profiler.stage('insert'):
+                import_data(conn, emoji_data)
+        
+        with profiler.stage('index'):
+            create_indexes(conn)
+        
+        # 関連絵文字の計算
+        with profiler.stage('neighbors'):
+            build_neighbors(conn)
+        
+        # カテゴリごとの件数の集計
+        with profiler.stage('category counts'):
+            build_category_counts(conn)
+        
+        # カテゴリの一覧ページのエンコード
+        with profiler.stage('category pages'):
+            build_category_pages(conn)
+        
+        # データベース接続を閉じる
+        conn.close()
+    if EMOJI_DATA_PATH.exists():
+        manifest.record('seed', key, [DB_PATH])
     
     elapsed_time = time.time() - start_time
     print(f"完了しました！処理時間: {elapsed_time:.2f}秒")
     print("データベースは data/emojis.db に保存されました")
+    profiler.report()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
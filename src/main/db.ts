@@ -32,26 +32,54 @@ export interface HistoryItem {
   usedAt: string;
 }
 
-// データベースファイルのパス
-let dbPath: string;
-
-// 環境変数からDBパスを取得、または適切な場所を設定
-if (process.env.DATABASE_PATH) {
-  dbPath = path.resolve(process.env.DATABASE_PATH);
-} else {
-  // デフォルトのパス
+// 利用者ごとのデータベース（お気に入り・履歴）のパス。Python側（EmojiData）と同じファイルを使う
+function getUserDbPath(): string {
+  if (process.env.DATABASE_PATH) {
+    return path.resolve(process.env.DATABASE_PATH);
+  }
+  
   const dataDir = process.platform === 'win32'
     ? path.join(process.env.APPDATA || '', 'emoji-copier')
     : path.join(os.homedir(), '.local', 'share', 'emoji-copier');
   
-  dbPath = path.join(dataDir, 'data', 'emojis.db');
+  return path.join(dataDir, 'data', 'user.db');
+}
+
+// アプリに同梱された読み取り専用の絵文字カタログのパス
+function getCatalogPath(): string {
+  if (process.env.CATALOG_PATH) {
+    return path.resolve(process.env.CATALOG_PATH);
+  }
   
-  // 開発モード時は現在のディレクトリ内のデータを使用
+  // 開発モード時はプロジェクト内のデータ、本番環境ではリソースディレクトリのデータを使用
   if (process.env.NODE_ENV === 'development') {
-    dbPath = path.join(__dirname, '../../data/emojis.db');
+    return path.join(__dirname, '../../data/emojis.db');
   }
+  return path.join(process.resourcesPath, 'data', 'emojis.db');
 }
 
+const dbPath = getUserDbPath();
+const catalogPath = getCatalogPath();
+
+// 利用者データベースのスキーマ（src/python/emoji_data.py の USER_SCHEMA と同じ定義）。
+// 遷移・集計用の表とトリガーはPython側が接続時に追加し、既存の履歴から集計する
+const USER_SCHEMA = `
+  CREATE TABLE IF NOT EXISTS favorites (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    emoji_id INTEGER NOT NULL,
+    position INTEGER NOT NULL DEFAULT 0,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+  );
+  CREATE TABLE IF NOT EXISTS history (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    emoji_id INTEGER NOT NULL,
+    used_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+  );
+  CREATE UNIQUE INDEX IF NOT EXISTS idx_favorites_emoji_id_unique ON favorites(emoji_id);
+  CREATE INDEX IF NOT EXISTS idx_favorites_position ON favorites(position, emoji_id);
+  CREATE INDEX IF NOT EXISTS idx_history_used_at ON history(used_at);
+`;
+
 // データベース接続
 let db: any;
 
@@ -75,8 +103,55 @@ const inMemoryData: InMemoryData = {
   history: []
 };
 
+/**
+ * 以前のバージョンで利用者ごとにコピーしていたデータベース（emojis.db）から
+ * お気に入りと履歴を引き継ぐ。絵文字IDはunicodeで現在のカタログに対応付ける
+ */
+function migrateLegacyDB(conn: any): void {
+  const legacyPath = path.join(path.dirname(dbPath), 'emojis.db');
+  if (!fs.existsSync(legacyPath) || path.resolve(legacyPath) === path.resolve(catalogPath)) {
+    return;
+  }
+  
+  try {
+    conn.prepare('ATTACH DATABASE ? AS legacy').run(legacyPath);
+    const migrate = conn.transaction(() => {
+      const favorites = conn.prepare(`
+        INSERT OR IGNORE INTO main.favorites (emoji_id, position, created_at)
+        SELECT c.id, ROW_NUMBER() OVER (ORDER BY f.created_at DESC, f.id DESC), f.created_at
+        FROM legacy.favorites f
+        JOIN legacy.emojis le ON le.id = f.emoji_id
+        JOIN catalog.emojis c ON c.unicode = le.unicode
+        ORDER BY f.id
+      `).run().changes;
+      const history = conn.prepare(`
+        INSERT INTO main.history (emoji_id, used_at)
+        SELECT c.id, h.used_at
+        FROM legacy.history h
+        JOIN legacy.emojis le ON le.id = h.emoji_id
+        JOIN catalog.emojis c ON c.unicode = le.unicode
+        ORDER BY h.id
+      `).run().changes;
+      console.log(`旧データベースから移行しました: お気に入り${favorites}件, 履歴${history}件 (${legacyPath})`);
+    });
+    migrate();
+  } catch (error) {
+    console.error('旧データベースの移行中にエラーが発生しました:', error);
+  } finally {
+    try {
+      conn.exec('DETACH DATABASE legacy');
+    } catch (error) {
+      // ATTACHに失敗した場合は何もしない
+    }
+  }
+}
+
 /**
  * データベースの初期化
+ *
+ * 利用者データベース（user.db）を開き、同梱の絵文字カタログを catalog としてATTACHする。
+ * 修飾なしの表名は利用者データベースを先に探すため、favorites/history は user.db に、
+ * emojis などはカタログに解決される。
  */
 async function initializeDB(): Promise<void> {
   try {
@@ -86,47 +161,47 @@ async function initializeDB(): Promise<void> {
       return;
     }
 
-    // データベースファイルがあることを確認
+    // ATTACHは存在しないファイルを空のデータベースとして作ってしまうため、先に確認する
+    if (!fs.existsSync(catalogPath)) {
+      console.warn(`絵文字カタログが見つかりません: ${catalogPath}。インメモリデータを使用します。`);
+      return;
+    }
+    
+    // 利用者データベースのディレクトリがあることを確認
     const dbDir = path.dirname(dbPath);
     if (!fs.existsSync(dbDir)) {
       fs.mkdirSync(dbDir, { recursive: true });
     }
     
-    // 既存DBに接続
-    if (fs.existsSync(dbPath)) {
-      try {
-        db = sqlite(dbPath);
-        console.log(`データベースに接続しました: ${dbPath}`);
-        return;
-      } catch (error) {
-        console.error('データベース接続エラー:', error);
-        // 接続に失敗した場合はインメモリデータを使用
+    try {
+      const isNew = !fs.existsSync(dbPath);
+      const conn = sqlite(dbPath);
+      // Python側と同時に書き込むことがあるため、ロックが空くのを待つ
+      conn.pragma('busy_timeout = 5000');
+      // カタログへは書き込まない（書き込み先の表はすべて利用者データベースにある）
+      conn.prepare('ATTACH DATABASE ? AS catalog').run(catalogPath);
+      // グループ・サブグループを別表にする前の古いカタログでは、以降のJOINが失敗する
+      const dimensions = conn.prepare(
+        "SELECT COUNT(*) AS count FROM catalog.sqlite_master WHERE type = 'table' AND name IN ('groups', 'subgroups')"
+      ).get();
+      if (dimensions.count < 2) {
+        conn.close();
+        console.error(`絵文字カタログの形式が古いため使用できません: ${catalogPath}。scripts/seed_db.py で再生成してください。`);
         console.warn('インメモリデータを使用します');
         return;
       }
-    }
-    
-    // データベースが存在しない場合、開発環境のDBをコピー
-    if (process.env.NODE_ENV === 'development') {
-      const defaultDbPath = path.join(__dirname, '../../data/emojis.db');
-      if (fs.existsSync(defaultDbPath)) {
-        try {
-          fs.copyFileSync(defaultDbPath, dbPath);
-          db = sqlite(dbPath);
-          console.log(`開発用データベースをコピーしました: ${defaultDbPath} → ${dbPath}`);
-          return;
-        } catch (error) {
-          console.error('データベースコピーエラー:', error);
-          // コピーに失敗した場合はインメモリデータを使用
-          console.warn('インメモリデータを使用します');
-          return;
-        }
+      conn.exec(USER_SCHEMA);
+      if (isNew) {
+        migrateLegacyDB(conn);
       }
+      db = conn;
+      console.log(`データベースに接続しました: ${dbPath} (カタログ: ${catalogPath})`);
+    } catch (error) {
+      console.error('データベース接続エラー:', error);
+      // 接続に失敗した場合はインメモリデータを使用
+      console.warn('インメモリデータを使用します');
     }
     
-    // どこにもDBがなければインメモリデータを使用
-    console.warn('データベースファイルが見つかりません。インメモリデータを使用します。');
-    
   } catch (error) {
     console.error('データベース初期化エラー:', error);
     console.warn('インメモリデータを使用します');
@@ -148,10 +223,12 @@ function getEmojis(category: string): Emoji[] {
 
   // SQLite を使用
     let query = `
-      SELECT e.id, e.unicode, e.short_name, e.group_name, e.subgroup,
+      SELECT e.id, e.unicode, e.short_name, g.name as group_name, s.name as subgroup,
              GROUP_CONCAT(k.keyword) as keywords_str,
              EXISTS(SELECT 1 FROM favorites WHERE emoji_id = e.id) as isFavorite
       FROM emojis e
+      JOIN groups g ON g.id = e.group_id
+      JOIN subgroups s ON s.id = e.subgroup_id
       LEFT JOIN emoji_keywords ek ON e.id = ek.emoji_id
       LEFT JOIN keywords k ON ek.keyword_id = k.id
       WHERE 1=1
@@ -160,7 +237,7 @@ function getEmojis(category: string): Emoji[] {
     const params: any[] = [];
     
     if (category) {
-      query += ` AND e.group_name = ?`;
+      query += ` AND g.name = ?`;
       params.push(category);
     }
     
@@ -211,10 +288,12 @@ function searchEmojis(query: string): Emoji[] {
       return [];
     }
       let sql = `
-      SELECT e.id, e.unicode, e.short_name, e.group_name, e.subgroup, 
+      SELECT e.id, e.unicode, e.short_name, g.name as group_name, s.name as subgroup, 
              GROUP_CONCAT(k.keyword) as keywords_str,
              EXISTS(SELECT 1 FROM favorites WHERE emoji_id = e.id) as isFavorite
       FROM emojis e
+      JOIN groups g ON g.id = e.group_id
+      JOIN subgroups s ON s.id = e.subgroup_id
       LEFT JOIN emoji_keywords ek ON e.id = ek.emoji_id
       LEFT JOIN keywords k ON ek.keyword_id = k.id
     `;
@@ -273,15 +352,17 @@ function getFavorites(): Emoji[] {
       return inMemoryData.emojis.filter(e => e.isFavorite);
     }    // SQLite を使用
     const query = `
-      SELECT e.id, e.unicode, e.short_name, e.group_name, e.subgroup, 
+      SELECT e.id, e.unicode, e.short_name, g.name as group_name, s.name as subgroup, 
              GROUP_CONCAT(k.keyword) as keywords_str, 
              1 as isFavorite
       FROM emojis e
+      JOIN groups g ON g.id = e.group_id
+      JOIN subgroups s ON s.id = e.subgroup_id
       JOIN favorites f ON e.id = f.emoji_id
       LEFT JOIN emoji_keywords ek ON e.id = ek.emoji_id
       LEFT JOIN keywords k ON ek.keyword_id = k.id
       GROUP BY e.id
-      ORDER BY f.created_at DESC
+      ORDER BY f.position, f.emoji_id
     `;
     
     const results = db.prepare(query).all();
@@ -313,10 +394,11 @@ function addToFavorites(emojiId: number): boolean {
       return false;
     }
 
-  // SQLite を使用
-    const now = new Date().toISOString();
-    
-    const result = db.prepare('INSERT OR REPLACE INTO favorites (emoji_id, created_at) VALUES (?, ?)').run(emojiId, now);
+  // SQLite を使用（Python側と同じく、新しいお気に入りを先頭に置く）
+    const result = db.prepare(`
+      INSERT OR IGNORE INTO favorites (emoji_id, position)
+      SELECT ?, COALESCE(MIN(position), 0) - 1 FROM favorites
+    `).run(emojiId);
     
     return result.changes > 0;
   } catch (error) {
@@ -381,10 +463,8 @@ function addToHistory(emojiId: number): boolean {
       return false;
     }
 
-    // SQLite を使用
-    const now = new Date().toISOString();
-    
-    const result = db.prepare('INSERT INTO history (emoji_id, used_at) VALUES (?, ?)').run(emojiId, now);
+    // SQLite を使用（used_atはPython側と同じ形式になるよう既定値に任せる）
+    const result = db.prepare('INSERT INTO history (emoji_id) VALUES (?)').run(emojiId);
     
     return result.changes > 0;
   } catch (error) {
@@ -419,10 +499,12 @@ function getRecentEmojis(limit: number = 10): Emoji[] {
         .filter(emoji => emoji !== undefined) as Emoji[];
     }    // SQLite を使用
     const query = `
-      SELECT e.id, e.unicode, e.short_name, e.group_name, e.subgroup,
+      SELECT e.id, e.unicode, e.short_name, g.name as group_name, s.name as subgroup,
              EXISTS(SELECT 1 FROM favorites WHERE emoji_id = e.id) as isFavorite,
              MAX(h.used_at) as last_used
       FROM emojis e
+      JOIN groups g ON g.id = e.group_id
+      JOIN subgroups s ON s.id = e.subgroup_id
       JOIN history h ON e.id = h.emoji_id
       GROUP BY e.id
       ORDER BY last_used DESC
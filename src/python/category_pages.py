@@ -0,0 +1,134 @@
+"""
+カテゴリ（グループ・サブグループ）の一覧ページを事前にエンコードしたJSON。
+seed_db.pyがページごとにcategory_pagesテーブルへ保存し、EmojiData.get_category_pageが
+お気に入りのフラグだけを書き換えてそのまま返す。
+
+ページのJSONは search_emojis(group=...) と同じ形の絵文字の配列を含む:
+    {"group_name": ..., "subgroup": ..., "page": 0, "pages": 3, "total": 250,
+     "emojis": [{"id": 1, "unicode": ..., ..., "is_favorite": false}, ...]}
+
+各絵文字の is_favorite は同じ5バイトの false / "true " で表すので、バイト列の位置（flag_offsets）を
+書き換えるだけでお気に入りを反映できる。どの絵文字がページにあるかはページ内の最小IDからのビットマップ
+（id_bits）で持ち、お気に入りのビットマップとのANDが0なら書き換えずに返す。
+"""
+
+import json
+import sys
+from array import array
+from bisect import bisect_left
+from typing import Any, Dict, List, NamedTuple, Optional
+
+# 1ページの絵文字数（search_emojisの既定のlimitと同じ）
+CATEGORY_PAGE_SIZE = 100
+
+# お気に入りでない / お気に入りの絵文字のフラグ（同じ長さにして位置を変えずに書き換える）
+FLAG_FALSE = b'false'
+FLAG_TRUE = b'true '
+
+class EncodedPage(NamedTuple):
+    """
+    category_pagesの1行分
+    """
+    payload: bytes
+    min_id: int
+    id_bits: bytes
+    flag_ids: bytes
+    flag_offsets: bytes
+
+def _pack(values: List[int]) -> bytes:
+    """
+    符号なし32ビット整数の列をリトルエンディアンのバイト列にする
+    """
+    packed = array('I', values)
+    if sys.byteorder == 'big':
+        packed.byteswap()
+    return packed.tobytes()
+
+def _unpack(data: bytes) -> array:
+    """
+    _packの逆
+    """
+    values = array('I')
+    values.frombytes(data)
+    if sys.byteorder == 'big':
+        values.byteswap()
+    return values
+
+def encode_page(emojis: List[Dict[str, Any]], group_name: str, subgroup: Optional[str],
+                page: int, pages: int, total: int) -> EncodedPage:
+    """
+    1ページ分の絵文字をJSONにエンコードし、お気に入りのフラグの位置を記録する
+
+    Args:
+        emojis: id, unicode, short_name, group_name, subgroup, keywords を持つ絵文字（表示順）
+        group_name: グループ名
+        subgroup: サブグループ名。グループ全体のページはNone
+        page: ページ番号（0始まり）
+        pages: ページ数
+        total: カテゴリ全体の絵文字数
+
+    Returns:
+        エンコードしたページ
+    """
+    header = json.dumps({'group_name': group_name, 'subgroup': subgroup, 'page': page,
+                         'pages': pages, 'total': total},
+                        ensure_ascii=False, separators=(',', ':'))
+    parts = [header[:-1].encode('utf-8') + b',"emojis":[']
+    length = len(parts[0])
+    flags = []
+    for i, emoji in enumerate(emojis):
+        row = {key: emoji[key] for key in ('id', 'unicode', 'short_name', 'group_name', 'subgroup', 'keywords')}
+        # is_favoriteを最後に置き、フラグの位置を行の末尾から求める
+        encoded = json.dumps(row, ensure_ascii=False, separators=(',', ':'))[:-1].encode('utf-8')
+        encoded = (b',' if i else b'') + encoded + b',"is_favorite":' + FLAG_FALSE + b'}'
+        flags.append((emoji['id'], length + len(encoded) - len(FLAG_FALSE) - 1))
+        parts.append(encoded)
+        length += len(encoded)
+    parts.append(b']}')
+
+    ids = [emoji_id for emoji_id, _ in flags]
+    min_id = min(ids) if ids else 0
+    bits = 0
+    for emoji_id in ids:
+        bits |= 1 << (emoji_id - min_id)
+    flags.sort()
+    return EncodedPage(
+        payload=b''.join(parts),
+        min_id=min_id,
+        id_bits=bits.to_bytes((bits.bit_length() + 7) // 8, 'little'),
+        flag_ids=_pack([emoji_id for emoji_id, _ in flags]),
+        flag_offsets=_pack([offset for _, offset in flags]),
+    )
+
+def overlay_favorites(payload: bytes, min_id: int, id_bits: bytes, flag_ids: bytes,
+                      flag_offsets: bytes, favorite_bits: int) -> bytes:
+    """
+    ページのお気に入りのフラグを書き換える
+
+    ページの絵文字とお気に入りの共通部分はビットマップのANDで求めるので、処理はページの行数ではなく
+    ページにあるお気に入りの数に比例する（なければ元のバイト列をそのまま返す）。
+
+    Args:
+        payload: エンコード済みのページ
+        min_id: ページ内の最小の絵文字ID
+        id_bits: ページの絵文字のビットマップ（min_idからの相対位置）
+        flag_ids: ページの絵文字ID（昇順）
+        flag_offsets: flag_idsの各絵文字のフラグの位置
+        favorite_bits: お気に入りの絵文字IDのビットマップ
+
+    Returns:
+        お気に入りを反映したページ
+    """
+    mask = (favorite_bits >> min_id) & int.from_bytes(id_bits, 'little')
+    if not mask:
+        return payload
+
+    ids = _unpack(flag_ids)
+    offsets = _unpack(flag_offsets)
+    result = bytearray(payload)
+    while mask:
+        low = mask & -mask
+        offset = offsets[bisect_left(ids, min_id + low.bit_length() - 1)]
+        result[offset:offset + len(FLAG_TRUE)] = FLAG_TRUE
+        mask ^= low
+    return bytes(result)
@@ -1,13 +1,20 @@
 """
 クリップボード操作のためのユーティリティスクリプト。
 Electronアプリからの呼び出しを受けて、絵文字テキストをクリップボードにコピーする。
+--watch では、他のアプリでコピーされたテキストに含まれる絵文字を使用履歴に記録する。
 """
 
 import sys
 import argparse
 import platform
 import logging
-from typing import Optional
+import os
+import queue
+import shutil
+import subprocess
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Tuple
 
 # ロギング設定
 logging.basicConfig(
@@ -16,6 +23,17 @@ logging.basicConfig(
 )
 logger = logging.getLogger('emoji-clipboard')
 
+# 変更通知が使えない環境でのポーリング間隔（秒）。変化がない間は最大まで倍々に延ばし、変化したら最小に戻す
+WATCH_POLL_MIN_INTERVAL = 0.25
+WATCH_POLL_MAX_INTERVAL = 5.0
+
+# 検出した絵文字を履歴にまとめて書き込むまでの最大の待ち時間（秒）と件数
+WATCH_FLUSH_INTERVAL = 5.0
+WATCH_BATCH_SIZE = 100
+
+# Windowsのクリップボード変更通知のメッセージ
+WM_CLIPBOARDUPDATE = 0x031D
+
 def setup_clipboard():
     """
     プラットフォームに適したクリップボードライブラリを選択・インポートする
@@ -106,6 +124,238 @@ def get_from_clipboard() -> Optional[str]:
         logger.error(f"クリップボード取得中にエラーが発生しました: {e}")
         return None
 
+def _read_wayland_clipboard() -> Optional[str]:
+    """
+    wl-pasteでWaylandのクリップボードのテキストを取得する（テキストがなければNone）
+    """
+    try:
+        result = subprocess.run(['wl-paste', '--no-newline', '--type', 'text'],
+                                capture_output=True, timeout=5)
+    except (OSError, subprocess.SubprocessError) as e:
+        logger.debug(f"wl-pasteの実行に失敗しました: {e}")
+        return None
+    if result.returncode != 0:
+        return None
+    return result.stdout.decode('utf-8', errors='replace')
+
+def _watch_wayland(emit: Callable[[Optional[str]], None]) -> bool:
+    """
+    wl-paste --watch の変更通知でクリップボードを監視する
+    
+    wl-pasteはクリップボードが変わるたびに指定したコマンド（ここでは改行を出力するだけ）を実行するので、
+    その出力を待つ間はプロセスを起動せずに眠っている。
+    
+    Returns:
+        常にFalse（Waylandでない、wl-pasteがない、またはwl-pasteが終了した場合に戻る）
+    """
+    if not os.environ.get('WAYLAND_DISPLAY') or shutil.which('wl-paste') is None:
+        return False
+    try:
+        process = subprocess.Popen(['wl-paste', '--watch', 'echo'], stdout=subprocess.PIPE,
+                                   stderr=subprocess.DEVNULL)
+    except OSError as e:
+        logger.warning(f"wl-paste --watch を起動できませんでした: {e}")
+        return False
+    
+    logger.info("wl-paste --watch でクリップボードを監視します")
+    try:
+        for _ in process.stdout:
+            emit(_read_wayland_clipboard())
+    finally:
+        process.kill()
+        process.wait()
+    logger.warning("wl-paste --watch が終了しました")
+    return False
+
+def _watch_x11(emit: Callable[[Optional[str]], None]) -> bool:
+    """
+    XFixesのSelectionNotifyイベントでX11のCLIPBOARDの所有者の変化を監視する（python-xlibが必要）
+    
+    Returns:
+        常にFalse（X11でない、python-xlibやXFixesが使えない、またはXサーバーとの接続が切れた場合に戻る）
+    """
+    if not os.environ.get('DISPLAY'):
+        return False
+    try:
+        from Xlib import display as xdisplay
+        from Xlib.ext import xfixes
+    except ImportError:
+        logger.info("python-xlibがインストールされていないため、X11の変更通知は使えません")
+        return False
+    
+    try:
+        conn = xdisplay.Display()
+        if not conn.has_extension('XFIXES'):
+            conn.close()
+            return False
+        conn.xfixes_query_version()
+        conn.xfixes_select_selection_input(conn.screen().root, conn.get_atom('CLIPBOARD'),
+                                           xfixes.XFixesSetSelectionOwnerNotifyMask)
+    except Exception as e:
+        logger.warning(f"XFixesの変更通知を設定できませんでした: {e}")
+        return False
+    
+    logger.info("XFixesの変更通知でクリップボードを監視します")
+    try:
+        while True:
+            # 次のイベントまでソケットの読み込みで眠る
+            event = conn.next_event()
+            if (event.type, getattr(event, 'sub_code', None)) == conn.extension_event.SetSelectionOwnerNotify:
+                emit(get_from_clipboard())
+    except Exception as e:
+        logger.warning(f"X11の変更通知が途切れました: {e}")
+    finally:
+        conn.close()
+    return False
+
+def _watch_windows(emit: Callable[[Optional[str]], None]) -> bool:
+    """
+    AddClipboardFormatListenerの変更通知（WM_CLIPBOARDUPDATE）でクリップボードを監視する（pywin32が必要）
+    
+    Returns:
+        Windowsでない、またはpywin32がない場合はFalse（監視中はメッセージループが終わるまで戻らない）
+    """
+    if platform.system() != 'Windows':
+        return False
+    try:
+        import ctypes
+        import win32api
+        import win32gui
+    except ImportError:
+        return False
+    
+    def window_proc(hwnd, message, wparam, lparam):
+        if message == WM_CLIPBOARDUPDATE:
+            emit(get_from_clipboard())
+            return 0
+        return win32gui.DefWindowProc(hwnd, message, wparam, lparam)
+    
+    # 通知を受け取るだけの見えないウィンドウ（メッセージ専用ウィンドウ）
+    window_class = win32gui.WNDCLASS()
+    window_class.lpfnWndProc = window_proc
+    window_class.lpszClassName = 'EmojiClipboardWatcher'
+    window_class.hInstance = win32api.GetModuleHandle(None)
+    win32gui.RegisterClass(window_class)
+    hwnd = win32gui.CreateWindow(window_class.lpszClassName, '', 0, 0, 0, 0, 0,
+                                 -3,  # HWND_MESSAGE
+                                 0, window_class.hInstance, None)
+    user32 = ctypes.windll.user32
+    if not user32.AddClipboardFormatListener(hwnd):
+        logger.warning("クリップボードの変更通知を登録できませんでした")
+        win32gui.DestroyWindow(hwnd)
+        return False
+    
+    logger.info("クリップボードの変更通知で監視します")
+    try:
+        # メッセージが届くまで眠る
+        win32gui.PumpMessages()
+    finally:
+        user32.RemoveClipboardFormatListener(hwnd)
+        win32gui.DestroyWindow(hwnd)
+    return True
+
+def _watch_polling(emit: Callable[[Optional[str]], None],
+                   min_interval: float = WATCH_POLL_MIN_INTERVAL,
+                   max_interval: float = WATCH_POLL_MAX_INTERVAL) -> None:
+    """
+    変更通知が使えない環境で、クリップボードを定期的に読んで監視する
+    
+    変化がない間は間隔を倍々に延ばす（最大max_interval）ので、放置中はほとんど読み込まない。
+    変化したら最小の間隔に戻し、続けてコピーした場合も取りこぼしにくくする。
+    """
+    logger.info(f"クリップボードを{min_interval}〜{max_interval}秒間隔で監視します")
+    last = get_from_clipboard()
+    interval = min_interval
+    while True:
+        time.sleep(interval)
+        text = get_from_clipboard()
+        if text != last:
+            last = text
+            emit(text)
+            interval = min_interval
+        else:
+            interval = min(interval * 2, max_interval)
+
+def watch_clipboard(emit: Callable[[Optional[str]], None]) -> None:
+    """
+    クリップボードの変化を監視し、変化するたびに新しい内容でemitを呼ぶ（戻らない）
+    
+    変更通知（Wayland: wl-paste --watch、X11: XFixes、Windows: クリップボードリスナー）を優先し、
+    どれも使えなければ間隔を調整しながらポーリングする。同じ内容で呼ぶこともある。
+    
+    Args:
+        emit: クリップボードのテキスト（取得できなければNone）を受け取る関数
+    """
+    for watcher in (_watch_wayland, _watch_x11, _watch_windows):
+        if watcher(emit):
+            return
+    _watch_polling(emit)
+
+def watch_history(emoji_data, scanner, flush_interval: float = WATCH_FLUSH_INTERVAL,
+                  batch_size: int = WATCH_BATCH_SIZE) -> None:
+    """
+    クリップボードにコピーされたテキストの絵文字を検出し、使用履歴にまとめて記録する（Ctrl+Cまで戻らない）
+    
+    監視は別スレッドで行い、このスレッドはキューを待つ。記録待ちの絵文字がない間は時間制限なしで待つので、
+    放置中はどちらのスレッドも眠っている。記録待ちができたら、flush_interval秒後かbatch_size件に
+    達した時点で1回のトランザクションで書き込む。
+    
+    1回のコピーに含まれる絵文字は、登場順にそれぞれ1回だけ数える。
+    同じ内容が続いた場合と、絵文字1つだけで直前の履歴と同じ場合（このアプリでコピーした絵文字で、
+    既に記録済み）は数えない。
+    
+    Args:
+        emoji_data: EmojiDataのインスタンス
+        scanner: カタログの絵文字を検出するEmojiScanner
+        flush_interval: 検出から書き込みまでの最大の待ち時間（秒）
+        batch_size: この件数がたまったらすぐに書き込む
+    """
+    changes: 'queue.Queue[Optional[str]]' = queue.Queue()
+    threading.Thread(target=watch_clipboard, args=(changes.put,), name='clipboard-watcher',
+                     daemon=True).start()
+    
+    last_text = get_from_clipboard()
+    pending: List[Tuple[int, str]] = []
+    deadline = 0.0
+    
+    def flush() -> None:
+        if pending:
+            emoji_data.add_many_to_history(pending)
+            pending.clear()
+    
+    try:
+        while True:
+            timeout = max(deadline - time.monotonic(), 0) if pending else None
+            try:
+                text = changes.get(timeout=timeout)
+            except queue.Empty:
+                flush()
+                continue
+            if not text or text == last_text:
+                continue
+            last_text = text
+            
+            found: Dict[int, None] = {}
+            for _, emoji_id in scanner.finditer(text):
+                found.setdefault(emoji_id)
+            if not found:
+                continue
+            if len(found) == 1 and scanner.scan(text.strip()) == [(0, next(iter(found)))]:
+                recent = emoji_data.get_recent_emojis(limit=1)
+                if recent and recent[0]['id'] in found:
+                    logger.debug("アプリでコピーした絵文字なので記録しません")
+                    continue
+            
+            used_at = time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime())
+            if not pending:
+                deadline = time.monotonic() + flush_interval
+            pending.extend((emoji_id, used_at) for emoji_id in found)
+            logger.debug(f"クリップボードから{len(found)}個の絵文字を検出しました")
+            if len(pending) >= batch_size:
+                flush()
+    finally:
+        flush()
+
 def main():
     """
     コマンドラインからの実行時のエントリーポイント
@@ -114,6 +364,10 @@ def main():
     group = parser.add_mutually_exclusive_group(required=True)
     group.add_argument('--copy', help='指定したテキストをクリップボードにコピー')
     group.add_argument('--paste', action='store_true', help='クリップボードの内容を表示')
+    group.add_argument('--watch', action='store_true',
+                       help='クリップボードを監視し、コピーされた絵文字を使用履歴に記録（Ctrl+Cで終了）')
+    parser.add_argument('--flush-interval', type=float, default=WATCH_FLUSH_INTERVAL,
+                        help=f'--watch で履歴に書き込むまでの最大の待ち時間（秒、既定: {WATCH_FLUSH_INTERVAL}）')
     parser.add_argument('--verbose', '-v', action='store_true', help='詳細なログ出力')
     
     args = parser.parse_args()
@@ -132,6 +386,21 @@ def main():
         else:
             logger.error("クリップボードからテキストを取得できませんでした")
             sys.exit(1)
+    elif args.watch:
+        import signal
+        from emoji_data import EmojiData
+        from emoji_scanner import EmojiScanner
+        
+        # 終了させられたときも記録待ちの絵文字を書き込む
+        signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+        emoji_data = EmojiData()
+        try:
+            scanner = EmojiScanner.from_emoji_data(emoji_data)
+            watch_history(emoji_data, scanner, flush_interval=args.flush_interval)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            emoji_data.close()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,272 @@
+"""
+カスタム絵文字（チームで管理する画像の絵文字）の画像ストアとサムネイルキャッシュ。
+名前とキーワードは利用者データベースのcustom_emojis / custom_keywordsに置き、
+画像本体はSHA-256のハッシュを名前にしたファイルとしてデータベースの外に保存する
+（同じ画像は何度取り込んでも1つだけ）。
+"""
+
+import hashlib
+import logging
+import os
+import re
+import tempfile
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import BinaryIO, Callable, Iterable, Iterator, List, NamedTuple, Optional
+
+logger = logging.getLogger('emoji-data')
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+# 取り込む画像の拡張子 → MIMEタイプ
+IMAGE_TYPES = {
+    '.png': 'image/png',
+    '.gif': 'image/gif',
+    '.jpg': 'image/jpeg',
+    '.jpeg': 'image/jpeg',
+    '.webp': 'image/webp',
+    '.svg': 'image/svg+xml',
+}
+
+# サムネイルキャッシュの既定の上限（バイト）。超えたら最後に使ったのが古いものから消す
+THUMBNAIL_CACHE_BYTES = 64 * 1024 * 1024
+
+# サムネイルの既定の一辺（ピクセル）
+THUMBNAIL_SIZE = 64
+
+# 名前をキーワードに分ける区切り（party_parrot → party, parrot）
+_NAME_SEPARATORS = re.compile(r'[_\-\s.]+')
+
+class StoredImage(NamedTuple):
+    """
+    画像ストアに保存した1ファイル分の情報
+    """
+    name: str
+    blob_hash: str
+    mime: str
+
+def custom_emoji_keywords(name: str) -> List[str]:
+    """
+    カスタム絵文字の名前から検索用のキーワードを作る
+
+    Args:
+        name: カスタム絵文字の名前（例: party_parrot）
+
+    Returns:
+        名前そのものと、区切り文字で分けた各部分（重複なし）
+    """
+    return list(dict.fromkeys([name] + [part for part in _NAME_SEPARATORS.split(name) if part]))
+
+def _write_atomic(path: Path, write: Callable[[BinaryIO], None]) -> None:
+    """
+    同じディレクトリの一時ファイルに書いてから置き換える。
+    並行して同じファイルを書いても、途中まで書かれたファイルは見えない
+    """
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=path.parent, prefix='.tmp-')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            write(f)
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+        raise
+
+def find_images(directory: str) -> List[Path]:
+    """
+    ディレクトリ以下（サブディレクトリを含む）の画像ファイルを探す
+
+    Returns:
+        対応する拡張子のファイルのパス（パス順）
+    """
+    images = []
+    for root, _, files in os.walk(directory):
+        for file_name in files:
+            if Path(file_name).suffix.lower() in IMAGE_TYPES and not file_name.startswith('.'):
+                images.append(Path(root) / file_name)
+    images.sort()
+    return images
+
+class BlobStore:
+    """
+    内容のハッシュで名前を付けて画像を保存するストア（root/ハッシュの先頭2文字/ハッシュ）
+    """
+
+    def __init__(self, root: str):
+        self.root = Path(root)
+
+    def path(self, blob_hash: str) -> Path:
+        """
+        ハッシュに対応するファイルのパス
+        """
+        return self.root / blob_hash[:2] / blob_hash
+
+    def put(self, data: bytes) -> str:
+        """
+        画像を保存してハッシュを返す。同じ内容が既にあれば書き込まない
+        """
+        blob_hash = hashlib.sha256(data).hexdigest()
+        path = self.path(blob_hash)
+        if not path.exists():
+            _write_atomic(path, lambda f: f.write(data))
+        return blob_hash
+
+    def remove(self, blob_hash: str) -> None:
+        """
+        画像を削除する（なければ何もしない）
+        """
+        try:
+            self.path(blob_hash).unlink()
+        except FileNotFoundError:
+            pass
+
+    def store_files(self, paths: Iterable[Path], workers: Optional[int] = None) -> Iterator[StoredImage]:
+        """
+        画像ファイルを並列に読み込んでハッシュを計算し、ストアに保存する
+
+        ハッシュ計算とファイルの読み書きはGILを手放すのでスレッドで並列化できる。
+        読めなかったファイルは警告を出して飛ばす。
+
+        Args:
+            paths: 画像ファイルのパス
+            workers: 並列数。Noneなら自動
+
+        Yields:
+            保存した画像（入力と同じ順）
+        """
+        def store(path: Path) -> Optional[StoredImage]:
+            try:
+                blob_hash = self.put(path.read_bytes())
+            except OSError as e:
+                logger.warning(f"画像を読み込めませんでした: {path}: {e}")
+                return None
+            return StoredImage(path.stem, blob_hash, IMAGE_TYPES[path.suffix.lower()])
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            for stored in executor.map(store, paths):
+                if stored is not None:
+                    yield stored
+
+class ThumbnailCache:
+    """
+    縮小した画像をディスクに保存するキャッシュ。合計がmax_bytesを超えたら最後に使ったのが古いものから消す
+
+    使った順はファイルの更新日時で記録するので、プロセスを再起動しても引き継がれる。
+    Pillowがなければ縮小できないので元の画像のパスを返す。
+    """
+
+    def __init__(self, root: str, blobs: BlobStore, max_bytes: int = THUMBNAIL_CACHE_BYTES):
+        self.root = Path(root)
+        self.blobs = blobs
+        self.max_bytes = max_bytes
+        self._entries: Optional['OrderedDict[Path, int]'] = None
+        self._total = 0
+        self._lock = threading.Lock()
+        if Image is None:
+            logger.warning("Pillowがインストールされていないため、サムネイルの代わりに元の画像を使います")
+
+    def _load(self) -> 'OrderedDict[Path, int]':
+        """
+        初回だけキャッシュのディレクトリを走査し、使った順（更新日時順）に並べる
+        """
+        if self._entries is None:
+            found = []
+            if self.root.exists():
+                for path in self.root.glob('*/*.png'):
+                    try:
+                        stat = path.stat()
+                    except OSError:
+                        continue
+                    found.append((stat.st_mtime, path, stat.st_size))
+            found.sort()
+            self._entries = OrderedDict((path, size) for _, path, size in found)
+            self._total = sum(self._entries.values())
+        return self._entries
+
+    @property
+    def total_bytes(self) -> int:
+        """
+        キャッシュの合計サイズ（バイト）
+        """
+        with self._lock:
+            self._load()
+            return self._total
+
+    def get(self, blob_hash: str, size: int = THUMBNAIL_SIZE) -> Optional[Path]:
+        """
+        サムネイルのパスを返す。なければ作成する
+
+        Args:
+            blob_hash: 元の画像のハッシュ
+            size: 一辺の最大ピクセル数
+
+        Returns:
+            サムネイル（作れない形式やPillowがない場合は元の画像）のパス。元の画像がなければNone
+        """
+        source = self.blobs.path(blob_hash)
+        if not source.exists():
+            return None
+        if Image is None:
+            return source
+
+        path = self.root / blob_hash[:2] / f"{blob_hash}-{size}.png"
+        with self._lock:
+            entries = self._load()
+            if path in entries:
+                entries.move_to_end(path)
+                try:
+                    os.utime(path)
+                    return path
+                except OSError:
+                    # 他のプロセスが消した
+                    self._total -= entries.pop(path)
+
+        try:
+            with Image.open(source) as image:
+                image.thumbnail((size, size))
+                _write_atomic(path, lambda f: image.save(f, format='PNG'))
+        except (OSError, ValueError) as e:
+            # SVGなどPillowで開けない形式
+            logger.debug(f"サムネイルを作成できませんでした: {source}: {e}")
+            return source
+
+        file_size = path.stat().st_size
+        with self._lock:
+            entries = self._load()
+            self._total += file_size - entries.pop(path, 0)
+            entries[path] = file_size
+            self._evict()
+        return path
+
+    def _evict(self) -> None:
+        """
+        上限を超えている間、最後に使ったのが古いサムネイルから消す（直前に使ったものは残す）
+        """
+        while self._total > self.max_bytes and len(self._entries) > 1:
+            path, size = self._entries.popitem(last=False)
+            self._total -= size
+            try:
+                path.unlink()
+            except FileNotFoundError:
+                pass
+
+    def clear(self) -> None:
+        """
+        サムネイルをすべて消す
+        """
+        with self._lock:
+            for path in self._load():
+                try:
+                    path.unlink()
+                except FileNotFoundError:
+                    pass
+            self._entries.clear()
+            self._total = 0
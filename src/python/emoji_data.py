@@ -7,8 +7,18 @@ import json
 import os
 import sqlite3
 import logging
+import threading
+import time
+from collections import deque
 from pathlib import Path
-from typing import List, Dict, Any, Optional, Tuple
+from urllib.parse import urlencode
+from typing import List, Dict, Any, Optional, Tuple, Callable, Sequence, NamedTuple, TextIO, Iterator
+
+from category_pages import overlay_favorites
+from custom_emoji import THUMBNAIL_SIZE, BlobStore, StoredImage, ThumbnailCache, custom_emoji_keywords, find_images
+from fuzzy_index import FuzzyIndex
+from search_query import ParsedQuery, QueryTerm, parse_query
+from text_normalize import emoji_key, normalize_query, normalize_text, split_emoji_key
 
 # ロギング設定
 logging.basicConfig(
@@ -17,75 +27,881 @@ logging.basicConfig(
 )
 logger = logging.getLogger('emoji-data')
 
+# 共有カタログをメモリマップで読む上限サイズ（バイト）
+CATALOG_MMAP_SIZE = 256 * 1024 * 1024
+
+# ロック待ち（SQLITE_BUSY）の再試行間隔（秒）。最初の間隔から倍々に延ばし、上限で頭打ちにする
+BUSY_RETRY_INITIAL_DELAY = 0.001
+BUSY_RETRY_MAX_DELAY = 0.05
+
+# 連続したコピーを「続けて使った」とみなす最大の間隔（分）。これより空いた組は遷移に数えない
+TRANSITION_MAX_GAP_MINUTES = 30
+
+# 使用回数の集計期間 → (集計表, 期間の列, used_atから期間の初日を求めるSQLiteの日付関数の修飾子)。
+# 日付はused_atと同じUTCで区切り、週は月曜始まり
+USAGE_WINDOWS = {
+    'day': ('usage_daily', 'day', "'start of day'"),
+    'week': ('usage_weekly', 'week', "'weekday 0', '-6 days'"),
+}
+
+# 急上昇の判定で、今日の使用回数の上位から候補にする件数（返す件数に対する倍率）
+TRENDING_CANDIDATE_FACTOR = 5
+
+# 急上昇の比較対象にする直前の日数
+TRENDING_BASELINE_DAYS = 7
+
+# エクスポート形式（JSON Lines）のバージョン
+EXPORT_FORMAT_VERSION = 1
+
+# エクスポート時に一度に取り出して書き込む行数
+EXPORT_FETCH_SIZE = 10000
+
+# インポート中のページキャッシュの大きさ（PRAGMA cache_sizeの値。負数はKiB単位）
+IMPORT_CACHE_SIZE = -65536
+
+# カスタム絵文字を検索結果に含めるときのグループ名
+CUSTOM_GROUP = 'カスタム'
+
+# ディレクトリからカスタム絵文字を取り込むとき、1トランザクションで登録する件数
+CUSTOM_IMPORT_BATCH_SIZE = 5000
+
+# 変更カウンターで変更を通知するテーブル
+CHANGE_FEED_TABLES = ('favorites', 'history', 'custom_emojis')
+
+# suspended_triggersに名前のあるテーブルのトリガーは動かない。一括取り込みのトランザクション内だけで使い、
+# 行ごとのトリガーの代わりに集合演算でまとめて反映する（コミット前に空に戻すので他の接続からは見えない）
+_CHANGE_TRIGGERS = ''.join(
+    f"CREATE TRIGGER IF NOT EXISTS trg_{table}_{event.lower()}_changes AFTER {event} ON {table}\n"
+    f"WHEN NOT EXISTS (SELECT 1 FROM suspended_triggers WHERE name = '{table}')\n"
+    f"BEGIN\n"
+    f"  UPDATE change_counters SET version = version + 1 WHERE name = '{table}';\n"
+    f"END;\n"
+    for table in CHANGE_FEED_TABLES for event in ('INSERT', 'UPDATE', 'DELETE')
+)
+
+_USAGE_UPSERTS = ''.join(
+    f"  INSERT INTO {table} ({column}, emoji_id) VALUES (date(NEW.used_at, {modifiers}), NEW.emoji_id)\n"
+    f"  ON CONFLICT ({column}, emoji_id) DO UPDATE SET count = count + 1;\n"
+    for table, column, modifiers in USAGE_WINDOWS.values()
+)
+
+# 利用者ごとのデータベースのスキーマ。カタログ（絵文字・キーワード）は含めず、
+# 読み取り専用の共有カタログをATTACHして参照する
+USER_SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS favorites (
+  id INTEGER PRIMARY KEY AUTOINCREMENT,
+  emoji_id INTEGER NOT NULL,
+  position INTEGER NOT NULL DEFAULT 0,
+  created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+CREATE TABLE IF NOT EXISTS history (
+  id INTEGER PRIMARY KEY AUTOINCREMENT,
+  emoji_id INTEGER NOT NULL,
+  used_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+CREATE UNIQUE INDEX IF NOT EXISTS idx_favorites_emoji_id_unique ON favorites(emoji_id);
+CREATE INDEX IF NOT EXISTS idx_favorites_position ON favorites(position, emoji_id);
+CREATE INDEX IF NOT EXISTS idx_history_used_at ON history(used_at);
+CREATE TABLE IF NOT EXISTS emoji_transitions (
+  prev_id INTEGER NOT NULL,
+  next_id INTEGER NOT NULL,
+  count INTEGER NOT NULL DEFAULT 1,
+  PRIMARY KEY (prev_id, next_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_emoji_transitions_rank ON emoji_transitions(prev_id, count DESC, next_id);
+CREATE TABLE IF NOT EXISTS suspended_triggers (
+  name TEXT PRIMARY KEY
+) WITHOUT ROWID;
+CREATE TRIGGER IF NOT EXISTS trg_history_transitions AFTER INSERT ON history
+WHEN NOT EXISTS (SELECT 1 FROM suspended_triggers WHERE name = 'history')
+BEGIN
+  INSERT INTO emoji_transitions (prev_id, next_id, count)
+  SELECT h.emoji_id, NEW.emoji_id, 1
+  FROM history h
+  WHERE h.id = (SELECT MAX(id) FROM history WHERE id < NEW.id)
+    AND julianday(NEW.used_at) - julianday(h.used_at) <= {TRANSITION_MAX_GAP_MINUTES} / 1440.0
+  ON CONFLICT (prev_id, next_id) DO UPDATE SET count = count + 1;
+END;
+CREATE TABLE IF NOT EXISTS usage_daily (
+  day TEXT NOT NULL,
+  emoji_id INTEGER NOT NULL,
+  count INTEGER NOT NULL DEFAULT 1,
+  PRIMARY KEY (day, emoji_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_usage_daily_rank ON usage_daily(day, count DESC, emoji_id);
+CREATE INDEX IF NOT EXISTS idx_usage_daily_emoji ON usage_daily(emoji_id, day, count);
+CREATE TABLE IF NOT EXISTS usage_weekly (
+  week TEXT NOT NULL,
+  emoji_id INTEGER NOT NULL,
+  count INTEGER NOT NULL DEFAULT 1,
+  PRIMARY KEY (week, emoji_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_usage_weekly_rank ON usage_weekly(week, count DESC, emoji_id);
+CREATE TRIGGER IF NOT EXISTS trg_history_usage AFTER INSERT ON history
+WHEN NOT EXISTS (SELECT 1 FROM suspended_triggers WHERE name = 'history')
+BEGIN
+{_USAGE_UPSERTS}END;
+CREATE TABLE IF NOT EXISTS custom_emojis (
+  id INTEGER PRIMARY KEY,
+  name TEXT NOT NULL UNIQUE,
+  blob_hash TEXT NOT NULL,
+  mime TEXT NOT NULL,
+  created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+CREATE INDEX IF NOT EXISTS idx_custom_emojis_blob_hash ON custom_emojis(blob_hash);
+CREATE TABLE IF NOT EXISTS custom_keywords (
+  emoji_id INTEGER NOT NULL,
+  keyword TEXT NOT NULL,
+  PRIMARY KEY (emoji_id, keyword)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS custom_keyword_suffixes (
+  suffix TEXT NOT NULL,
+  emoji_id INTEGER NOT NULL,
+  PRIMARY KEY (suffix, emoji_id)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS change_counters (
+  name TEXT PRIMARY KEY,
+  version INTEGER NOT NULL DEFAULT 0
+) WITHOUT ROWID;
+INSERT OR IGNORE INTO change_counters (name) VALUES {', '.join(f"('{table}')" for table in CHANGE_FEED_TABLES)};
+{_CHANGE_TRIGGERS}
+"""
+
+def sqlite_uri(path: str, **params: Any) -> str:
+    """
+    ファイルパスをSQLiteのURIファイル名に変換する
+    
+    Args:
+        path: データベースファイルのパス
+        params: URIのクエリパラメータ（mode, immutableなど）
+        
+    Returns:
+        file: 形式のURI
+    """
+    uri = Path(path).resolve().as_uri()
+    return f"{uri}?{urlencode(params)}" if params else uri
+
+# 実行時間ヒストグラムのバケット上限（ミリ秒）
+LATENCY_BUCKETS_MS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, float('inf'))
+
+class QueryEvent(NamedTuple):
+    """
+    クエリ1回分の計測結果。フックとスロークエリログに渡される
+    """
+    method: str
+    sql: str
+    params: Tuple[Any, ...]
+    elapsed_ms: float
+    row_count: int
+    plan: Optional[List[str]] = None
+
+QueryHook = Callable[[QueryEvent], None]
+
+class CategoryNames(NamedTuple):
+    """
+    カタログのgroups / subgroupsテーブルの内容。カタログは読み取り専用なので最初に一度だけ読む
+    """
+    # グループID → グループ名（sort_order順）
+    group_names: Dict[int, str]
+    # サブグループID → サブグループ名
+    subgroup_names: Dict[int, str]
+    # サブグループID → sort_order（カタログ順）
+    subgroup_orders: Dict[int, int]
+    # グループ名 → グループID
+    group_ids: Dict[str, int]
+    # サブグループ名 → (グループID, サブグループID) のリスト（別のグループに同じ名前があってもよい）
+    subgroup_ids: Dict[str, List[Tuple[int, int]]]
+    # (グループ名, サブグループ名, 絵文字数, sort_order) のリスト（get_category_treeの元）
+    counts: List[Tuple[str, str, int, int]]
+
+# 変更されたテーブル名から新しい変更カウンターへの辞書を受け取るコールバック
+ChangeSubscriber = Callable[[Dict[str, int]], None]
+
+def is_busy_error(error: sqlite3.Error) -> bool:
+    """
+    他の接続がロックを持っているために失敗したか（SQLITE_BUSY / SQLITE_LOCKED）
+    """
+    code = getattr(error, 'sqlite_errorcode', None)
+    if code is not None:
+        return code & 0xFF in (sqlite3.SQLITE_BUSY, sqlite3.SQLITE_LOCKED)
+    return isinstance(error, sqlite3.OperationalError) and 'locked' in str(error)
+
+class QueryStats:
+    """
+    メソッドごとのクエリ実行時間を集計するヒストグラム
+    """
+    
+    def __init__(self):
+        self.count = 0
+        self.rows = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.buckets = [0] * len(LATENCY_BUCKETS_MS)
+        self.busy_retries = 0
+        self.lock_wait_ms = 0.0
+    
+    def record(self, elapsed_ms: float, row_count: int) -> None:
+        """
+        1回分の実行時間と行数を加算する
+        """
+        self.count += 1
+        self.rows += max(row_count, 0)
+        self.total_ms += elapsed_ms
+        self.max_ms = max(self.max_ms, elapsed_ms)
+        for i, bound in enumerate(LATENCY_BUCKETS_MS):
+            if elapsed_ms <= bound:
+                self.buckets[i] += 1
+                break
+    
+    def record_busy(self, retries: int, wait_ms: float) -> None:
+        """
+        ロック待ちで再試行した回数と待った時間を加算する
+        """
+        self.busy_retries += retries
+        self.lock_wait_ms += wait_ms
+    
+    def percentile(self, pct: float) -> float:
+        """
+        ヒストグラムからパーセンタイルを推定する（該当バケットの上限値）
+        
+        Args:
+            pct: パーセンタイル（0〜100）
+            
+        Returns:
+            推定値（ミリ秒）。最上位バケットの場合は観測した最大値
+        """
+        if self.count == 0:
+            return 0.0
+        threshold = pct / 100 * self.count
+        seen = 0
+        for bound, n in zip(LATENCY_BUCKETS_MS, self.buckets):
+            seen += n
+            if seen >= threshold and n:
+                return min(bound, self.max_ms)
+        return self.max_ms
+    
+    def to_dict(self) -> Dict[str, Any]:
+        """
+        集計結果を辞書で返す
+        """
+        return {
+            'count': self.count,
+            'rows': self.rows,
+            'total_ms': round(self.total_ms, 3),
+            'mean_ms': round(self.total_ms / self.count, 3) if self.count else 0.0,
+            'p50_ms': round(self.percentile(50), 3),
+            'p95_ms': round(self.percentile(95), 3),
+            'p99_ms': round(self.percentile(99), 3),
+            'max_ms': round(self.max_ms, 3),
+            'busy_retries': self.busy_retries,
+            'lock_wait_ms': round(self.lock_wait_ms, 3),
+            'histogram': {
+                ('+inf' if bound == float('inf') else f"{bound:g}"): n
+                for bound, n in zip(LATENCY_BUCKETS_MS, self.buckets)
+            },
+        }
+
 class EmojiData:
     """
     絵文字データの操作とデータベース接続を管理するクラス
     """
     
-    def __init__(self, db_path: str = None):
+    def __init__(self, db_path: str = None, slow_query_ms: Optional[float] = None,
+                 explain_slow_queries: bool = False, catalog_path: str = None,
+                 busy_timeout: float = 5.0, custom_dir: str = None):
         """
         EmojiDataクラスのインスタンスを初期化
         
+        お気に入りと履歴は利用者ごとの小さなデータベース（db_path）に保存し、
+        絵文字カタログは全利用者で共有する読み取り専用ファイル（catalog_path）を
+        immutableモードでATTACHして参照する。
+        
         Args:
-            db_path: SQLiteデータベースファイルへのパス。指定がなければデフォルトパスを使用
+            db_path: 利用者ごとのSQLiteデータベースファイルへのパス。指定がなければデフォルトパスを使用
+            slow_query_ms: この時間（ミリ秒）以上かかったクエリをスロークエリとして記録する。Noneなら無効
+            explain_slow_queries: スロークエリのEXPLAIN QUERY PLANを取得する
+            catalog_path: 絵文字カタログのデータベースへのパス。指定がなければアプリ同梱のものを使用
+            busy_timeout: 他の接続が書き込み中のとき、ロックが空くのを待つ最大秒数
+            custom_dir: カスタム絵文字の画像とサムネイルを置くディレクトリ。指定がなければ利用者データベースの隣
         """
         # デフォルトのデータベースパス
         if db_path is None:
             # アプリのデータディレクトリを取得
             app_data_dir = os.environ.get('APPDATA') if os.name == 'nt' else os.path.expanduser('~/.local/share')
-            db_path = os.path.join(app_data_dir, 'emoji-copier', 'data', 'emojis.db')
+            db_path = os.path.join(app_data_dir, 'emoji-copier', 'data', 'user.db')
+        
+        if catalog_path is None:
+            # アプリケーションのディレクトリに同梱されたカタログ
+            app_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+            catalog_path = os.path.join(app_dir, 'data', 'emojis.db')
+        
+        if custom_dir is None:
+            custom_dir = os.path.join(os.path.dirname(os.path.abspath(db_path)), 'custom')
         
         self.db_path = db_path
+        self.catalog_path = catalog_path
+        self.custom_dir = custom_dir
+        self.blobs = BlobStore(os.path.join(custom_dir, 'objects'))
         self.conn = None
+        self.slow_query_ms = slow_query_ms
+        self.explain_slow_queries = explain_slow_queries
+        self.busy_timeout = busy_timeout
+        self.slow_queries = deque(maxlen=100)
+        self._query_hooks: List[QueryHook] = []
+        self._stats: Dict[str, QueryStats] = {}
+        self._fuzzy_index: Optional[FuzzyIndex] = None
+        self._categories: Optional[CategoryNames] = None
+        self._category_tree: Optional[List[Dict[str, Any]]] = None
+        self._thumbnails: Optional[ThumbnailCache] = None
+        self._favorite_bits: Optional[Tuple[int, int]] = None
+        self._change_subscribers: List[ChangeSubscriber] = []
+        self._change_marker: Optional[Tuple[int, int]] = None
+        self._change_versions: Dict[str, int] = {}
+        self._watcher: Optional[threading.Thread] = None
+        self._watcher_stop = threading.Event()
         self.ensure_db_exists()
     
     def ensure_db_exists(self) -> None:
         """
-        指定されたパスにデータベースが存在することを確認します。
-        存在しない場合は、デフォルトの場所からコピーするか、エラーをログに記録します。
+        カタログが存在し、利用者データベースを作成できることを確認します。
+        カタログが見つからない場合は、エラーをログに記録して例外を送出します。
         """
+        if not os.path.exists(self.catalog_path):
+            logger.error(f"絵文字カタログが見つかりません: {self.catalog_path}")
+            raise FileNotFoundError(f"データベースが見つかりません: {self.catalog_path}")
+        
         if not os.path.exists(self.db_path):
-            logger.warning(f"データベースが見つかりません: {self.db_path}")
-            
-            # アプリケーションのディレクトリから探す
-            app_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
-            default_db = os.path.join(app_dir, 'data', 'emojis.db')
-            
-            if os.path.exists(default_db):
-                logger.info(f"デフォルトのデータベースを使用: {default_db}")
-                
-                # データベースのディレクトリが存在することを確認
-                os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
-                
-                # データベースをコピー
-                import shutil
-                shutil.copy2(default_db, self.db_path)
-                logger.info(f"データベースをコピーしました: {default_db} → {self.db_path}")
-            else:
-                logger.error(f"デフォルトのデータベースも見つかりません: {default_db}")
-                raise FileNotFoundError(f"データベースが見つかりません: {self.db_path}")
+            logger.info(f"利用者データベースを作成します: {self.db_path}")
+            # データベースのディレクトリが存在することを確認
+            os.makedirs(os.path.dirname(os.path.abspath(self.db_path)), exist_ok=True)
     
     def connect(self) -> sqlite3.Connection:
         """
-        SQLiteデータベースに接続し、接続オブジェクトを返す
+        利用者データベースに接続してカタログをATTACHし、接続オブジェクトを返す
         """
         if self.conn is None:
             try:
-                self.conn = sqlite3.connect(self.db_path)
-                self.conn.row_factory = sqlite3.Row  # 辞書形式で結果を取得
+                is_new = not os.path.exists(self.db_path)
+                # 他の接続が書き込み中なら、busy_timeout秒までSQLite自身にロックを待たせる
+                conn = sqlite3.connect(sqlite_uri(self.db_path), uri=True, timeout=self.busy_timeout)
+                conn.row_factory = sqlite3.Row  # 辞書形式で結果を取得
+                
+                # カタログは変更されない前提で、ロックも変更検知もなしに読む。
+                # ページはOSのページキャッシュ経由で全プロセスに共有される
+                conn.execute("ATTACH DATABASE ? AS catalog",
+                             (sqlite_uri(self.catalog_path, immutable=1),))
+                conn.execute(f"PRAGMA catalog.mmap_size = {CATALOG_MMAP_SIZE}")
+                
+                existing = {row[0] for row in conn.execute(
+                    "SELECT name FROM main.sqlite_master WHERE name IN ('emoji_transitions', 'usage_daily')"
+                )}
+                self._upgrade_favorites(conn)
+                conn.executescript(USER_SCHEMA)
+                if is_new:
+                    self._migrate_legacy_db(conn)
+                else:
+                    if 'emoji_transitions' not in existing:
+                        self._backfill_transitions(conn)
+                    if 'usage_daily' not in existing:
+                        self._backfill_usage(conn)
+                self.conn = conn
             except sqlite3.Error as e:
                 logger.error(f"データベース接続エラー: {e}")
                 raise
         return self.conn
     
+    def _upgrade_favorites(self, conn: sqlite3.Connection) -> None:
+        """
+        position列のない旧形式のお気に入り表を作り直す。
+        重複した絵文字は最初の1件だけ残し、これまでの表示順（追加日時の新しい順）を位置にする
+        """
+        columns = [row['name'] for row in conn.execute("PRAGMA main.table_info(favorites)")]
+        if not columns or 'position' in columns:
+            return
+        
+        try:
+            with conn:
+                conn.execute("DROP INDEX IF EXISTS main.idx_favorites_emoji_id")
+                conn.execute("ALTER TABLE favorites RENAME TO favorites_old")
+                conn.execute("""
+                CREATE TABLE favorites (
+                  id INTEGER PRIMARY KEY AUTOINCREMENT,
+                  emoji_id INTEGER NOT NULL,
+                  position INTEGER NOT NULL DEFAULT 0,
+                  created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+                """)
+                conn.execute("""
+                INSERT INTO favorites (id, emoji_id, position, created_at)
+                SELECT id, emoji_id, ROW_NUMBER() OVER (ORDER BY created_at DESC, id DESC), created_at
+                FROM favorites_old
+                WHERE id IN (SELECT MIN(id) FROM favorites_old GROUP BY emoji_id)
+                """)
+                conn.execute("DROP TABLE favorites_old")
+            logger.info("お気に入り表を並び順つきの形式に更新しました")
+        except sqlite3.Error as e:
+            logger.error(f"お気に入り表の更新中にエラーが発生しました: {e}")
+            raise
+    
+    def _backfill_transitions(self, conn: sqlite3.Connection) -> None:
+        """
+        遷移表がなかった既存の利用者データベースについて、履歴から一度だけ遷移回数を集計する。
+        以降はhistoryへの挿入時にトリガーで差分更新される
+        """
+        try:
+            with conn:
+                count = self._count_transitions(conn, 0)
+            logger.info(f"履歴から遷移回数を集計しました: {count}件")
+        except sqlite3.Error as e:
+            logger.error(f"遷移回数の集計中にエラーが発生しました: {e}")
+    
+    @staticmethod
+    def _count_transitions(conn: sqlite3.Connection, from_id: int) -> int:
+        """
+        id が from_id 以上の履歴の連続する組を遷移回数に加算する（トランザクションは呼び出し側で張る）
+        
+        Args:
+            conn: 利用者データベースへの接続
+            from_id: 集計を始める履歴のID。この行は直後の行の直前の絵文字としてだけ数える
+            
+        Returns:
+            追加または更新した遷移の組の数
+        """
+        return conn.execute("""
+        INSERT INTO emoji_transitions (prev_id, next_id, count)
+        SELECT prev_id, next_id, COUNT(*)
+        FROM (
+            SELECT
+                LAG(emoji_id) OVER (ORDER BY id) AS prev_id,
+                emoji_id AS next_id,
+                julianday(used_at) - julianday(LAG(used_at) OVER (ORDER BY id)) AS gap
+            FROM history
+            WHERE id >= ?
+        )
+        WHERE prev_id IS NOT NULL AND gap <= ? / 1440.0
+        GROUP BY prev_id, next_id
+        ON CONFLICT (prev_id, next_id) DO UPDATE SET count = count + excluded.count
+        """, (from_id, TRANSITION_MAX_GAP_MINUTES)).rowcount
+    
+    def _backfill_usage(self, conn: sqlite3.Connection) -> None:
+        """
+        集計表がなかった既存の利用者データベースについて、履歴から一度だけ日別・週別の使用回数を集計する。
+        以降はhistoryへの挿入時にトリガーで差分更新される
+        """
+        try:
+            with conn:
+                count = self._count_usage(conn, 0)
+            logger.info(f"履歴から使用回数を集計しました: {count}件")
+        except sqlite3.Error as e:
+            logger.error(f"使用回数の集計中にエラーが発生しました: {e}")
+    
+    @staticmethod
+    def _count_usage(conn: sqlite3.Connection, after_id: int) -> int:
+        """
+        id が after_id より大きい履歴を日別・週別の使用回数に加算する（トランザクションは呼び出し側で張る）
+        
+        Args:
+            conn: 利用者データベースへの接続
+            after_id: 集計済みの最後の履歴のID
+            
+        Returns:
+            追加または更新した集計行の数
+        """
+        count = 0
+        for table, column, modifiers in USAGE_WINDOWS.values():
+            count += conn.execute(f"""
+            INSERT INTO {table} ({column}, emoji_id, count)
+            SELECT date(used_at, {modifiers}), emoji_id, COUNT(*)
+            FROM history
+            WHERE id > ?
+            GROUP BY 1, 2
+            ON CONFLICT ({column}, emoji_id) DO UPDATE SET count = count + excluded.count
+            """, (after_id,)).rowcount
+        return count
+    
+    def _migrate_legacy_db(self, conn: sqlite3.Connection) -> None:
+        """
+        以前のバージョンで利用者ごとにコピーしていたデータベース（emojis.db）から
+        お気に入りと履歴を引き継ぐ。絵文字IDはunicodeで現在のカタログに対応付ける
+        """
+        legacy_path = os.path.join(os.path.dirname(os.path.abspath(self.db_path)), 'emojis.db')
+        if not os.path.exists(legacy_path) or os.path.samefile(legacy_path, self.catalog_path):
+            return
+        
+        try:
+            conn.execute("ATTACH DATABASE ? AS legacy", (sqlite_uri(legacy_path, mode='ro'),))
+            with conn:
+                favorites = conn.execute("""
+                INSERT OR IGNORE INTO main.favorites (emoji_id, position, created_at)
+                SELECT c.id, ROW_NUMBER() OVER (ORDER BY f.created_at DESC, f.id DESC), f.created_at
+                FROM legacy.favorites f
+                JOIN legacy.emojis le ON le.id = f.emoji_id
+                JOIN catalog.emojis c ON c.unicode = le.unicode
+                ORDER BY f.id
+                """).rowcount
+                history = conn.execute("""
+                INSERT INTO main.history (emoji_id, used_at)
+                SELECT c.id, h.used_at
+                FROM legacy.history h
+                JOIN legacy.emojis le ON le.id = h.emoji_id
+                JOIN catalog.emojis c ON c.unicode = le.unicode
+                ORDER BY h.id
+                """).rowcount
+            logger.info(f"旧データベースから移行しました: お気に入り{favorites}件, 履歴{history}件 ({legacy_path})")
+        except sqlite3.Error as e:
+            logger.error(f"旧データベースの移行中にエラーが発生しました: {e}")
+        finally:
+            try:
+                conn.execute("DETACH DATABASE legacy")
+            except sqlite3.Error:
+                pass
+    
     def close(self) -> None:
         """
         データベース接続を閉じる
         """
+        self.stop_watching()
         if self.conn:
             self.conn.close()
             self.conn = None
     
+    def get_change_versions(self) -> Dict[str, int]:
+        """
+        テーブルごとの変更カウンターを取得する。
+        どのプロセスが変更しても、コミットごとにトリガーで単調に増える
+        
+        Returns:
+            テーブル名（favorites, history, custom_emojis）から変更カウンターへの辞書
+        """
+        try:
+            rows = self._execute('get_change_versions', "SELECT name, version FROM change_counters")
+            return {row['name']: row['version'] for row in rows}
+        except sqlite3.Error as e:
+            logger.error(f"変更カウンターの取得中にエラーが発生しました: {e}")
+            return {}
+    
+    def subscribe_changes(self, subscriber: ChangeSubscriber) -> None:
+        """
+        お気に入りや履歴が変更されたときに呼ばれるコールバックを登録する
+        
+        コールバックはpoll_changesを呼んだスレッド、またはstart_watchingの監視スレッドから呼ばれる。
+        
+        Args:
+            subscriber: 変更されたテーブル名から新しい変更カウンターへの辞書を受け取る呼び出し可能オブジェクト
+        """
+        self._change_subscribers.append(subscriber)
+    
+    def unsubscribe_changes(self, subscriber: ChangeSubscriber) -> None:
+        """
+        登録済みのコールバックを解除する
+        """
+        if subscriber in self._change_subscribers:
+            self._change_subscribers.remove(subscriber)
+    
+    def _diff_versions(self, versions: Dict[str, int]) -> Dict[str, int]:
+        """
+        前回の変更カウンターと比べて変わったテーブルを求め、購読者に通知する
+        """
+        changed = {name: version for name, version in versions.items()
+                   if self._change_versions.get(name) != version}
+        self._change_versions = versions
+        self._notify_changes(changed)
+        return changed
+    
+    def _notify_changes(self, changed: Dict[str, int]) -> None:
+        """
+        変更があれば購読者に通知する。コールバックの例外は記録して無視する
+        """
+        if not changed:
+            return
+        for subscriber in list(self._change_subscribers):
+            try:
+                subscriber(changed)
+            except Exception as e:
+                logger.error(f"変更通知のコールバックでエラーが発生しました: {e}")
+    
+    def poll_changes(self) -> Dict[str, int]:
+        """
+        前回の呼び出し以降にお気に入りや履歴が変更されたかを調べる
+        
+        他の接続のコミットはPRAGMA data_version、この接続での変更はtotal_changesで検知する。
+        どちらも変わっていなければテーブルを読まずに戻るので、頻繁に呼んでも負荷はほとんどない。
+        
+        Returns:
+            変更されたテーブル名から新しい変更カウンターへの辞書（変更がなければ空）
+        """
+        conn = self.connect()
+        try:
+            marker = (conn.execute("PRAGMA main.data_version").fetchone()[0], conn.total_changes)
+            if marker == self._change_marker:
+                return {}
+            first = self._change_marker is None
+            self._change_marker = marker
+            versions = self.get_change_versions()
+            if first:
+                # 初回は基準を記録するだけ
+                self._change_versions = versions
+                return {}
+            return self._diff_versions(versions)
+        except sqlite3.Error as e:
+            logger.error(f"変更の確認中にエラーが発生しました: {e}")
+            return {}
+    
+    def start_watching(self, interval: float = 0.5) -> None:
+        """
+        別スレッドでデータベースの変更を監視し、変更があれば購読者に通知する
+        
+        監視スレッドは専用の読み取り専用接続でPRAGMA data_versionだけを定期的に確かめ、
+        値が変わったときにだけ変更カウンターを読む。この接続を含むすべての接続の変更が通知される。
+        
+        Args:
+            interval: data_versionを確かめる間隔（秒）
+        """
+        if self._watcher is not None:
+            return
+        self.connect()  # スキーマを作成しておく
+        self._watcher_stop.clear()
+        self._watcher = threading.Thread(target=self._watch_loop, args=(interval,),
+                                         name='emoji-data-watcher', daemon=True)
+        self._watcher.start()
+    
+    def stop_watching(self) -> None:
+        """
+        変更の監視を止める
+        """
+        if self._watcher is None:
+            return
+        self._watcher_stop.set()
+        self._watcher.join()
+        self._watcher = None
+    
+    def _watch_loop(self, interval: float) -> None:
+        """
+        監視スレッドの本体
+        """
+        try:
+            conn = sqlite3.connect(sqlite_uri(self.db_path, mode='ro'), uri=True)
+        except sqlite3.Error as e:
+            logger.error(f"変更監視用の接続に失敗しました: {e}")
+            return
+        
+        try:
+            versions = dict(conn.execute("SELECT name, version FROM change_counters").fetchall())
+            data_version = conn.execute("PRAGMA data_version").fetchone()[0]
+            while not self._watcher_stop.wait(interval):
+                current = conn.execute("PRAGMA data_version").fetchone()[0]
+                if current == data_version:
+                    continue
+                data_version = current
+                latest = dict(conn.execute("SELECT name, version FROM change_counters").fetchall())
+                changed = {name: version for name, version in latest.items()
+                           if versions.get(name) != version}
+                versions = latest
+                self._notify_changes(changed)
+        except sqlite3.Error as e:
+            logger.error(f"変更の監視中にエラーが発生しました: {e}")
+        finally:
+            conn.close()
+    
+    def add_query_hook(self, hook: QueryHook) -> None:
+        """
+        クエリ実行ごとに呼ばれるフックを登録する
+        
+        Args:
+            hook: QueryEventを受け取る呼び出し可能オブジェクト
+        """
+        self._query_hooks.append(hook)
+    
+    def remove_query_hook(self, hook: QueryHook) -> None:
+        """
+        登録済みのフックを解除する
+        """
+        if hook in self._query_hooks:
+            self._query_hooks.remove(hook)
+    
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """
+        メソッドごとのクエリ統計（件数、行数、パーセンタイル、ヒストグラム）を取得
+        
+        Returns:
+            メソッド名をキーとする統計の辞書
+        """
+        return {method: stats.to_dict() for method, stats in sorted(self._stats.items())}
+    
+    def reset_stats(self) -> None:
+        """
+        クエリ統計とスロークエリログを消去する
+        """
+        self._stats.clear()
+        self.slow_queries.clear()
+    
+    def _execute(self, method: str, sql: str, params: Sequence[Any] = (),
+                 fetch: Optional[str] = 'all') -> Any:
+        """
+        SQLを実行し、実行時間と行数を記録する
+        
+        Args:
+            method: 呼び出し元のメソッド名（統計の集計キー）
+            sql: 実行するSQL
+            params: バインドパラメータ
+            fetch: 'all'なら全行、'one'なら1行を返す。Noneならカーソルを返す
+            
+        Returns:
+            取得した行、またはカーソル
+        """
+        conn = self.connect()
+        params = tuple(params)
+        
+        def run() -> Tuple[Any, int]:
+            cursor = conn.execute(sql, params)
+            if fetch == 'all':
+                rows = cursor.fetchall()
+                return rows, len(rows)
+            if fetch == 'one':
+                row = cursor.fetchone()
+                return row, 0 if row is None else 1
+            return cursor, cursor.rowcount
+        
+        start = time.perf_counter()
+        result, row_count = self._retry_busy(method, run)
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        self._record_query(method, sql, params, elapsed_ms, row_count)
+        return result
+    
+    def _retry_busy(self, method: str, operation: Callable[[], Any]) -> Any:
+        """
+        ロック待ち（SQLITE_BUSY）で失敗した操作を、busy_timeout秒まで間隔を延ばしながら再試行する
+        
+        通常のロック待ちは接続のbusy_timeoutでSQLite自身が待つ。ここで再試行するのは、
+        デッドロックを避けるためにSQLiteが待たずに返したSQLITE_BUSYだけになる
+        
+        Args:
+            method: 統計の集計キー
+            operation: 実行する操作
+            
+        Returns:
+            操作の戻り値
+        """
+        retries = 0
+        delay = BUSY_RETRY_INITIAL_DELAY
+        start = time.perf_counter()
+        deadline = start + self.busy_timeout
+        try:
+            while True:
+                try:
+                    return operation()
+                except sqlite3.OperationalError as e:
+                    now = time.perf_counter()
+                    if not is_busy_error(e) or now >= deadline:
+                        raise
+                    time.sleep(min(delay, deadline - now))
+                    delay = min(delay * 2, BUSY_RETRY_MAX_DELAY)
+                    retries += 1
+        finally:
+            if retries:
+                wait_ms = (time.perf_counter() - start) * 1000
+                self._stats.setdefault(method, QueryStats()).record_busy(retries, wait_ms)
+    
+    def _commit(self, method: str) -> None:
+        """
+        トランザクションをコミットする。読み取り中の接続がありロックを取れなければ再試行する
+        """
+        self._retry_busy(method, self.connect().commit)
+    
+    def _record_query(self, method: str, sql: str, params: Tuple[Any, ...],
+                      elapsed_ms: float, row_count: int) -> None:
+        """
+        統計を更新し、スロークエリの記録とフックの呼び出しを行う
+        """
+        self._stats.setdefault(method, QueryStats()).record(elapsed_ms, row_count)
+        
+        is_slow = self.slow_query_ms is not None and elapsed_ms >= self.slow_query_ms
+        if not is_slow and not self._query_hooks:
+            return
+        
+        plan = self._explain(sql, params) if is_slow and self.explain_slow_queries else None
+        event = QueryEvent(method, sql, params, elapsed_ms, row_count, plan)
+        
+        if is_slow:
+            self.slow_queries.append(event)
+            logger.warning(
+                f"スロークエリ ({method}): {elapsed_ms:.1f}ms, {row_count}行, "
+                f"SQL: {' '.join(sql.split())}, パラメータ: {params}"
+                + (f", プラン: {' / '.join(plan)}" if plan else "")
+            )
+        
+        for hook in list(self._query_hooks):
+            try:
+                hook(event)
+            except Exception as e:
+                logger.error(f"クエリフックでエラーが発生しました: {e}")
+    
+    def _explain(self, sql: str, params: Tuple[Any, ...]) -> Optional[List[str]]:
+        """
+        EXPLAIN QUERY PLANの結果を取得する
+        """
+        try:
+            rows = self.connect().execute(f"EXPLAIN QUERY PLAN {sql}", params).fetchall()
+            return [row[-1] for row in rows]
+        except sqlite3.Error as e:
+            logger.error(f"クエリプランの取得に失敗しました: {e}")
+            return None
+    
+    def _get_categories(self) -> CategoryNames:
+        """
+        グループ・サブグループのIDと名前の対応を返す（初回のみ読み込む）
+        """
+        if self._categories is None:
+            group_names = {row['id']: row['name'] for row in self._execute('_get_categories', """
+            SELECT id, name FROM groups ORDER BY sort_order
+            """)}
+            subgroup_names: Dict[int, str] = {}
+            subgroup_orders: Dict[int, int] = {}
+            subgroup_ids: Dict[str, List[Tuple[int, int]]] = {}
+            counts = []
+            for row in self._execute('_get_categories', """
+            SELECT id, group_id, name, sort_order, emoji_count FROM subgroups ORDER BY sort_order
+            """):
+                subgroup_names[row['id']] = row['name']
+                subgroup_orders[row['id']] = row['sort_order']
+                subgroup_ids.setdefault(row['name'], []).append((row['group_id'], row['id']))
+                counts.append((group_names[row['group_id']], row['name'], row['emoji_count'], row['sort_order']))
+            self._categories = CategoryNames(
+                group_names=group_names,
+                subgroup_names=subgroup_names,
+                subgroup_orders=subgroup_orders,
+                group_ids={name: group_id for group_id, name in group_names.items()},
+                subgroup_ids=subgroup_ids,
+                counts=counts,
+            )
+        return self._categories
+    
+    def _resolve_categories(self, emoji: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        行のgroup_id / subgroup_idを、キャッシュした対応からgroup_name / subgroupの名前に置き換える
+        """
+        categories = self._get_categories()
+        emoji['group_name'] = categories.group_names.get(emoji.pop('group_id'), '')
+        emoji['subgroup'] = categories.subgroup_names.get(emoji.pop('subgroup_id'), '')
+        return emoji
+    
+    def _group_condition(self, group: str, alias: str = 'e') -> Tuple[str, List[Any]]:
+        """
+        グループ名での絞り込み条件。名前はキャッシュした対応でIDにしてから比較する
+        （存在しないグループはID 0になり、どの絵文字にも一致しない）
+        """
+        return f"{alias}.group_id = ?", [self._get_categories().group_ids.get(group, 0)]
+    
+    def _subgroup_condition(self, subgroup: str, alias: str = 'e') -> Tuple[str, List[Any]]:
+        """
+        サブグループ名での絞り込み条件。(グループID, サブグループID) で比較し、idx_emojis_categoryで引く
+        """
+        pairs = self._get_categories().subgroup_ids.get(subgroup)
+        if not pairs:
+            return "0", []
+        condition = " OR ".join([f"({alias}.group_id = ? AND {alias}.subgroup_id = ?)"] * len(pairs))
+        return f"({condition})", [value for pair in pairs for value in pair]
+    
     def get_emoji_by_id(self, emoji_id: int) -> Optional[Dict[str, Any]]:
         """
         IDから絵文字データを取得
@@ -96,349 +912,1942 @@ class EmojiData:
         Returns:
             絵文字データの辞書、見つからない場合はNone
         """
-        conn = self.connect()
-        cursor = conn.cursor()
-        
         try:
             query = """
             SELECT 
-                e.id, e.unicode, e.short_name, e.group_name, e.subgroup,
+                e.id, e.unicode, e.short_name, e.group_id, e.subgroup_id,
+                e.status, e.emoji_version,
+                GROUP_CONCAT(k.keyword, ',') as keywords,
+                CASE WHEN f.emoji_id IS NOT NULL THEN 1 ELSE 0 END as is_favorite
+            FROM 
+                emojis e
+            LEFT JOIN 
+                emoji_keywords ek ON e.id = ek.emoji_id
+            LEFT JOIN 
+                keywords k ON ek.keyword_id = k.id
+            LEFT JOIN 
+                favorites f ON e.id = f.emoji_id
+            WHERE 
+                e.id = ?
+            GROUP BY 
+                e.id
+            """
+            row = self._execute('get_emoji_by_id', query, (emoji_id,), fetch='one')
+            
+            if row:
+                # SQLite Rowオブジェクトを辞書に変換
+                emoji = dict(row)
+                emoji['keywords'] = emoji['keywords'].split(',') if emoji['keywords'] else []
+                emoji['is_favorite'] = bool(emoji['is_favorite'])
+                self._resolve_categories(emoji)
+                return emoji
+            return None
+        except sqlite3.Error as e:
+            logger.error(f"絵文字取得中にエラーが発生しました: {e}")
+            return None
+    
+    def lookup_by_unicode(self, text: str) -> Optional[Dict[str, Any]]:
+        """
+        貼り付けられた絵文字をカタログの絵文字に逆引きする
+        
+        異体字セレクタ（U+FE0F）の有無や肌の色の修飾子が違っていても、
+        照合用のキー（emojis.unicode_key）の索引で同じ絵文字を引く。
+        
+        Args:
+            text: 絵文字の文字列
+            
+        Returns:
+            絵文字データの辞書（取り除いた肌の色の修飾子をmodifiersに含む）、見つからない場合はNone
+        """
+        key, modifiers = split_emoji_key(text)
+        if not key:
+            return None
+        
+        try:
+            row = self._execute('lookup_by_unicode', """
+            SELECT 
+                e.id, e.unicode, e.short_name, e.group_id, e.subgroup_id,
+                GROUP_CONCAT(k.keyword, ',') as keywords,
+                CASE WHEN f.emoji_id IS NOT NULL THEN 1 ELSE 0 END as is_favorite
+            FROM (
+                SELECT id FROM emojis
+                WHERE unicode_key = ?
+                ORDER BY unicode = ? DESC, id
+                LIMIT 1
+            ) m
+            JOIN 
+                emojis e ON e.id = m.id
+            LEFT JOIN 
+                emoji_keywords ek ON e.id = ek.emoji_id
+            LEFT JOIN 
+                keywords k ON ek.keyword_id = k.id
+            LEFT JOIN 
+                favorites f ON e.id = f.emoji_id
+            GROUP BY 
+                e.id
+            """, (key, text), fetch='one')
+            
+            if row:
+                emoji = dict(row)
+                emoji['keywords'] = emoji['keywords'].split(',') if emoji['keywords'] else []
+                emoji['is_favorite'] = bool(emoji['is_favorite'])
+                self._resolve_categories(emoji)
+                emoji['modifiers'] = modifiers
+                return emoji
+            return None
+        except sqlite3.Error as e:
+            logger.error(f"絵文字の逆引き中にエラーが発生しました: {e}")
+            return None
+    
+    def lookup_many_by_unicode(self, texts: Sequence[str]) -> Dict[str, int]:
+        """
+        複数の絵文字を1回のクエリでまとめて逆引きする（一括インポート向け）
+        
+        Args:
+            texts: 絵文字の文字列のリスト
+            
+        Returns:
+            入力の文字列から絵文字IDへの辞書。見つからなかった文字列は含まない
+        """
+        keys: Dict[str, List[str]] = {}
+        for text in texts:
+            key = emoji_key(text)
+            if key:
+                keys.setdefault(key, []).append(text)
+        if not keys:
+            return {}
+        
+        try:
+            rows = self._execute('lookup_many_by_unicode', """
+            SELECT k.value AS unicode_key, MIN(e.id) AS id
+            FROM json_each(?) k
+            JOIN emojis e ON e.unicode_key = k.value
+            GROUP BY k.value
+            """, (json.dumps(list(keys), ensure_ascii=False),))
+            
+            return {text: row['id'] for row in rows for text in keys[row['unicode_key']]}
+        except sqlite3.Error as e:
+            logger.error(f"絵文字の一括逆引き中にエラーが発生しました: {e}")
+            return {}
+    
+    def get_fuzzy_index(self) -> FuzzyIndex:
+        """
+        keywordsテーブルの正規化済みキーワードからあいまい検索インデックスを構築する（初回のみ）
+        
+        Returns:
+            キーワードIDを値に持つFuzzyIndex
+        """
+        if self._fuzzy_index is None:
+            index = FuzzyIndex(max_distance=2)
+            index.add_all(
+                (row['keyword_norm'], row['id'])
+                for row in self._execute('get_fuzzy_index', "SELECT id, keyword_norm FROM keywords")
+            )
+            self._fuzzy_index = index
+            logger.info(f"あいまい検索インデックスを構築しました: {len(index)}語")
+        return self._fuzzy_index
+    
+    @staticmethod
+    def _support_conditions(max_version: Optional[float], qualified_only: bool,
+                            alias: str = 'e') -> Tuple[List[str], List[Any]]:
+        """
+        表示可否（絵文字バージョンと修飾状態）の絞り込み条件を作る
+        
+        Args:
+            max_version: この絵文字バージョン以下のみ。Noneなら絞り込まない
+            qualified_only: Trueならfully-qualifiedの絵文字のみ
+            alias: emojisテーブルの別名
+            
+        Returns:
+            (WHERE句の条件のリスト, バインドパラメータのリスト)
+        """
+        conditions = []
+        params = []
+        if qualified_only:
+            conditions.append(f"{alias}.status = 'fully-qualified'")
+        if max_version is not None:
+            # バージョン不明（NULL）の絵文字は表示できるか分からないので除外される
+            conditions.append(f"{alias}.emoji_version <= ?")
+            params.append(max_version)
+        return conditions, params
+    
+    def search_emojis(self, query: str = None, group: str = None, 
+                     limit: int = 100, offset: int = 0, fuzzy: bool = False,
+                     max_distance: Optional[int] = None, max_version: Optional[float] = None,
+                     qualified_only: bool = False, include_custom: bool = False) -> List[Dict[str, Any]]:
+        """
+        条件に一致する絵文字を検索
+        
+        検索語はカタカナ/ひらがな・全角/半角・ローマ字の違いを正規化してから
+        keyword_suffixesの範囲検索で部分一致を判定する。カスタム絵文字も同じ正規化と
+        custom_keyword_suffixesの範囲検索で探し、UNION ALLで1つの結果に並べる。
+        
+        Args:
+            query: 検索キーワード
+            group: 絵文字グループ名
+            limit: 返す結果の最大数
+            offset: 結果セットのオフセット
+            fuzzy: Trueならキーワードのタイプミス（編集距離1〜2）も許容する
+            max_distance: あいまい検索で許容する編集距離。Noneなら検索語の長さから決める
+            max_version: この絵文字バージョン（例: 13.0）以下の絵文字のみ返す
+            qualified_only: Trueならfully-qualifiedの絵文字のみ返す
+            include_custom: Trueなら検索語に一致するカスタム絵文字も返す。カスタム絵文字は
+                グループ「カスタム」（CUSTOM_GROUP）として扱い、groupにそれを指定すると
+                カスタム絵文字だけを返す（検索語がなければすべて）。あいまい検索では部分一致だけを
+                距離0として扱う。バージョンやqualifiedの情報を持たないため、max_versionや
+                qualified_onlyを指定したときは含めない
+            
+        Returns:
+            絵文字データのリスト。名前順で、あいまい検索では編集距離の近い順。
+            include_custom=Trueのときは各要素にcustom（カスタム絵文字か）を加え、カスタム絵文字の
+            idは負の値（カタログの絵文字IDとは重ならず、IDを受け取るメソッドには渡せない）、
+            unicodeは :名前: 、imageは画像ファイルのパスになる
+        """
+        try:
+            sql_parts = []
+            params = []
+            fuzzy_matches = []
+            query = normalize_query(query) if query else None
+            # カタログにないグループ名はどの絵文字にも一致しないので、CUSTOM_GROUPではカスタム絵文字だけが残る
+            custom_group = group == CUSTOM_GROUP
+            custom = bool(include_custom and (query or custom_group) and (not group or custom_group)
+                          and max_version is None and not qualified_only)
+            
+            if fuzzy and query:
+                if max_distance is None:
+                    max_distance = 1 if len(query) <= 4 else 2
+                fuzzy_matches = self.get_fuzzy_index().lookup(query, max_distance)
+            
+            if fuzzy_matches:
+                # 候補キーワードと距離をJSONで渡し、絵文字ごとの最小距離を求める
+                sql_parts.append("""
+                WITH fuzzy_emojis(emoji_id, distance) AS (
+                    SELECT ek3.emoji_id, MIN(fz.value)
+                    FROM json_each(?) fz
+                    CROSS JOIN emoji_keywords ek3 ON ek3.keyword_id = CAST(fz.key AS INTEGER)
+                    GROUP BY ek3.emoji_id
+                )
+                """)
+                params.append(json.dumps({str(keyword_id): distance
+                                          for _, keyword_ids, distance in fuzzy_matches
+                                          for keyword_id in keyword_ids}))
+            
+            sql_parts.append("""
+            SELECT 
+                e.id, e.unicode, e.short_name, e.group_id, e.subgroup_id,
+                GROUP_CONCAT(k.keyword, ',') as keywords,
+                CASE WHEN f.emoji_id IS NOT NULL THEN 1 ELSE 0 END as is_favorite
+            """)
+            if custom:
+                # カスタム絵文字と並べるための順位と画像のハッシュ（Unicodeの絵文字はNULL）
+                sql_parts.append(", COALESCE(fe.distance, 0) AS sort_rank" if fuzzy_matches else ", 0 AS sort_rank")
+                sql_parts.append(", NULL AS image_hash")
+            sql_parts.append("""
+            FROM 
+                emojis e
+            LEFT JOIN 
+                emoji_keywords ek ON e.id = ek.emoji_id
+            LEFT JOIN 
+                keywords k ON ek.keyword_id = k.id
+            LEFT JOIN 
+                favorites f ON e.id = f.emoji_id
+            """)
+            if fuzzy_matches:
+                sql_parts.append("LEFT JOIN fuzzy_emojis fe ON e.id = fe.emoji_id")
+            
+            conditions = []
+            
+            if query:
+                # 検索語で始まる接尾辞を持つキーワード = 検索語を部分文字列に含むキーワード
+                # （short_nameもキーワードとして登録されている）
+                conditions.append(f"""
+                (e.id IN (
+                    SELECT ek2.emoji_id FROM keyword_suffixes ks
+                    JOIN emoji_keywords ek2 ON ek2.keyword_id = ks.keyword_id
+                    WHERE ks.suffix >= ? AND ks.suffix < ?
+                ){" OR fe.emoji_id IS NOT NULL" if fuzzy_matches else ""})
+                """)
+                params.extend([query, query + '\U0010ffff'])
+            
+            if group:
+                group_condition, group_params = self._group_condition(group)
+                conditions.append(group_condition)
+                params.extend(group_params)
+            
+            support_conditions, support_params = self._support_conditions(max_version, qualified_only)
+            conditions.extend(support_conditions)
+            params.extend(support_params)
+            
+            if conditions:
+                sql_parts.append("WHERE " + " AND ".join(conditions))
+            
+            sql_parts.append("GROUP BY e.id")
+            if custom:
+                sql_parts.append(f"""
+                UNION ALL
+                SELECT
+                    -c.id, ':' || c.name || ':', c.name, NULL, NULL,
+                    (SELECT GROUP_CONCAT(ck.keyword, ',') FROM custom_keywords ck WHERE ck.emoji_id = c.id),
+                    0, 0, c.blob_hash
+                FROM custom_emojis c
+                """)
+                if query:
+                    sql_parts.append("""
+                    WHERE c.id IN (
+                        SELECT cks.emoji_id FROM custom_keyword_suffixes cks
+                        WHERE cks.suffix >= ? AND cks.suffix < ?
+                    )
+                    """)
+                    params.extend([query, query + '\U0010ffff'])
+                sql_parts.append("ORDER BY sort_rank, short_name")
+            elif fuzzy_matches:
+                # 部分一致（距離0）を先頭に、あとは距離の近い順
+                sql_parts.append("ORDER BY COALESCE(fe.distance, 0), e.short_name")
+            else:
+                sql_parts.append("ORDER BY e.short_name")
+            sql_parts.append("LIMIT ? OFFSET ?")
+            params.extend([limit, offset])
+            
+            final_sql = " ".join(sql_parts)
+            
+            results = []
+            for row in self._execute('search_emojis', final_sql, params):
+                emoji = dict(row)
+                emoji['keywords'] = emoji['keywords'].split(',') if emoji['keywords'] else []
+                emoji['is_favorite'] = bool(emoji['is_favorite'])
+                self._resolve_categories(emoji)
+                if custom:
+                    del emoji['sort_rank']
+                    image_hash = emoji.pop('image_hash')
+                    emoji['custom'] = image_hash is not None
+                    if image_hash is not None:
+                        emoji['group_name'] = CUSTOM_GROUP
+                        emoji['subgroup'] = None
+                        emoji['image'] = str(self.blobs.path(image_hash))
+                results.append(emoji)
+            
+            return results
+        except sqlite3.Error as e:
+            logger.error(f"絵文字検索中にエラーが発生しました: {e}")
+            return []
+    
+    def _compile_term(self, term: QueryTerm) -> Tuple[Optional[str], List[Any]]:
+        """
+        検索条件の1項をWHERE句の条件に変換する。条件にならない項（空の検索語など）はNone
+        """
+        if term.field == 'text':
+            value = normalize_query(term.value)
+            if not value:
+                return None, []
+            return """e.id IN (
+                SELECT ek2.emoji_id FROM keyword_suffixes ks
+                JOIN emoji_keywords ek2 ON ek2.keyword_id = ks.keyword_id
+                WHERE ks.suffix >= ? AND ks.suffix < ?
+            )""", [value, value + '\U0010ffff']
+        if term.field == 'group':
+            return self._group_condition(term.value)
+        if term.field == 'subgroup':
+            return self._subgroup_condition(term.value)
+        if term.field == 'version':
+            return "e.emoji_version <= ?", [float(term.value)]
+        if term.value == 'favorite':
+            return "e.id IN (SELECT emoji_id FROM favorites)", []
+        if term.value == 'qualified':
+            return "e.status = 'fully-qualified'", []
+        return None, []
+    
+    def _compile_query(self, clauses: ParsedQuery) -> Tuple[List[str], List[Any]]:
+        """
+        解析済みの検索クエリをWHERE句の条件（AND で連結する）とパラメータに変換する
+        """
+        conditions = []
+        params: List[Any] = []
+        for clause in clauses:
+            alternatives = []
+            for term in clause:
+                condition, term_params = self._compile_term(term)
+                if condition is None:
+                    continue
+                if term.negated:
+                    # NULLの列（バージョン不明など）との比較も「満たさない」側に入れる
+                    condition = f"NOT COALESCE(({condition}), 0)"
+                alternatives.append(condition)
+                params.extend(term_params)
+            if len(alternatives) == 1:
+                conditions.append(alternatives[0])
+            elif alternatives:
+                conditions.append("(" + " OR ".join(alternatives) + ")")
+        return conditions, params
+    
+    def query_emojis(self, query: str, limit: int = 100, offset: int = 0) -> List[Dict[str, Any]]:
+        """
+        構造化された検索クエリで絵文字を検索する
+        
+        例: 「猫 -顔 subgroup:動物-哺乳類 is:fav」「犬 OR 猫 version:13.0」。
+        構文はsearch_query.parse_queryを参照。すべての条件を1つのSQL文にまとめて実行する。
+        
+        Args:
+            query: 検索クエリ
+            limit: 返す結果の最大数
+            offset: 結果セットのオフセット
+            
+        Returns:
+            絵文字データのリスト（short_name順）
+        """
+        try:
+            conditions, params = self._compile_query(parse_query(query))
+            where = "WHERE " + " AND ".join(conditions) if conditions else ""
+            rows = self._execute('query_emojis', f"""
+            SELECT 
+                e.id, e.unicode, e.short_name, e.group_id, e.subgroup_id,
+                GROUP_CONCAT(k.keyword, ',') as keywords,
+                CASE WHEN f.emoji_id IS NOT NULL THEN 1 ELSE 0 END as is_favorite
+            FROM 
+                emojis e
+            LEFT JOIN 
+                emoji_keywords ek ON e.id = ek.emoji_id
+            LEFT JOIN 
+                keywords k ON ek.keyword_id = k.id
+            LEFT JOIN 
+                favorites f ON e.id = f.emoji_id
+            {where}
+            GROUP BY 
+                e.id
+            ORDER BY 
+                e.short_name
+            LIMIT ? OFFSET ?
+            """, params + [limit, offset])
+            
+            results = []
+            for row in rows:
+                emoji = dict(row)
+                emoji['keywords'] = emoji['keywords'].split(',') if emoji['keywords'] else []
+                emoji['is_favorite'] = bool(emoji['is_favorite'])
+                self._resolve_categories(emoji)
+                results.append(emoji)
+            
+            return results
+        except sqlite3.Error as e:
+            logger.error(f"構造化検索中にエラーが発生しました: {e}")
+            return []
+    
+    @staticmethod
+    def _build_category_tree(rows: Sequence[Any]) -> List[Dict[str, Any]]:
+        """
+        (group_name, subgroup, count, order) の行をグループ→サブグループの木にする。
+        グループもサブグループもカタログ順（orderの小さい順）に並べる
+        """
+        groups: Dict[str, Dict[str, Any]] = {}
+        for group_name, subgroup, count, _ in sorted(rows, key=lambda row: row[3]):
+            node = groups.get(group_name)
+            if node is None:
+                node = groups[group_name] = {'group_name': group_name, 'count': 0, 'subgroups': []}
+            node['count'] += count
+            node['subgroups'].append({'subgroup': subgroup, 'count': count})
+        return list(groups.values())
+    
+    def get_category_tree(self) -> List[Dict[str, Any]]:
+        """
+        事前集計したグループ・サブグループごとの絵文字数を取得する（subgroupsテーブルを初回のみ読み込む）
+        
+        Returns:
+            {'group_name', 'count', 'subgroups': [{'subgroup', 'count'}]} のリスト。
+            グループのない記号類はgroup_nameとsubgroupが空文字列
+        """
+        if self._category_tree is None:
+            try:
+                self._category_tree = self._build_category_tree(self._get_categories().counts)
+            except sqlite3.Error as e:
+                logger.error(f"カテゴリの件数の取得中にエラーが発生しました: {e}")
+                return []
+        return self._category_tree
+    
+    def _get_favorite_bits(self, version: int) -> int:
+        """
+        お気に入りの絵文字IDのビットマップを返す。お気に入りの変更カウンターが変わったときだけ読み直す
+        """
+        if self._favorite_bits is None or self._favorite_bits[0] != version:
+            bits = 0
+            # ビットの位置にできない0以下のID（以前に登録されたカスタム絵文字のIDなど）は除く
+            for row in self._execute('_get_favorite_bits', "SELECT emoji_id FROM favorites WHERE emoji_id > 0"):
+                bits |= 1 << row[0]
+            self._favorite_bits = (version, bits)
+        return self._favorite_bits[1]
+    
+    def get_category_page(self, group_name: str, subgroup: Optional[str] = None,
+                          page: int = 0) -> Optional[bytes]:
+        """
+        カテゴリの一覧ページを、seed_db.pyが事前にエンコードしたJSONのバイト列のまま取得する
+        
+        search_emojis(group=...) と同じ並び・同じ形の絵文字を含む（形式はcategory_pages.py）。
+        主キーで1行読み、お気に入りのフラグだけをビットマップから書き換えるので、行ごとの処理はない。
+        
+        Args:
+            group_name: グループ名
+            subgroup: サブグループ名。Noneならグループ全体
+            page: ページ番号（0始まり。1ページはcategory_pages.CATEGORY_PAGE_SIZE件）
+            
+        Returns:
+            UTF-8のJSON。カテゴリやページがない場合はNone
+        """
+        try:
+            categories = self._get_categories()
+            group_id = categories.group_ids.get(group_name)
+            # グループ全体のページはサブグループID 0
+            subgroup_id = 0
+            if subgroup:
+                subgroup_id = next((sid for gid, sid in categories.subgroup_ids.get(subgroup, [])
+                                    if gid == group_id), None)
+            if group_id is None or subgroup_id is None:
+                return None
+            row = self._execute('get_category_page', """
+            SELECT
+                p.payload, p.min_id, p.id_bits, p.flag_ids, p.flag_offsets,
+                (SELECT version FROM change_counters WHERE name = 'favorites') AS favorites_version
+            FROM category_pages p
+            WHERE p.group_id = ? AND p.subgroup_id = ? AND p.page = ?
+            """, (group_id, subgroup_id, page), fetch='one')
+            if row is None:
+                return None
+            return overlay_favorites(row['payload'], row['min_id'], row['id_bits'], row['flag_ids'],
+                                     row['flag_offsets'], self._get_favorite_bits(row['favorites_version']))
+        except sqlite3.Error as e:
+            logger.error(f"カテゴリの一覧ページの取得中にエラーが発生しました: {e}")
+            return None
+    
+    def search_faceted(self, query: str = '', group: str = None, subgroup: str = None,
+                       limit: int = 100, offset: int = 0) -> Dict[str, Any]:
+        """
+        検索結果の1ページと、グループ・サブグループごとの一致件数を1回のクエリで取得する
+        
+        件数はgroup/subgroupで絞り込む前の一致全体について数えるので、
+        カテゴリのタブごとに検索し直す必要はない。空の検索では事前集計した件数を使う。
+        
+        Args:
+            query: 検索クエリ（query_emojisと同じ構文）
+            group: 結果のページをこのグループに絞り込む
+            subgroup: 結果のページをこのサブグループに絞り込む
+            limit: 返す結果の最大数
+            offset: 結果セットのオフセット
+            
+        Returns:
+            {'results': 絵文字データのリスト, 'total': 一致件数,
+             'groups': get_category_treeと同じ形の件数の木}
+        """
+        try:
+            conditions, params = self._compile_query(parse_query(query or ''))
+            page_conditions = []
+            page_params: List[Any] = []
+            if group:
+                condition, condition_params = self._group_condition(group, alias='m')
+                page_conditions.append(condition)
+                page_params.extend(condition_params)
+            if subgroup:
+                condition, condition_params = self._subgroup_condition(subgroup, alias='m')
+                page_conditions.append(condition)
+                page_params.extend(condition_params)
+            
+            # 一致した絵文字を一度だけ求め、ページと件数の両方をそこから作る
+            sql = f"""
+            WITH matched AS MATERIALIZED (
+                SELECT e.id, e.short_name, e.group_id, e.subgroup_id
+                FROM emojis e
+                {"WHERE " + " AND ".join(conditions) if conditions else ""}
+            ),
+            page AS (
+                SELECT id FROM matched m
+                {"WHERE " + " AND ".join(page_conditions) if page_conditions else ""}
+                ORDER BY short_name, id
+                LIMIT ? OFFSET ?
+            )
+            SELECT 
+                'hit' AS kind, e.id, e.unicode, e.short_name, e.group_id, e.subgroup_id,
+                GROUP_CONCAT(k.keyword, ',') as keywords,
+                CASE WHEN f.emoji_id IS NOT NULL THEN 1 ELSE 0 END as is_favorite,
+                NULL AS count
+            FROM 
+                page p
+            JOIN 
+                emojis e ON e.id = p.id
+            LEFT JOIN 
+                emoji_keywords ek ON e.id = ek.emoji_id
+            LEFT JOIN 
+                keywords k ON ek.keyword_id = k.id
+            LEFT JOIN 
+                favorites f ON e.id = f.emoji_id
+            GROUP BY 
+                e.id
+            """
+            if conditions:
+                sql += """
+                UNION ALL
+                SELECT 'facet', NULL, NULL, NULL, group_id, subgroup_id, NULL, NULL, COUNT(*)
+                FROM matched
+                GROUP BY group_id, subgroup_id
+                """
+            rows = self._execute('search_faceted', sql, params + page_params + [limit, offset])
+            
+            results = []
+            facets = []
+            categories = self._get_categories()
+            for row in rows:
+                if row['kind'] == 'facet':
+                    # get_category_treeと同じくサブグループのsort_order順に並べる
+                    facets.append((categories.group_names[row['group_id']],
+                                   categories.subgroup_names[row['subgroup_id']], row['count'],
+                                   categories.subgroup_orders[row['subgroup_id']]))
+                    continue
+                emoji = dict(row)
+                del emoji['kind'], emoji['count']
+                emoji['keywords'] = emoji['keywords'].split(',') if emoji['keywords'] else []
+                emoji['is_favorite'] = bool(emoji['is_favorite'])
+                self._resolve_categories(emoji)
+                results.append(emoji)
+            # UNION ALLでは並び順が保証されないので、ページ内をもう一度並べる
+            results.sort(key=lambda emoji: (emoji['short_name'], emoji['id']))
+            
+            # 空の検索は事前集計した件数を使う
+            groups = self._build_category_tree(facets) if conditions else self.get_category_tree()
+            return {
+                'results': results,
+                'total': sum(node['count'] for node in groups),
+                'groups': groups,
+            }
+        except sqlite3.Error as e:
+            logger.error(f"ファセット検索中にエラーが発生しました: {e}")
+            return {'results': [], 'total': 0, 'groups': []}
+    
+    def get_related(self, emoji_id: int, k: int = 10) -> List[Dict[str, Any]]:
+        """
+        キーワードの共起から事前計算した関連絵文字を取得
+        
+        Args:
+            emoji_id: 基準となる絵文字のID
+            k: 返す結果の最大数（seed_db.NEIGHBOR_COUNTまで）
+            
+        Returns:
+            関連度（score）の高い順の絵文字データのリスト
+        """
+        try:
+            rows = self._execute('get_related', """
+            SELECT 
+                e.id, e.unicode, e.short_name, e.group_id, e.subgroup_id,
+                GROUP_CONCAT(k.keyword, ',') as keywords,
+                CASE WHEN f.emoji_id IS NOT NULL THEN 1 ELSE 0 END as is_favorite,
+                n.score
+            FROM 
+                emoji_neighbors n
+            JOIN 
+                emojis e ON e.id = n.neighbor_id
+            LEFT JOIN 
+                emoji_keywords ek ON e.id = ek.emoji_id
+            LEFT JOIN 
+                keywords k ON ek.keyword_id = k.id
+            LEFT JOIN 
+                favorites f ON e.id = f.emoji_id
+            WHERE 
+                n.emoji_id = ? AND n.rank < ?
+            GROUP BY 
+                n.rank
+            ORDER BY 
+                n.rank
+            """, (emoji_id, k))
+            
+            results = []
+            for row in rows:
+                emoji = dict(row)
+                emoji['keywords'] = emoji['keywords'].split(',') if emoji['keywords'] else []
+                emoji['is_favorite'] = bool(emoji['is_favorite'])
+                self._resolve_categories(emoji)
+                results.append(emoji)
+            
+            return results
+        except sqlite3.Error as e:
+            logger.error(f"関連絵文字の取得中にエラーが発生しました: {e}")
+            return []
+    
+    def get_unicode_map(self, include_symbols: bool = True) -> Dict[str, int]:
+        """
+        unicode文字列から絵文字IDへの辞書を取得
+        
+        Args:
+            include_symbols: グループのない記号類（「、」「-」など）も含める
+            
+        Returns:
+            unicode文字列をキー、絵文字IDを値とする辞書
+        """
+        try:
+            sql = "SELECT id, unicode FROM emojis"
+            params = []
+            if not include_symbols:
+                # グループのない記号類は名前が空文字列のグループ
+                sql += " WHERE group_id != ?"
+                params.append(self._get_categories().group_ids.get('', 0))
+            sql += " ORDER BY id"
+            mapping = {}
+            for row in self._execute('get_unicode_map', sql, params):
+                mapping.setdefault(row['unicode'], row['id'])
+            return mapping
+        except sqlite3.Error as e:
+            logger.error(f"絵文字一覧の取得中にエラーが発生しました: {e}")
+            return {}
+    
+    def get_keyword_entries(self) -> List[Tuple[str, int, str, bool]]:
+        """
+        正規化済みキーワードと絵文字の対応を全件取得
+        
+        Returns:
+            (正規化キーワード, 絵文字ID, unicode, short_nameと一致するか) のリスト。絵文字ID順
+        """
+        try:
+            rows = self._execute('get_keyword_entries', """
+            SELECT k.keyword_norm, e.id, e.unicode, e.short_name = k.keyword AS is_short_name
+            FROM keywords k
+            JOIN emoji_keywords ek ON ek.keyword_id = k.id
+            JOIN emojis e ON e.id = ek.emoji_id
+            ORDER BY e.id
+            """)
+            return [(row[0], row[1], row[2], bool(row[3])) for row in rows]
+        except sqlite3.Error as e:
+            logger.error(f"キーワード一覧の取得中にエラーが発生しました: {e}")
+            return []
+    
+    def get_usage_counts(self) -> Dict[int, int]:
+        """
+        絵文字ごとの使用回数を取得
+        
+        Returns:
+            絵文字IDをキー、使用回数を値とする辞書
+        """
+        try:
+            rows = self._execute('get_usage_counts', """
+            SELECT emoji_id, COUNT(*) FROM history GROUP BY emoji_id
+            """)
+            return {row[0]: row[1] for row in rows}
+        except sqlite3.Error as e:
+            logger.error(f"使用回数の取得中にエラーが発生しました: {e}")
+            return {}
+    
+    def get_emoji_categories(self, max_version: Optional[float] = None,
+                             qualified_only: bool = False) -> List[str]:
+        """
+        利用可能な絵文字カテゴリ（グループ名）のリストを取得
+        
+        条件がなければキャッシュしたgroupsテーブルの内容だけで返す。
+        
+        Args:
+            max_version: この絵文字バージョン以下の絵文字を含むカテゴリのみ
+            qualified_only: fully-qualifiedの絵文字を含むカテゴリのみ
+            
+        Returns:
+            カテゴリ名のリスト（カタログ順）
+        """
+        try:
+            group_names = self._get_categories().group_names
+            conditions, params = self._support_conditions(max_version, qualified_only, alias='emojis')
+            if not conditions:
+                return [name for name in group_names.values() if name]
+            
+            rows = self._execute('get_emoji_categories', f"""
+            SELECT DISTINCT group_id 
+            FROM emojis 
+            WHERE {' AND '.join(conditions)}
+            """, params)
+            found = {row[0] for row in rows}
+            return [name for group_id, name in group_names.items() if name and group_id in found]
+        except sqlite3.Error as e:
+            logger.error(f"カテゴリ取得中にエラーが発生しました: {e}")
+            return []
+    
+    def get_favorites(self, limit: int = 100, offset: int = 0) -> List[Dict[str, Any]]:
+        """
+        お気に入りの絵文字を取得
+        
+        Args:
+            limit: 返す結果の最大数
+            offset: 結果セットのオフセット
+            
+        Returns:
+            絵文字データのリスト（ユーザーが決めた並び順）
+        """
+        try:
+            rows = self._execute('get_favorites', """
+            SELECT 
+                e.id, e.unicode, e.short_name, e.group_id, e.subgroup_id,
+                GROUP_CONCAT(k.keyword, ',') as keywords,
+                1 as is_favorite
+            FROM (
+                SELECT emoji_id, position
+                FROM favorites
+                ORDER BY position, emoji_id
+                LIMIT ? OFFSET ?
+            ) f
+            JOIN 
+                emojis e ON f.emoji_id = e.id
+            LEFT JOIN 
+                emoji_keywords ek ON e.id = ek.emoji_id
+            LEFT JOIN 
+                keywords k ON ek.keyword_id = k.id
+            GROUP BY 
+                f.emoji_id
+            ORDER BY 
+                f.position, f.emoji_id
+            """, (limit, offset))
+            
+            results = []
+            for row in rows:
+                emoji = dict(row)
+                emoji['keywords'] = emoji['keywords'].split(',') if emoji['keywords'] else []
+                emoji['is_favorite'] = True
+                self._resolve_categories(emoji)
+                results.append(emoji)
+            
+            return results
+        except sqlite3.Error as e:
+            logger.error(f"お気に入り取得中にエラーが発生しました: {e}")
+            return []
+    
+    def add_to_favorites(self, emoji_id: int) -> bool:
+        """
+        絵文字をお気に入りの先頭に追加
+        
+        Args:
+            emoji_id: お気に入りに追加する絵文字のID
+            
+        Returns:
+            追加に成功した場合（既に追加済みの場合を含む）はTrue、それ以外はFalse
+        """
+        return self.add_favorites([emoji_id])
+    
+    def remove_from_favorites(self, emoji_id: int) -> bool:
+        """
+        絵文字をお気に入りから削除
+        
+        Args:
+            emoji_id: お気に入りから削除する絵文字のID
+            
+        Returns:
+            削除に成功した場合はTrue、それ以外はFalse
+        """
+        return self.remove_favorites([emoji_id])
+    
+    def add_favorites(self, emoji_ids: Sequence[int]) -> bool:
+        """
+        複数の絵文字を1回のトランザクションでお気に入りの先頭に追加する。
+        emoji_idsの順に並び、既に追加済みの絵文字はそのままの位置に残る
+        
+        Args:
+            emoji_ids: お気に入りに追加する絵文字のIDのリスト。カスタム絵文字（負のID）は追加できない
+            
+        Returns:
+            追加に成功した場合はTrue、それ以外はFalse
+        """
+        invalid = [emoji_id for emoji_id in emoji_ids if emoji_id <= 0]
+        if invalid:
+            logger.error(f"お気に入りに追加できない絵文字IDです: {invalid}")
+            return False
+        
+        conn = self.connect()
+        
+        try:
+            front = self._execute('add_favorites', "SELECT MIN(position) FROM favorites",
+                                  fetch='one')[0]
+            # 先頭の位置より前に、emoji_idsの順で詰める
+            base = (0 if front is None else front) - len(emoji_ids)
+            added = self._execute('add_favorites', """
+            INSERT OR IGNORE INTO favorites (emoji_id, position)
+            SELECT value, ? + key FROM json_each(?) ORDER BY key
+            """, (base, json.dumps(list(emoji_ids))), fetch=None).rowcount
+            self._commit('add_favorites')
+            logger.info(f"{added}件の絵文字をお気に入りに追加しました")
+            return True
+        except sqlite3.Error as e:
+            logger.error(f"お気に入り追加中にエラーが発生しました: {e}")
+            conn.rollback()
+            return False
+    
+    def remove_favorites(self, emoji_ids: Sequence[int]) -> bool:
+        """
+        複数の絵文字を1回のトランザクションでお気に入りから削除する
+        
+        Args:
+            emoji_ids: お気に入りから削除する絵文字のIDのリスト
+            
+        Returns:
+            削除に成功した場合はTrue、それ以外はFalse
+        """
+        conn = self.connect()
+        
+        try:
+            removed = self._execute('remove_favorites', """
+            DELETE FROM favorites WHERE emoji_id IN (SELECT value FROM json_each(?))
+            """, (json.dumps(list(emoji_ids)),), fetch=None).rowcount
+            self._commit('remove_favorites')
+            logger.info(f"{removed}件の絵文字をお気に入りから削除しました")
+            return True
+        except sqlite3.Error as e:
+            logger.error(f"お気に入り削除中にエラーが発生しました: {e}")
+            conn.rollback()
+            return False
+    
+    def reorder_favorites(self, emoji_ids: Sequence[int]) -> bool:
+        """
+        お気に入りを指定した順に並べ替える。
+        emoji_idsに含まれないお気に入りは、元の順のまま後ろに続く
+        
+        Args:
+            emoji_ids: 新しい並び順の絵文字IDのリスト
+            
+        Returns:
+            並べ替えに成功した場合はTrue、それ以外はFalse
+        """
+        conn = self.connect()
+        
+        try:
+            self._execute('reorder_favorites', """
+            WITH listed AS (
+                SELECT value AS emoji_id, MIN(key) AS position
+                FROM json_each(?)
+                GROUP BY value
+            ),
+            ranked AS (
+                SELECT
+                    f.emoji_id,
+                    COALESCE(l.position, ? + ROW_NUMBER() OVER (
+                        PARTITION BY l.position IS NULL ORDER BY f.position, f.emoji_id
+                    )) AS position
+                FROM favorites f
+                LEFT JOIN listed l ON l.emoji_id = f.emoji_id
+            )
+            UPDATE favorites SET position = r.position
+            FROM ranked r
+            WHERE r.emoji_id = favorites.emoji_id
+            """, (json.dumps(list(emoji_ids)), len(emoji_ids)), fetch=None)
+            self._commit('reorder_favorites')
+            logger.info(f"お気に入りを並べ替えました ({len(emoji_ids)}件指定)")
+            return True
+        except sqlite3.Error as e:
+            logger.error(f"お気に入りの並べ替え中にエラーが発生しました: {e}")
+            conn.rollback()
+            return False
+    
+    def add_to_history(self, emoji_id: int) -> bool:
+        """
+        絵文字を使用履歴に追加
+        
+        Args:
+            emoji_id: 履歴に追加する絵文字のID
+            
+        Returns:
+            追加に成功した場合はTrue、それ以外はFalse
+        """
+        conn = self.connect()
+        
+        try:
+            self._execute('add_to_history', "INSERT INTO history (emoji_id) VALUES (?)",
+                          (emoji_id,), fetch=None)
+            self._commit('add_to_history')
+            logger.info(f"絵文字ID {emoji_id} を履歴に追加しました")
+            return True
+        except sqlite3.Error as e:
+            logger.error(f"履歴追加中にエラーが発生しました: {e}")
+            conn.rollback()
+            return False
+    
+    def add_many_to_history(self, entries: Sequence[Tuple[int, Optional[str]]]) -> int:
+        """
+        複数の絵文字を1回のトランザクションで使用履歴に追加する。
+        entriesの順に追加するので、遷移と集計はadd_to_historyを順に呼んだ場合と同じになる
+        
+        Args:
+            entries: (絵文字ID, 使用日時) のリスト。使用日時は 'YYYY-MM-DD HH:MM:SS'（UTC）で、
+                Noneなら現在時刻
+        
+        Returns:
+            追加した件数（エラーの場合は0）
+        """
+        if not entries:
+            return 0
+        conn = self.connect()
+        
+        try:
+            added = self._execute('add_many_to_history', """
+            INSERT INTO history (emoji_id, used_at)
+            SELECT json_extract(value, '$[0]'), COALESCE(json_extract(value, '$[1]'), CURRENT_TIMESTAMP)
+            FROM json_each(?) ORDER BY key
+            """, (json.dumps([list(entry) for entry in entries]),), fetch=None).rowcount
+            self._commit('add_many_to_history')
+            logger.info(f"{added}件の絵文字を履歴に追加しました")
+            return added
+        except sqlite3.Error as e:
+            logger.error(f"履歴追加中にエラーが発生しました: {e}")
+            conn.rollback()
+            return 0
+    
+    def get_recent_emojis(self, limit: int = 20) -> List[Dict[str, Any]]:
+        """
+        最近使用した絵文字を取得
+        
+        履歴を使用日時の新しい順にインデックスでたどり、異なる絵文字がlimit個そろった時点で読むのをやめる。
+        履歴全体を集計しないので、履歴の件数によらずほぼ一定の時間で返る。
+        
+        Args:
+            limit: 返す結果の最大数
+            
+        Returns:
+            絵文字データのリスト
+        """
+        try:
+            recent: Dict[int, None] = {}
+            cursor = self._execute('get_recent_emojis', """
+            SELECT emoji_id FROM history ORDER BY used_at DESC, id DESC
+            """, fetch=None)
+            while len(recent) < limit:
+                rows = cursor.fetchmany(limit * 4)
+                if not rows:
+                    break
+                for row in rows:
+                    recent.setdefault(row['emoji_id'])
+                    if len(recent) >= limit:
+                        break
+            cursor.close()
+            if not recent:
+                return []
+            
+            rows = self._execute('get_recent_emojis', """
+            SELECT 
+                e.id, e.unicode, e.short_name, e.group_id, e.subgroup_id,
                 GROUP_CONCAT(k.keyword, ',') as keywords,
                 CASE WHEN f.emoji_id IS NOT NULL THEN 1 ELSE 0 END as is_favorite
             FROM 
-                emojis e
+                json_each(?) r
+            JOIN 
+                emojis e ON e.id = r.value
             LEFT JOIN 
                 emoji_keywords ek ON e.id = ek.emoji_id
             LEFT JOIN 
                 keywords k ON ek.keyword_id = k.id
             LEFT JOIN 
                 favorites f ON e.id = f.emoji_id
-            WHERE 
-                e.id = ?
             GROUP BY 
-                e.id
-            """
-            cursor.execute(query, (emoji_id,))
-            row = cursor.fetchone()
+                r.key
+            ORDER BY 
+                r.key
+            """, (json.dumps(list(recent)),))
             
-            if row:
-                # SQLite Rowオブジェクトを辞書に変換
+            results = []
+            for row in rows:
                 emoji = dict(row)
                 emoji['keywords'] = emoji['keywords'].split(',') if emoji['keywords'] else []
                 emoji['is_favorite'] = bool(emoji['is_favorite'])
-                return emoji
-            return None
+                self._resolve_categories(emoji)
+                results.append(emoji)
+            
+            return results
         except sqlite3.Error as e:
-            logger.error(f"絵文字取得中にエラーが発生しました: {e}")
-            return None
-    
-    def search_emojis(self, query: str = None, group: str = None, 
-                     limit: int = 100, offset: int = 0) -> List[Dict[str, Any]]:
+            logger.error(f"最近使用した絵文字の取得中にエラーが発生しました: {e}")
+            return []
+
+    def get_next_emojis(self, emoji_id: Optional[int] = None, limit: int = 10) -> List[Dict[str, Any]]:
         """
-        条件に一致する絵文字を検索
+        ある絵文字の次によく使われる絵文字を予測する
         
         Args:
-            query: 検索キーワード
-            group: 絵文字グループ名
+            emoji_id: 直前に使った絵文字のID。Noneなら履歴の最新の絵文字
             limit: 返す結果の最大数
-            offset: 結果セットのオフセット
             
         Returns:
-            絵文字データのリスト
+            続けて使われた回数（count）の多い順の絵文字データのリスト
         """
-        conn = self.connect()
-        cursor = conn.cursor()
-        
         try:
-            sql_parts = ["""
+            rows = self._execute('get_next_emojis', """
             SELECT 
-                e.id, e.unicode, e.short_name, e.group_name, e.subgroup,
+                e.id, e.unicode, e.short_name, e.group_id, e.subgroup_id,
                 GROUP_CONCAT(k.keyword, ',') as keywords,
-                CASE WHEN f.emoji_id IS NOT NULL THEN 1 ELSE 0 END as is_favorite
-            FROM 
-                emojis e
+                CASE WHEN f.emoji_id IS NOT NULL THEN 1 ELSE 0 END as is_favorite,
+                t.count
+            FROM (
+                SELECT next_id, count
+                FROM emoji_transitions
+                WHERE prev_id = COALESCE(?, (SELECT emoji_id FROM history ORDER BY id DESC LIMIT 1))
+                ORDER BY count DESC, next_id
+                LIMIT ?
+            ) t
+            JOIN 
+                emojis e ON e.id = t.next_id
             LEFT JOIN 
                 emoji_keywords ek ON e.id = ek.emoji_id
             LEFT JOIN 
                 keywords k ON ek.keyword_id = k.id
             LEFT JOIN 
                 favorites f ON e.id = f.emoji_id
-            """]
-            
-            conditions = []
-            params = []
-            
-            if query:
-                conditions.append("""
-                (e.short_name LIKE ? OR EXISTS (
-                    SELECT 1 FROM emoji_keywords ek2
-                    JOIN keywords k2 ON ek2.keyword_id = k2.id
-                    WHERE ek2.emoji_id = e.id AND k2.keyword LIKE ?
-                ))
-                """)
-                params.extend([f'%{query}%', f'%{query}%'])
-            
-            if group:
-                conditions.append("e.group_name = ?")
-                params.append(group)
-            
-            if conditions:
-                sql_parts.append("WHERE " + " AND ".join(conditions))
-            
-            sql_parts.append("GROUP BY e.id")
-            sql_parts.append("ORDER BY e.short_name")
-            sql_parts.append("LIMIT ? OFFSET ?")
-            params.extend([limit, offset])
-            
-            final_sql = " ".join(sql_parts)
-            cursor.execute(final_sql, params)
+            GROUP BY 
+                t.next_id
+            ORDER BY 
+                t.count DESC, t.next_id
+            """, (emoji_id, limit))
             
             results = []
-            for row in cursor.fetchall():
+            for row in rows:
                 emoji = dict(row)
                 emoji['keywords'] = emoji['keywords'].split(',') if emoji['keywords'] else []
                 emoji['is_favorite'] = bool(emoji['is_favorite'])
+                self._resolve_categories(emoji)
                 results.append(emoji)
             
             return results
         except sqlite3.Error as e:
-            logger.error(f"絵文字検索中にエラーが発生しました: {e}")
+            logger.error(f"次の絵文字の予測中にエラーが発生しました: {e}")
             return []
     
-    def get_emoji_categories(self) -> List[str]:
+    def get_top_emojis(self, window: str = 'week', limit: int = 20) -> List[Dict[str, Any]]:
         """
-        利用可能な絵文字カテゴリ（グループ名）のリストを取得
+        今日（window='day'）または今週（window='week'）よく使った絵文字を取得
         
+        日別・週別の集計表を使用回数の多い順のインデックスでたどるので、履歴の件数によらずlimit件分の手間で済む。
+        
+        Args:
+            window: 集計期間（USAGE_WINDOWSのキー）
+            limit: 返す結果の最大数
+            
         Returns:
-            カテゴリ名のリスト
+            期間内の使用回数（count）の多い順の絵文字データのリスト
         """
-        conn = self.connect()
-        cursor = conn.cursor()
+        if window not in USAGE_WINDOWS:
+            raise ValueError(f"不明な集計期間です: {window}")
+        table, column, modifiers = USAGE_WINDOWS[window]
         
         try:
-            cursor.execute("""
-            SELECT DISTINCT group_name 
-            FROM emojis 
-            WHERE group_name IS NOT NULL AND group_name != ''
-            ORDER BY group_name
-            """)
+            rows = self._execute('get_top_emojis', f"""
+            SELECT 
+                e.id, e.unicode, e.short_name, e.group_id, e.subgroup_id,
+                GROUP_CONCAT(k.keyword, ',') as keywords,
+                CASE WHEN f.emoji_id IS NOT NULL THEN 1 ELSE 0 END as is_favorite,
+                u.count
+            FROM (
+                SELECT emoji_id, count
+                FROM {table}
+                WHERE {column} = date('now', {modifiers})
+                ORDER BY count DESC, emoji_id
+                LIMIT ?
+            ) u
+            JOIN 
+                emojis e ON e.id = u.emoji_id
+            LEFT JOIN 
+                emoji_keywords ek ON e.id = ek.emoji_id
+            LEFT JOIN 
+                keywords k ON ek.keyword_id = k.id
+            LEFT JOIN 
+                favorites f ON e.id = f.emoji_id
+            GROUP BY 
+                u.emoji_id
+            ORDER BY 
+                u.count DESC, u.emoji_id
+            """, (limit,))
+            
+            results = []
+            for row in rows:
+                emoji = dict(row)
+                emoji['keywords'] = emoji['keywords'].split(',') if emoji['keywords'] else []
+                emoji['is_favorite'] = bool(emoji['is_favorite'])
+                self._resolve_categories(emoji)
+                results.append(emoji)
             
-            return [row[0] for row in cursor.fetchall()]
+            return results
         except sqlite3.Error as e:
-            logger.error(f"カテゴリ取得中にエラーが発生しました: {e}")
+            logger.error(f"よく使う絵文字の取得中にエラーが発生しました: {e}")
             return []
     
-    def get_favorites(self, limit: int = 100, offset: int = 0) -> List[Dict[str, Any]]:
+    def get_trending(self, limit: int = 10) -> List[Dict[str, Any]]:
         """
-        お気に入りの絵文字を取得
+        今日になって急に使われ始めた絵文字を取得
+        
+        今日の使用回数の上位（limitのTRENDING_CANDIDATE_FACTOR倍）を候補にし、直前TRENDING_BASELINE_DAYS日の
+        1日平均と比べたスコア (今日 - 平均) / √(平均 + 1) の高い順に並べる。候補ごとの過去の回数は
+        (emoji_id, day) のインデックスで引くので、履歴の件数によらない。
         
         Args:
             limit: 返す結果の最大数
-            offset: 結果セットのオフセット
             
         Returns:
-            絵文字データのリスト
+            スコア（score）の高い順の絵文字データのリスト。今日の回数（count）と過去の1日平均（baseline）を含む
         """
-        conn = self.connect()
-        cursor = conn.cursor()
-        
         try:
-            cursor.execute("""
+            rows = self._execute('get_trending', """
+            WITH candidates AS (
+                SELECT emoji_id, count
+                FROM usage_daily
+                WHERE day = date('now')
+                ORDER BY count DESC, emoji_id
+                LIMIT ?
+            ),
+            scored AS MATERIALIZED (
+                SELECT 
+                    c.emoji_id, c.count,
+                    COALESCE((
+                        SELECT SUM(d.count) FROM usage_daily d
+                        WHERE d.emoji_id = c.emoji_id
+                          AND d.day >= date('now', ?) AND d.day < date('now')
+                    ), 0) * 1.0 / ? AS baseline
+                FROM candidates c
+            ),
+            ranked AS (
+                SELECT emoji_id, count, baseline, (count - baseline) / sqrt(baseline + 1) AS score
+                FROM scored
+                WHERE count > baseline
+                ORDER BY score DESC, emoji_id
+                LIMIT ?
+            )
             SELECT 
-                e.id, e.unicode, e.short_name, e.group_name, e.subgroup,
+                e.id, e.unicode, e.short_name, e.group_id, e.subgroup_id,
                 GROUP_CONCAT(k.keyword, ',') as keywords,
-                1 as is_favorite
+                CASE WHEN f.emoji_id IS NOT NULL THEN 1 ELSE 0 END as is_favorite,
+                r.count, r.baseline, r.score
             FROM 
-                favorites f
+                ranked r
             JOIN 
-                emojis e ON f.emoji_id = e.id
+                emojis e ON e.id = r.emoji_id
             LEFT JOIN 
                 emoji_keywords ek ON e.id = ek.emoji_id
             LEFT JOIN 
                 keywords k ON ek.keyword_id = k.id
+            LEFT JOIN 
+                favorites f ON e.id = f.emoji_id
             GROUP BY 
-                e.id
+                r.emoji_id
             ORDER BY 
-                f.created_at DESC
-            LIMIT ? OFFSET ?
-            """, (limit, offset))
+                r.score DESC, r.emoji_id
+            """, (limit * TRENDING_CANDIDATE_FACTOR, f"-{TRENDING_BASELINE_DAYS} days",
+                  TRENDING_BASELINE_DAYS, limit))
             
             results = []
-            for row in cursor.fetchall():
+            for row in rows:
                 emoji = dict(row)
                 emoji['keywords'] = emoji['keywords'].split(',') if emoji['keywords'] else []
-                emoji['is_favorite'] = True
+                emoji['is_favorite'] = bool(emoji['is_favorite'])
+                self._resolve_categories(emoji)
+                emoji['score'] = round(emoji['score'], 3)
+                emoji['baseline'] = round(emoji['baseline'], 3)
                 results.append(emoji)
             
             return results
         except sqlite3.Error as e:
-            logger.error(f"お気に入り取得中にエラーが発生しました: {e}")
+            logger.error(f"急上昇の絵文字の取得中にエラーが発生しました: {e}")
             return []
     
-    def add_to_favorites(self, emoji_id: int) -> bool:
+    @staticmethod
+    def _custom_keyword_suffixes(keyword: str) -> set:
+        """
+        カスタム絵文字のキーワードの接尾辞を求める
+        
+        カタログと同じnormalize_textの形に加えて、ローマ字をかなにした形（neko → ねこ）も索引に入れる。
+        normalize_queryは検索語のローマ字をかなにするので、英字の名前もローマ字読みの名前も見つかる。
+        """
+        suffixes = set()
+        for form in {normalize_text(keyword), normalize_query(keyword)}:
+            suffixes.update(form[i:] for i in range(len(form)))
+        return suffixes
+    
+    @property
+    def thumbnails(self) -> ThumbnailCache:
+        """
+        カスタム絵文字のサムネイルキャッシュ（初回アクセス時に作成）
+        """
+        if self._thumbnails is None:
+            self._thumbnails = ThumbnailCache(os.path.join(self.custom_dir, 'thumbnails'), self.blobs)
+        return self._thumbnails
+    
+    def _remove_orphan_blobs(self, blob_hashes: Sequence[str]) -> None:
+        """
+        どのカスタム絵文字からも参照されなくなった画像を削除する（コミット後に呼ぶ）
+        """
+        if not blob_hashes:
+            return
+        rows = self._execute('_remove_orphan_blobs', """
+        SELECT h.value AS blob_hash FROM json_each(?) h
+        WHERE NOT EXISTS (SELECT 1 FROM custom_emojis c WHERE c.blob_hash = h.value)
+        """, (json.dumps(sorted(set(blob_hashes))),))
+        for row in rows:
+            self.blobs.remove(row['blob_hash'])
+    
+    def add_custom_emojis(self, images: Sequence[StoredImage],
+                          keywords: Optional[Dict[str, Sequence[str]]] = None) -> int:
         """
-        絵文字をお気に入りに追加
+        画像ストアに保存済みの画像をカスタム絵文字として登録する
+        
+        同じ名前が既にあれば画像とキーワードを置き換える。1トランザクションで登録し、
+        変更カウンターの行ごとのトリガーは止めて最後に1回だけ進める。
         
         Args:
-            emoji_id: お気に入りに追加する絵文字のID
+            images: 登録する画像（名前・画像のハッシュ・MIMEタイプ）。同じ名前は後のものを使う
+            keywords: 名前から検索用キーワードへの辞書。ない名前はcustom_emoji_keywordsで名前から作る
             
         Returns:
-            追加に成功した場合はTrue、それ以外はFalse
+            登録した件数
         """
-        conn = self.connect()
-        cursor = conn.cursor()
+        entries = {image.name: image for image in images}
+        if not entries:
+            return 0
+        keywords = keywords or {}
+        names = json.dumps(list(entries))
         
+        conn = self.connect()
         try:
-            # 既にお気に入りに追加されているか確認
-            cursor.execute("SELECT 1 FROM favorites WHERE emoji_id = ?", (emoji_id,))
-            if cursor.fetchone():
-                logger.info(f"絵文字ID {emoji_id} は既にお気に入りに追加されています")
-                return True
-            
-            # お気に入りに追加
-            cursor.execute("INSERT INTO favorites (emoji_id) VALUES (?)", (emoji_id,))
-            conn.commit()
-            logger.info(f"絵文字ID {emoji_id} をお気に入りに追加しました")
-            return True
+            with conn:
+                replaced = [row[0] for row in conn.execute(
+                    "SELECT blob_hash FROM custom_emojis WHERE name IN (SELECT value FROM json_each(?))",
+                    (names,))]
+                conn.execute("INSERT INTO suspended_triggers (name) VALUES ('custom_emojis')")
+                # WHERE true はSELECTとON CONFLICTの構文上の曖昧さを避けるため
+                conn.execute("""
+                INSERT INTO custom_emojis (name, blob_hash, mime)
+                SELECT json_extract(value, '$[0]'), json_extract(value, '$[1]'), json_extract(value, '$[2]')
+                FROM json_each(?) WHERE true
+                ON CONFLICT (name) DO UPDATE SET blob_hash = excluded.blob_hash, mime = excluded.mime
+                """, (json.dumps([list(image) for image in entries.values()]),))
+                conn.execute("DELETE FROM suspended_triggers WHERE name = 'custom_emojis'")
+                ids = dict(conn.execute(
+                    "SELECT name, id FROM custom_emojis WHERE name IN (SELECT value FROM json_each(?))",
+                    (names,)).fetchall())
+                
+                # 置き換える絵文字の古い索引を消す（接尾辞はキーワードから求め直して主キーで消す）
+                id_list = json.dumps(list(ids.values()))
+                old_keywords = conn.execute(
+                    "SELECT emoji_id, keyword FROM custom_keywords WHERE emoji_id IN (SELECT value FROM json_each(?))",
+                    (id_list,)).fetchall()
+                conn.executemany(
+                    "DELETE FROM custom_keyword_suffixes WHERE suffix = ? AND emoji_id = ?",
+                    {(suffix, emoji_id) for emoji_id, keyword in old_keywords
+                     for suffix in self._custom_keyword_suffixes(keyword)})
+                conn.execute("DELETE FROM custom_keywords WHERE emoji_id IN (SELECT value FROM json_each(?))",
+                             (id_list,))
+                
+                new_keywords = [(ids[name], keyword) for name in entries
+                                for keyword in dict.fromkeys(keywords.get(name) or custom_emoji_keywords(name))]
+                conn.executemany("INSERT INTO custom_keywords (emoji_id, keyword) VALUES (?, ?)", new_keywords)
+                conn.executemany(
+                    "INSERT OR IGNORE INTO custom_keyword_suffixes (suffix, emoji_id) VALUES (?, ?)",
+                    ((suffix, emoji_id) for emoji_id, keyword in new_keywords
+                     for suffix in self._custom_keyword_suffixes(keyword)))
+                conn.execute("UPDATE change_counters SET version = version + 1 WHERE name = 'custom_emojis'")
         except sqlite3.Error as e:
-            logger.error(f"お気に入り追加中にエラーが発生しました: {e}")
-            conn.rollback()
-            return False
+            logger.error(f"カスタム絵文字の登録中にエラーが発生しました: {e}")
+            return 0
+        
+        self._remove_orphan_blobs(replaced)
+        return len(ids)
     
-    def remove_from_favorites(self, emoji_id: int) -> bool:
+    def import_custom_emojis(self, directory: str, workers: Optional[int] = None,
+                             batch_size: int = CUSTOM_IMPORT_BATCH_SIZE) -> Dict[str, int]:
         """
-        絵文字をお気に入りから削除
+        ディレクトリ以下の画像をカスタム絵文字として一括登録する
+        
+        ファイル名（拡張子を除く）を名前にし、名前からキーワードを作る。画像の読み込み・ハッシュ計算・
+        画像ストアへの保存はスレッドで並列に行い、データベースへの登録はbatch_size件ずつまとめて行う。
         
         Args:
-            emoji_id: お気に入りから削除する絵文字のID
+            directory: 画像のあるディレクトリ
+            workers: 画像を処理する並列数。Noneなら自動
+            batch_size: 1トランザクションで登録する件数
             
         Returns:
-            削除に成功した場合はTrue、それ以外はFalse
+            見つけた画像（files）、登録したカスタム絵文字（emojis）、内容の異なる画像（images）の件数
         """
-        conn = self.connect()
-        cursor = conn.cursor()
+        paths = find_images(directory)
+        counts = {'files': len(paths), 'emojis': 0, 'images': 0}
+        blob_hashes = set()
+        
+        batch: List[StoredImage] = []
+        for stored in self.blobs.store_files(paths, workers):
+            blob_hashes.add(stored.blob_hash)
+            batch.append(stored)
+            if len(batch) >= batch_size:
+                counts['emojis'] += self.add_custom_emojis(batch)
+                batch = []
+        if batch:
+            counts['emojis'] += self.add_custom_emojis(batch)
+        
+        counts['images'] = len(blob_hashes)
+        logger.info(f"カスタム絵文字を取り込みました: {counts}")
+        return counts
+    
+    def remove_custom_emojis(self, names: Sequence[str]) -> int:
+        """
+        カスタム絵文字を削除する。ほかから参照されなくなった画像も削除する
         
+        Returns:
+            削除した件数
+        """
+        names_json = json.dumps(list(names))
         try:
-            cursor.execute("DELETE FROM favorites WHERE emoji_id = ?", (emoji_id,))
-            conn.commit()
-            logger.info(f"絵文字ID {emoji_id} をお気に入りから削除しました")
-            return True
+            rows = self._execute('remove_custom_emojis', """
+            SELECT id, blob_hash FROM custom_emojis WHERE name IN (SELECT value FROM json_each(?))
+            """, (names_json,))
+            removed = {row['id']: row['blob_hash'] for row in rows}
+            if removed:
+                id_list = json.dumps(list(removed))
+                self._execute('remove_custom_emojis', """
+                DELETE FROM custom_emojis WHERE id IN (SELECT value FROM json_each(?))
+                """, (id_list,), fetch=None)
+                old_keywords = self._execute('remove_custom_emojis', """
+                SELECT emoji_id, keyword FROM custom_keywords WHERE emoji_id IN (SELECT value FROM json_each(?))
+                """, (id_list,))
+                # 接尾辞はキーワードから求め直し、(接尾辞, ID) の組を主キーで消す
+                suffixes = sorted({(suffix, row['emoji_id']) for row in old_keywords
+                                   for suffix in self._custom_keyword_suffixes(row['keyword'])})
+                self._execute('remove_custom_emojis', """
+                DELETE FROM custom_keyword_suffixes
+                WHERE (suffix, emoji_id) IN (
+                    SELECT json_extract(value, '$[0]'), json_extract(value, '$[1]') FROM json_each(?)
+                )
+                """, (json.dumps(suffixes),), fetch=None)
+                self._execute('remove_custom_emojis', """
+                DELETE FROM custom_keywords WHERE emoji_id IN (SELECT value FROM json_each(?))
+                """, (id_list,), fetch=None)
+            self._commit('remove_custom_emojis')
         except sqlite3.Error as e:
-            logger.error(f"お気に入り削除中にエラーが発生しました: {e}")
-            conn.rollback()
-            return False
+            self.connect().rollback()
+            logger.error(f"カスタム絵文字の削除中にエラーが発生しました: {e}")
+            return 0
+        
+        self._remove_orphan_blobs(list(removed.values()))
+        return len(removed)
     
-    def add_to_history(self, emoji_id: int) -> bool:
+    def get_custom_emoji(self, name: str) -> Optional[Dict[str, Any]]:
         """
-        絵文字を使用履歴に追加
+        名前でカスタム絵文字を取得する
         
-        Args:
-            emoji_id: 履歴に追加する絵文字のID
-            
         Returns:
-            追加に成功した場合はTrue、それ以外はFalse
+            カスタム絵文字のデータ（idはsearch_emojisと同じ負の値、imageは画像ファイルのパス）。
+            見つからない場合はNone
         """
-        conn = self.connect()
-        cursor = conn.cursor()
-        
         try:
-            cursor.execute("INSERT INTO history (emoji_id) VALUES (?)", (emoji_id,))
-            conn.commit()
-            logger.info(f"絵文字ID {emoji_id} を履歴に追加しました")
-            return True
+            row = self._execute('get_custom_emoji', """
+            SELECT
+                -c.id AS id, c.name, c.blob_hash, c.mime, c.created_at,
+                (SELECT GROUP_CONCAT(ck.keyword, ',') FROM custom_keywords ck WHERE ck.emoji_id = c.id) AS keywords
+            FROM custom_emojis c
+            WHERE c.name = ?
+            """, (name,), fetch='one')
+            if row is None:
+                return None
+            emoji = dict(row)
+            emoji['keywords'] = emoji['keywords'].split(',') if emoji['keywords'] else []
+            emoji['unicode'] = f":{emoji['name']}:"
+            emoji['image'] = str(self.blobs.path(emoji['blob_hash']))
+            return emoji
         except sqlite3.Error as e:
-            logger.error(f"履歴追加中にエラーが発生しました: {e}")
-            conn.rollback()
-            return False
+            logger.error(f"カスタム絵文字の取得中にエラーが発生しました: {e}")
+            return None
     
-    def get_recent_emojis(self, limit: int = 20) -> List[Dict[str, Any]]:
+    def get_custom_thumbnail(self, name: str, size: int = THUMBNAIL_SIZE) -> Optional[str]:
         """
-        最近使用した絵文字を取得
+        カスタム絵文字のサムネイルのパスを返す（なければ作成してキャッシュする）
         
         Args:
-            limit: 返す結果の最大数
+            name: カスタム絵文字の名前
+            size: 一辺の最大ピクセル数
             
         Returns:
-            絵文字データのリスト
+            サムネイルのパス。Pillowがない場合や縮小できない形式では元の画像のパス。見つからない場合はNone
+        """
+        emoji = self.get_custom_emoji(name)
+        if emoji is None:
+            return None
+        path = self.thumbnails.get(emoji['blob_hash'], size)
+        return str(path) if path is not None else None
+    
+    def export_user_data(self, destination: TextIO) -> Dict[str, int]:
+        """
+        お気に入りと履歴をJSON Lines形式で書き出す
+        
+        絵文字は環境ごとに変わりうるIDではなくunicodeで記録する。各行のJSONはSQLite側で組み立て、
+        カーソルから順に書き出すので、履歴が何百万件あってもメモリ使用量は一定。
+        
+        Args:
+            destination: 書き込み先のテキストストリーム
+            
+        Returns:
+            種類（favorite, history）ごとの書き出した件数
         """
         conn = self.connect()
-        cursor = conn.cursor()
+        counts = {'favorite': 0, 'history': 0}
+        destination.write(json.dumps({'type': 'meta', 'version': EXPORT_FORMAT_VERSION,
+                                      'exported_at': time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime())},
+                                     separators=(',', ':')) + '\n')
+    
+        queries = {
+            'favorite': """
+            SELECT json_object('type', 'favorite', 'unicode', e.unicode,
+                               'position', f.position, 'created_at', f.created_at)
+            FROM favorites f JOIN emojis e ON e.id = f.emoji_id
+            ORDER BY f.position, f.emoji_id
+            """,
+            'history': """
+            SELECT json_object('type', 'history', 'unicode', e.unicode, 'used_at', h.used_at)
+            FROM history h JOIN emojis e ON e.id = h.emoji_id
+            ORDER BY h.id
+            """,
+        }
+        for kind, sql in queries.items():
+            cursor = conn.cursor()
+            cursor.row_factory = None  # sqlite3.Rowを作る手間を省く
+            cursor.execute(sql)
+            while True:
+                rows = cursor.fetchmany(EXPORT_FETCH_SIZE)
+                if not rows:
+                    break
+                destination.write(''.join(line + '\n' for line, in rows))
+                counts[kind] += len(rows)
+    
+        logger.info(f"エクスポートしました: お気に入り{counts['favorite']}件, 履歴{counts['history']}件")
+        return counts
+    
+    
+    @staticmethod
+    def _read_export_batches(source: TextIO, batch_size: int) -> Iterator[str]:
+        """
+        エクスポートファイルを読み、batch_size行ずつJSON配列の文字列にして返す。
+        各行の解析はSQLite（json_each）に任せ、ここでは先頭行のメタ情報だけを確かめる
+        """
+        batch: List[str] = []
+        first = True
+        for line in source:
+            line = line.strip()
+            if not line:
+                continue
+            if first:
+                first = False
+                record = json.loads(line)
+                if record.get('type') == 'meta':
+                    if record.get('version') != EXPORT_FORMAT_VERSION:
+                        raise ValueError(f"対応していないエクスポート形式です: {record.get('version')}")
+                    continue
+            batch.append(line)
+            if len(batch) >= batch_size:
+                yield '[' + ','.join(batch) + ']'
+                batch = []
+        if batch:
+            yield '[' + ','.join(batch) + ']'
+    
+    def import_user_data(self, source: TextIO, replace: bool = False,
+                         batch_size: int = 20000) -> Dict[str, int]:
+        """
+        export_user_dataで書き出したお気に入りと履歴を取り込む
         
-        try:
-            cursor.execute("""
-            SELECT 
-                e.id, e.unicode, e.short_name, e.group_name, e.subgroup,
-                GROUP_CONCAT(k.keyword, ',') as keywords,
-                CASE WHEN f.emoji_id IS NOT NULL THEN 1 ELSE 0 END as is_favorite,
-                MAX(h.used_at) as last_used
-            FROM 
-                history h
-            JOIN 
-                emojis e ON h.emoji_id = e.id
-            LEFT JOIN 
-                emoji_keywords ek ON e.id = ek.emoji_id
-            LEFT JOIN 
-                keywords k ON ek.keyword_id = k.id
-            LEFT JOIN 
-                favorites f ON e.id = f.emoji_id
-            GROUP BY 
-                e.id
-            ORDER BY 
-                last_used DESC
-            LIMIT ?
-            """, (limit,))
+        batch_size件ごとに1トランザクションで取り込むので、途中で他の接続の書き込みを長く待たせない。
+        各バッチは集合演算の数文で反映し、履歴の行ごとのトリガー（遷移回数・使用回数・変更カウンター）は止めて
+        バッチの最後にまとめて更新する。絵文字はunicodeで（異体字セレクタや肌の色の違いを無視して）
+        カタログから引き直す。
+        
+        Args:
+            source: 読み込むテキストストリーム
+            replace: Trueなら既にあるお気に入りの位置と追加日時を上書きする。Falseなら既存を優先する
+            batch_size: 1トランザクションで取り込むレコード数
             
-            results = []
-            for row in cursor.fetchall():
-                emoji = dict(row)
-                emoji['keywords'] = emoji['keywords'].split(',') if emoji['keywords'] else []
-                emoji['is_favorite'] = bool(emoji['is_favorite'])
-                emoji.pop('last_used', None)  # last_usedフィールドを削除
-                results.append(emoji)
+        Returns:
+            追加したお気に入り（favorite）・履歴（history）と、重複（duplicate）・
+            カタログにない絵文字（unknown）で取り込まなかった件数
+        """
+        counts = {'favorite': 0, 'history': 0, 'duplicate': 0, 'unknown': 0}
+        favorite_sql = """
+        INSERT INTO favorites (emoji_id, position, created_at)
+        SELECT i.emoji_id, ? + b.position, b.created_at
+        FROM temp.import_batch b JOIN temp.import_ids i ON i.unicode = b.unicode
+        WHERE b.kind = 'favorite' AND i.emoji_id IS NOT NULL
+        ORDER BY b.seq
+        """ + (
+            "ON CONFLICT (emoji_id) DO UPDATE SET position = excluded.position, created_at = excluded.created_at"
+            if replace else
+            "ON CONFLICT (emoji_id) DO NOTHING"
+        )
+        # 同じ絵文字・同じ日時の履歴は取り込み済みとみなす（同じファイルを2回取り込んでも増えない）
+        history_sql = """
+        INSERT INTO history (emoji_id, used_at)
+        SELECT i.emoji_id, b.used_at
+        FROM temp.import_batch b JOIN temp.import_ids i ON i.unicode = b.unicode
+        WHERE b.kind = 'history' AND i.emoji_id IS NOT NULL
+          AND NOT EXISTS (SELECT 1 FROM history h WHERE h.used_at = b.used_at AND h.emoji_id = i.emoji_id)
+        ORDER BY b.seq
+        """
+        
+        conn = self.connect()
+        # 遷移表の更新は広い範囲に散らばるので、取り込み中だけページキャッシュを広げる
+        cache_size = conn.execute("PRAGMA main.cache_size").fetchone()[0]
+        try:
+            conn.create_function('emoji_key', 1, emoji_key, deterministic=True)
+            conn.executescript("""
+            CREATE TEMP TABLE IF NOT EXISTS import_batch (
+              seq INTEGER PRIMARY KEY,
+              kind TEXT NOT NULL,
+              unicode TEXT,
+              position INTEGER,
+              created_at TEXT,
+              used_at TEXT
+            );
+            CREATE TEMP TABLE IF NOT EXISTS import_ids (
+              unicode TEXT PRIMARY KEY,
+              emoji_id INTEGER
+            );
+            DELETE FROM temp.import_ids;
+            """)
+            conn.execute(f"PRAGMA main.cache_size = {IMPORT_CACHE_SIZE}")
+            # 既存のお気に入りの後ろに、ファイル内の順で並べる
+            base = conn.execute("SELECT COALESCE(MAX(position), 0) + 1 FROM favorites").fetchone()[0]
+            for batch in self._read_export_batches(source, batch_size):
+                with conn:
+                    conn.execute("DELETE FROM temp.import_batch")
+                    conn.execute("""
+                    INSERT INTO temp.import_batch (seq, kind, unicode, position, created_at, used_at)
+                    SELECT
+                        r.key,
+                        json_extract(r.value, '$.type'),
+                        json_extract(r.value, '$.unicode'),
+                        COALESCE(json_extract(r.value, '$.position'), 0),
+                        json_extract(r.value, '$.created_at'),
+                        json_extract(r.value, '$.used_at')
+                    FROM json_each(?) r
+                    WHERE json_extract(r.value, '$.type') IN ('favorite', 'history')
+                    """, (batch,))
+                    # 逆引きは文字列の種類ごとに一度だけ（履歴は同じ絵文字の繰り返しが大半）
+                    conn.execute("""
+                    INSERT INTO temp.import_ids (unicode, emoji_id)
+                    SELECT u.unicode,
+                           (SELECT MIN(e.id) FROM emojis e WHERE e.unicode_key = emoji_key(u.unicode))
+                    FROM (SELECT DISTINCT unicode FROM temp.import_batch) u
+                    WHERE u.unicode NOT IN (SELECT unicode FROM temp.import_ids)
+                    """)
+                    records, unknown = conn.execute("""
+                    SELECT COUNT(*), COUNT(*) - COUNT(i.emoji_id)
+                    FROM temp.import_batch b LEFT JOIN temp.import_ids i ON i.unicode = b.unicode
+                    """).fetchone()
+                    added_favorites = conn.execute(favorite_sql, (base,)).rowcount
+                
+                    last_id = conn.execute("SELECT COALESCE(MAX(id), 0) FROM history").fetchone()[0]
+                    conn.execute("INSERT INTO suspended_triggers (name) VALUES ('history')")
+                    added_history = conn.execute(history_sql).rowcount
+                    conn.execute("DELETE FROM suspended_triggers WHERE name = 'history'")
+                    if added_history:
+                        self._count_transitions(conn, last_id)
+                        self._count_usage(conn, last_id)
+                        conn.execute("UPDATE change_counters SET version = version + 1 WHERE name = 'history'")
             
-            return results
+                counts['favorite'] += added_favorites
+                counts['history'] += added_history
+                counts['unknown'] += unknown
+                counts['duplicate'] += records - unknown - added_favorites - added_history
+        
+            logger.info(f"インポートしました: {counts}")
+            return counts
+        except (sqlite3.Error, ValueError) as e:
+            logger.error(f"インポート中にエラーが発生しました: {e}")
+            raise
+        finally:
+            conn.execute(f"PRAGMA main.cache_size = {cache_size}")
+    
+    
+    def backup(self, destination: str, pages: int = 256, sleep: float = 0.005,
+               progress: Optional[Callable[[int, int, int], None]] = None) -> None:
+        """
+        利用者データベースを使用中のままバックアップする（SQLiteのオンラインバックアップAPI）
+        
+        pagesページずつコピーし、その間にロックを手放すので、アプリの書き込みを長く止めない。
+        途中で他の接続が書き込んだ場合はSQLiteが自動的にコピーをやり直す。
+        
+        Args:
+            destination: バックアップ先のファイルパス（既存のファイルは上書きされる）
+            pages: 1回にコピーするページ数
+            sleep: コピーの合間に待つ秒数
+            progress: (status, remaining, total) を受け取る進捗コールバック
+        """
+        conn = self.connect()
+        target = sqlite3.connect(destination)
+        try:
+            start = time.perf_counter()
+            conn.backup(target, pages=pages, progress=progress, name='main', sleep=sleep)
+            logger.info(f"バックアップしました: {destination} ({(time.perf_counter() - start) * 1000:.0f}ms)")
         except sqlite3.Error as e:
-            logger.error(f"最近使用した絵文字の取得中にエラーが発生しました: {e}")
-            return []
+            logger.error(f"バックアップ中にエラーが発生しました: {e}")
+            raise
+        finally:
+            target.close()
+
+def print_stats(emoji_data: EmojiData) -> None:
+    """
+    クエリ統計とスロークエリを表示する
+    """
+    print("クエリ統計:")
+    for method, stats in emoji_data.stats().items():
+        print(f"- {method}: {stats['count']}回, {stats['rows']}行, "
+              f"平均 {stats['mean_ms']}ms, p50 {stats['p50_ms']}ms, "
+              f"p95 {stats['p95_ms']}ms, p99 {stats['p99_ms']}ms, 最大 {stats['max_ms']}ms")
+        buckets = [f"≤{bound}ms:{n}" for bound, n in stats['histogram'].items() if n]
+        print(f"  ヒストグラム: {' '.join(buckets)}")
+        if stats['busy_retries']:
+            print(f"  ロック待ち: 再試行{stats['busy_retries']}回, {stats['lock_wait_ms']}ms")
+    for event in emoji_data.slow_queries:
+        print(f"スロークエリ ({event.method}): {event.elapsed_ms:.1f}ms")
+        for detail in event.plan or []:
+            print(f"  {detail}")
 
 def main():
     """
     テスト用のメイン関数
     """
+    import argparse
+    import io
     import sys
+    from profiling import Profiler
+    from shortcode import ShortcodeConverter, AMBIGUITY_POLICIES
     
-    # コマンドライン引数のパース
-    if len(sys.argv) < 2:
-        print("使用方法: python emoji_data.py [search <クエリ>|categories|favorites|info <絵文字ID>]")
-        sys.exit(1)
+    # 全サブコマンド共通のオプション
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument('--stats', action='store_true', help='実行後にクエリ統計を表示')
+    common.add_argument('--slow-ms', type=float, help='スロークエリとして記録する閾値（ミリ秒）')
+    common.add_argument('--explain', action='store_true', help='スロークエリのクエリプランを取得')
+    common.add_argument('--profile', action='store_true', help='処理時間とメモリのピークを表示')
+    common.add_argument('--profile-output', metavar='FILE', help='cProfileの結果をpstats形式で保存する（--profileと併用）')
     
-    emoji_data = EmojiData()
-    command = sys.argv[1]
+    # 表示できる絵文字に絞り込むオプション（search, categories）
+    support = argparse.ArgumentParser(add_help=False)
+    support.add_argument('--max-version', type=float, help='この絵文字バージョン以下のみ（例: 13.0）')
+    support.add_argument('--qualified-only', action='store_true', help='fully-qualifiedの絵文字のみ')
     
-    try:
-        if command == 'search' and len(sys.argv) >= 3:
-            query = sys.argv[2]
-            results = emoji_data.search_emojis(query=query)
+    parser = argparse.ArgumentParser(description='絵文字データベースユーティリティ')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    
+    search_parser = subparsers.add_parser('search', parents=[common, support], help='絵文字を検索')
+    search_parser.add_argument('query', help='検索キーワード')
+    search_parser.add_argument('--fuzzy', action='store_true', help='タイプミスを許容して検索')
+    search_parser.add_argument('--custom', action='store_true', help='カスタム絵文字も検索')
+    subparsers.add_parser('categories', parents=[common, support], help='カテゴリ一覧を表示')
+    page_parser = subparsers.add_parser('page', parents=[common],
+                                        help='カテゴリの一覧ページを事前エンコード済みのJSONで出力')
+    page_parser.add_argument('group', help='グループ名')
+    page_parser.add_argument('--subgroup', help='サブグループ名（省略時はグループ全体）')
+    page_parser.add_argument('--page', type=int, default=0, help='ページ番号（0始まり）')
+    favorites_parser = subparsers.add_parser('favorites', parents=[common], help='お気に入りを表示・編集')
+    favorites_parser.add_argument('--add', type=int, nargs='+', metavar='ID', help='先頭に追加する絵文字ID')
+    favorites_parser.add_argument('--remove', type=int, nargs='+', metavar='ID', help='削除する絵文字ID')
+    favorites_parser.add_argument('--reorder', type=int, nargs='+', metavar='ID', help='この順に並べ替える絵文字ID')
+    info_parser = subparsers.add_parser('info', parents=[common], help='絵文字の詳細を表示')
+    info_parser.add_argument('emoji_id', type=int, help='絵文字ID')
+    query_parser = subparsers.add_parser('query', parents=[common], help='構造化クエリで検索')
+    query_parser.add_argument('query', help='検索クエリ（例: "猫 -顔 subgroup:動物-哺乳類 is:fav"）')
+    query_parser.add_argument('--limit', type=int, default=100, help='表示する件数')
+    query_parser.add_argument('--facets', action='store_true', help='グループ・サブグループごとの件数も表示')
+    watch_parser = subparsers.add_parser('watch', parents=[common], help='お気に入りと履歴の変更を表示し続ける')
+    watch_parser.add_argument('--interval', type=float, default=0.5, help='確認する間隔（秒）')
+    lookup_parser = subparsers.add_parser('lookup', parents=[common], help='絵文字から逆引き')
+    lookup_parser.add_argument('text', help='絵文字（異体字セレクタや肌の色の違いは無視）')
+    related_parser = subparsers.add_parser('related', parents=[common], help='関連する絵文字を表示')
+    related_parser.add_argument('emoji_id', type=int, help='絵文字ID')
+    related_parser.add_argument('--limit', type=int, default=10, help='表示する件数')
+    next_parser = subparsers.add_parser('next', parents=[common], help='次に使いそうな絵文字を表示')
+    next_parser.add_argument('emoji_id', type=int, nargs='?', help='直前の絵文字ID（省略時は最新の履歴）')
+    next_parser.add_argument('--limit', type=int, default=10, help='表示する件数')
+    top_parser = subparsers.add_parser('top', parents=[common], help='今日・今週よく使った絵文字を表示')
+    top_parser.add_argument('--window', choices=tuple(USAGE_WINDOWS), default='week', help='集計期間')
+    top_parser.add_argument('--limit', type=int, default=20, help='表示する件数')
+    trending_parser = subparsers.add_parser('trending', parents=[common], help='今日急に使われ始めた絵文字を表示')
+    trending_parser.add_argument('--limit', type=int, default=10, help='表示する件数')
+    convert_parser = subparsers.add_parser('convert', parents=[common],
+                                           help=':キーワード: を絵文字に置き換える（標準入力→標準出力）')
+    convert_parser.add_argument('--policy', choices=AMBIGUITY_POLICIES, default='first',
+                                help='複数の絵文字に該当するキーワードの扱い')
+    convert_parser.add_argument('--input', '-i', help='入力ファイル（省略時は標準入力）')
+    convert_parser.add_argument('--output', '-o', help='出力ファイル（省略時は標準出力）')
+    convert_parser.add_argument('--chunk-size', type=int, default=1 << 20, help='一度に処理する文字数')
+    
+    export_parser = subparsers.add_parser('export', parents=[common],
+                                          help='お気に入りと履歴をJSON Linesで書き出す')
+    export_parser.add_argument('--output', '-o', help='出力ファイル（省略時は標準出力）')
+    import_parser = subparsers.add_parser('import', parents=[common],
+                                          help='exportで書き出したお気に入りと履歴を取り込む')
+    import_parser.add_argument('file', nargs='?', help='入力ファイル（省略時は標準入力）')
+    import_parser.add_argument('--replace', action='store_true', help='既にあるお気に入りの位置と日時を上書きする')
+    import_parser.add_argument('--batch-size', type=int, default=20000, help='1トランザクションで取り込む件数')
+    custom_parser = subparsers.add_parser('custom', parents=[common], help='カスタム絵文字を取り込む・削除する')
+    custom_parser.add_argument('--import', dest='import_dir', metavar='DIR',
+                               help='このディレクトリ以下の画像を取り込む（ファイル名が名前になる）')
+    custom_parser.add_argument('--workers', type=int, help='画像を処理する並列数')
+    custom_parser.add_argument('--remove', nargs='+', metavar='NAME', help='削除するカスタム絵文字の名前')
+    custom_parser.add_argument('--thumbnail', metavar='NAME', help='サムネイルのパスを表示する')
+    custom_parser.add_argument('--size', type=int, default=THUMBNAIL_SIZE, help='サムネイルの一辺（ピクセル）')
+    backup_parser = subparsers.add_parser('backup', parents=[common],
+                                          help='利用者データベースを使用中のままバックアップする')
+    backup_parser.add_argument('destination', help='バックアップ先のファイル')
+    backup_parser.add_argument('--pages', type=int, default=256, help='1回にコピーするページ数')
+    
+    args = parser.parse_args()
+    
+    emoji_data = EmojiData(slow_query_ms=args.slow_ms, explain_slow_queries=args.explain)
+    
+    def run_command():
+        if args.command == 'search':
+            query = args.query
+            results = emoji_data.search_emojis(query=query, fuzzy=args.fuzzy,
+                                               max_version=args.max_version,
+                                               qualified_only=args.qualified_only,
+                                               include_custom=args.custom)
             print(f"検索結果 ('{query}'):")
             for emoji in results:
                 print(f"{emoji['unicode']} - {emoji['short_name']} ({emoji['group_name']})")
             print(f"合計: {len(results)}件")
         
-        elif command == 'categories':
-            categories = emoji_data.get_emoji_categories()
+        elif args.command == 'categories':
+            categories = emoji_data.get_emoji_categories(max_version=args.max_version,
+                                                         qualified_only=args.qualified_only)
             print("絵文字カテゴリ:")
             for category in categories:
                 print(f"- {category}")
         
-        elif command == 'favorites':
+        elif args.command == 'page':
+            payload = emoji_data.get_category_page(args.group, args.subgroup, args.page)
+            if payload is None:
+                print(f"カテゴリ '{args.group}' のページ {args.page} は見つかりませんでした。")
+            else:
+                sys.stdout.buffer.write(payload + b'\n')
+                sys.stdout.flush()
+        
+        elif args.command == 'favorites':
+            if args.add:
+                emoji_data.add_favorites(args.add)
+            if args.remove:
+                emoji_data.remove_favorites(args.remove)
+            if args.reorder:
+                emoji_data.reorder_favorites(args.reorder)
             favorites = emoji_data.get_favorites()
             print("お気に入りの絵文字:")
             for emoji in favorites:
                 print(f"{emoji['unicode']} - {emoji['short_name']}")
             print(f"合計: {len(favorites)}件")
         
-        elif command == 'info' and len(sys.argv) >= 3:
-            emoji_id = int(sys.argv[2])
+        elif args.command == 'query':
+            if args.facets:
+                faceted = emoji_data.search_faceted(args.query, limit=args.limit)
+                results, total = faceted['results'], faceted['total']
+            else:
+                results = emoji_data.query_emojis(args.query, limit=args.limit)
+                total = len(results)
+            print(f"検索結果 ('{args.query}'):")
+            for emoji in results:
+                print(f"{emoji['unicode']} - {emoji['short_name']} ({emoji['subgroup']})")
+            print(f"合計: {total}件")
+            if args.facets:
+                for node in faceted['groups']:
+                    print(f"- {node['group_name'] or '(グループなし)'}: {node['count']}件")
+                    for child in node['subgroups']:
+                        print(f"    - {child['subgroup'] or '(なし)'}: {child['count']}件")
+        
+        elif args.command == 'watch':
+            emoji_data.subscribe_changes(
+                lambda changed: print(', '.join(f"{name}: {version}" for name, version in changed.items()),
+                                      flush=True))
+            emoji_data.start_watching(args.interval)
+            print("変更を監視しています（Ctrl+Cで終了）...")
+            try:
+                while True:
+                    time.sleep(3600)
+            except KeyboardInterrupt:
+                pass
+        
+        elif args.command == 'lookup':
+            emoji = emoji_data.lookup_by_unicode(args.text)
+            if emoji:
+                print(f"{emoji['unicode']} - {emoji['short_name']} (ID: {emoji['id']})")
+                if emoji['modifiers']:
+                    print(f"肌の色: {' '.join(f'U+{ord(c):04X}' for c in emoji['modifiers'])}")
+            else:
+                print(f"'{args.text}' に一致する絵文字は見つかりませんでした。")
+        
+        elif args.command == 'related':
+            related = emoji_data.get_related(args.emoji_id, args.limit)
+            print(f"関連する絵文字 (ID: {args.emoji_id}):")
+            for emoji in related:
+                print(f"{emoji['unicode']} - {emoji['short_name']} ({emoji['score']:.3f})")
+            print(f"合計: {len(related)}件")
+        
+        elif args.command == 'next':
+            suggestions = emoji_data.get_next_emojis(args.emoji_id, args.limit)
+            print("次に使いそうな絵文字:")
+            for emoji in suggestions:
+                print(f"{emoji['unicode']} - {emoji['short_name']} ({emoji['count']}回)")
+            print(f"合計: {len(suggestions)}件")
+        
+        elif args.command == 'top':
+            top = emoji_data.get_top_emojis(args.window, args.limit)
+            print(f"{'今日' if args.window == 'day' else '今週'}よく使った絵文字:")
+            for emoji in top:
+                print(f"{emoji['unicode']} - {emoji['short_name']} ({emoji['count']}回)")
+            print(f"合計: {len(top)}件")
+        
+        elif args.command == 'trending':
+            trending = emoji_data.get_trending(args.limit)
+            print("急上昇の絵文字:")
+            for emoji in trending:
+                print(f"{emoji['unicode']} - {emoji['short_name']} "
+                      f"(今日{emoji['count']}回, 1日平均{emoji['baseline']}回, スコア{emoji['score']})")
+            print(f"合計: {len(trending)}件")
+        
+        elif args.command == 'export':
+            destination = (open(args.output, 'w', encoding='utf-8') if args.output
+                           else io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8'))
+            try:
+                counts = emoji_data.export_user_data(destination)
+            finally:
+                if args.output:
+                    destination.close()
+                else:
+                    destination.flush()
+            print(f"お気に入り{counts['favorite']}件, 履歴{counts['history']}件を書き出しました", file=sys.stderr)
+        
+        elif args.command == 'import':
+            source = (open(args.file, 'r', encoding='utf-8') if args.file
+                      else io.TextIOWrapper(sys.stdin.buffer, encoding='utf-8'))
+            try:
+                counts = emoji_data.import_user_data(source, replace=args.replace, batch_size=args.batch_size)
+            finally:
+                if args.file:
+                    source.close()
+            print(f"お気に入り{counts['favorite']}件, 履歴{counts['history']}件を取り込みました"
+                  f"（重複{counts['duplicate']}件, 不明な絵文字{counts['unknown']}件）")
+        
+        elif args.command == 'custom':
+            if args.import_dir:
+                counts = emoji_data.import_custom_emojis(args.import_dir, workers=args.workers)
+                print(f"画像{counts['files']}件から{counts['emojis']}件のカスタム絵文字を登録しました"
+                      f"（内容の異なる画像{counts['images']}件）")
+            if args.remove:
+                print(f"{emoji_data.remove_custom_emojis(args.remove)}件のカスタム絵文字を削除しました")
+            if args.thumbnail:
+                path = emoji_data.get_custom_thumbnail(args.thumbnail, args.size)
+                print(path if path else f"カスタム絵文字 '{args.thumbnail}' は見つかりませんでした。")
+        
+        elif args.command == 'backup':
+            emoji_data.backup(args.destination, pages=args.pages)
+            print(f"バックアップしました: {args.destination}")
+        
+        elif args.command == 'convert':
+            converter = ShortcodeConverter.from_emoji_data(emoji_data, policy=args.policy)
+            # 不正なバイト列もそのまま通す
+            source = (open(args.input, 'r', encoding='utf-8', errors='surrogateescape') if args.input
+                      else io.TextIOWrapper(sys.stdin.buffer, encoding='utf-8', errors='surrogateescape'))
+            destination = (open(args.output, 'w', encoding='utf-8', errors='surrogateescape') if args.output
+                           else io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8', errors='surrogateescape'))
+            try:
+                replaced = converter.convert_stream(source, destination, chunk_size=args.chunk_size)
+            finally:
+                if args.input:
+                    source.close()
+                if args.output:
+                    destination.close()
+                else:
+                    destination.flush()
+            logger.info(f"{replaced}件のショートコードを変換しました")
+        
+        elif args.command == 'info':
+            emoji_id = args.emoji_id
             emoji = emoji_data.get_emoji_by_id(emoji_id)
             if emoji:
                 print(f"絵文字情報 (ID: {emoji_id}):")
@@ -446,14 +2855,23 @@ def main():
                 print(f"名前: {emoji['short_name']}")
                 print(f"グループ: {emoji['group_name']}")
                 print(f"サブグループ: {emoji['subgroup']}")
+                print(f"状態: {emoji['status'] or '不明'}")
+                print(f"絵文字バージョン: {emoji['emoji_version'] if emoji['emoji_version'] is not None else '不明'}")
                 print(f"キーワード: {', '.join(emoji['keywords'])}")
                 print(f"お気に入り: {'はい' if emoji['is_favorite'] else 'いいえ'}")
             else:
                 print(f"ID {emoji_id} の絵文字は見つかりませんでした。")
-        
-        else:
-            print("無効なコマンドです。")
-            print("使用方法: python emoji_data.py [search <クエリ>|categories|favorites|info <絵文字ID>]")
+    
+    try:
+        profiler = Profiler(enabled=args.profile, pstats_path=args.profile_output)
+        with profiler:
+            with profiler.stage('connect'):
+                emoji_data.connect()
+            with profiler.stage(args.command):
+                run_command()
+        profiler.report()
+        if args.stats:
+            print_stats(emoji_data)
     
     finally:
         emoji_data.close()
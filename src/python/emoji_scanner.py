@@ -0,0 +1,238 @@
+"""
+任意のテキストからカタログの絵文字を見つけるスキャナー。
+カタログのunicode列（ZWJ・国旗・キーキャップなどの複数コードポイントを含む）を
+コードポイントのトライに変換し、最長一致のオートマトンとして一度だけコンパイルする。
+"""
+
+import argparse
+import re
+import sys
+from typing import Dict, Iterable, Iterator, List, Optional, TextIO, Tuple
+
+# 異体字セレクタ。カタログ側は付いていないので、テキスト側では読み飛ばす
+VARIATION_SELECTORS = '\ufe0e\ufe0f'
+_OPTIONAL_VS = f"[{VARIATION_SELECTORS}]?"
+
+# 先頭文字の範囲をまとめるときに許す隙間（コードポイント数）
+_RANGE_GAP = 64
+
+def _trie_to_pattern(node: Dict[str, dict]) -> str:
+    """
+    トライのノードを正規表現に変換する。長い候補を優先する貪欲な任意グループで最長一致にする
+    """
+    terminal = '' in node
+    branches = []
+    leaves = []
+    for char in sorted(c for c in node if c):
+        child = node[char]
+        if len(child) == 1 and '' in child:
+            leaves.append(re.escape(char))
+        else:
+            branches.append(re.escape(char) + _OPTIONAL_VS + _trie_to_pattern(child))
+
+    if leaves:
+        leaf_pattern = leaves[0] if len(leaves) == 1 else f"[{''.join(leaves)}]"
+        branches.append(leaf_pattern + _OPTIONAL_VS)
+
+    if not branches:
+        return ''
+    pattern = branches[0] if len(branches) == 1 else f"(?:{'|'.join(branches)})"
+    if terminal:
+        pattern = f"(?:{pattern})?"
+    return pattern
+
+def _first_char_class(chars: Iterable[str]) -> str:
+    """
+    先頭文字の集合を少数の範囲からなる文字クラスにする
+
+    個々の文字を列挙した巨大なクラスはBMP外の文字で極端に遅くなるため、
+    近い文字をまとめた範囲で候補位置を絞り、実際の一致はトライ側で確かめる。
+    """
+    ranges: List[List[int]] = []
+    for code in sorted({ord(c) for c in chars}):
+        if ranges and code - ranges[-1][1] <= _RANGE_GAP:
+            ranges[-1][1] = code
+        else:
+            ranges.append([code, code])
+    return '[' + ''.join(
+        re.escape(chr(low)) if low == high else f"{re.escape(chr(low))}-{re.escape(chr(high))}"
+        for low, high in ranges
+    ) + ']'
+
+class EmojiScanner:
+    """
+    カタログの絵文字をテキストから最長一致で検出するスキャナー
+
+    検出結果は (テキスト先頭からのコードポイント位置, 絵文字ID) の組。
+    重なり合う候補は左側優先・最長一致で1つだけ返す。
+    """
+
+    def __init__(self, catalog: Dict[str, int]):
+        """
+        Args:
+            catalog: unicode文字列から絵文字IDへの辞書
+        """
+        self._ids: Dict[str, int] = {}
+        trie: Dict[str, dict] = {}
+        for unicode, emoji_id in catalog.items():
+            key = unicode.translate({ord(c): None for c in VARIATION_SELECTORS})
+            if not key:
+                continue
+            self._ids.setdefault(key, emoji_id)
+            node = trie
+            for char in key:
+                node = node.setdefault(char, {})
+            node[''] = {}
+
+        # 異体字セレクタを含めた最長一致の長さ（ストリーム処理の持ち越し幅）
+        self.max_length = 2 * max((len(key) for key in self._ids), default=1)
+        self._candidate = re.compile(_first_char_class(trie) if trie else r'(?!x)x')
+        self._pattern = re.compile(_trie_to_pattern(trie) or r'(?!x)x')
+        self._strip_vs = str.maketrans('', '', VARIATION_SELECTORS)
+
+    @classmethod
+    def from_emoji_data(cls, emoji_data, include_symbols: bool = False) -> 'EmojiScanner':
+        """
+        EmojiDataのカタログからスキャナーを作成する
+
+        Args:
+            emoji_data: EmojiDataのインスタンス
+            include_symbols: グループのない記号類（「、」「-」など）も対象にする
+
+        Returns:
+            EmojiScanner
+        """
+        return cls(emoji_data.get_unicode_map(include_symbols=include_symbols))
+
+    def _matches(self, text: str, last_start: Optional[int] = None) -> Iterator[Tuple[int, int, int]]:
+        """
+        候補位置だけをトライで照合し、(開始, 終了, 絵文字ID) を順に返す
+
+        Args:
+            text: 検索対象のテキスト
+            last_start: これより後ろで始まる一致は返さない
+        """
+        ids = self._ids
+        strip_vs = self._strip_vs
+        candidate = self._candidate.search
+        match_at = self._pattern.match
+        pos = 0
+        while True:
+            found = candidate(text, pos)
+            if found is None:
+                return
+            start = found.start()
+            if last_start is not None and start > last_start:
+                return
+            match = match_at(text, start)
+            if match is None or match.end() == start:
+                pos = start + 1
+                continue
+            emoji_id = ids.get(match.group().translate(strip_vs))
+            if emoji_id is not None:
+                yield start, match.end(), emoji_id
+            pos = match.end()
+
+    def finditer(self, text: str, base_offset: int = 0) -> Iterator[Tuple[int, int]]:
+        """
+        テキスト中の絵文字を順に返す
+
+        Args:
+            text: 検索対象のテキスト
+            base_offset: 返す位置に加算するオフセット
+
+        Yields:
+            (位置, 絵文字ID)
+        """
+        for start, _, emoji_id in self._matches(text):
+            yield base_offset + start, emoji_id
+
+    def scan(self, text: str) -> List[Tuple[int, int]]:
+        """
+        テキスト中の絵文字をすべて返す
+
+        Args:
+            text: 検索対象のテキスト
+
+        Returns:
+            (位置, 絵文字ID) のリスト
+        """
+        return list(self.finditer(text))
+
+    def scan_chunks(self, chunks: Iterable[str]) -> Iterator[Tuple[int, int]]:
+        """
+        分割されたテキストを順に走査する。チャンク境界をまたぐ絵文字も検出する
+
+        Args:
+            chunks: テキストの断片
+
+        Yields:
+            (テキスト全体での位置, 絵文字ID)
+        """
+        buffer = ''
+        offset = 0  # bufferの先頭のテキスト全体での位置
+        for chunk in chunks:
+            if not chunk:
+                continue
+            buffer += chunk
+            # ここより後ろで始まる一致は、次のチャンクでさらに伸びる可能性がある
+            safe_start = len(buffer) - self.max_length
+            if safe_start < 0:
+                continue
+            cut = safe_start + 1
+            for start, end, emoji_id in self._matches(buffer, last_start=safe_start):
+                yield offset + start, emoji_id
+                cut = max(cut, end)
+            buffer = buffer[cut:]
+            offset += cut
+
+        yield from self.finditer(buffer, offset)
+
+    def scan_stream(self, stream: TextIO, chunk_size: int = 1 << 16) -> Iterator[Tuple[int, int]]:
+        """
+        ファイルなどのテキストストリームを一定のメモリで走査する
+
+        Args:
+            stream: テキストモードで開いたストリーム
+            chunk_size: 一度に読み込む文字数
+
+        Yields:
+            (ストリーム先頭からの位置, 絵文字ID)
+        """
+        return self.scan_chunks(iter(lambda: stream.read(chunk_size), ''))
+
+def main(argv: Optional[List[str]] = None):
+    """
+    コマンドラインからの実行時のエントリーポイント
+    """
+    from emoji_data import EmojiData
+
+    parser = argparse.ArgumentParser(description='テキスト中のカタログ絵文字を検出')
+    parser.add_argument('file', nargs='?', help='入力ファイル（省略時は標準入力）')
+    parser.add_argument('--symbols', action='store_true', help='グループのない記号類も検出する')
+    parser.add_argument('--count', action='store_true', help='検出位置ではなく絵文字ごとの件数を表示')
+    args = parser.parse_args(argv)
+
+    emoji_data = EmojiData()
+    try:
+        scanner = EmojiScanner.from_emoji_data(emoji_data, include_symbols=args.symbols)
+    finally:
+        emoji_data.close()
+
+    stream = open(args.file, 'r', encoding='utf-8') if args.file else sys.stdin
+    try:
+        if args.count:
+            counts: Dict[int, int] = {}
+            for _, emoji_id in scanner.scan_stream(stream):
+                counts[emoji_id] = counts.get(emoji_id, 0) + 1
+            for emoji_id, count in sorted(counts.items(), key=lambda item: -item[1]):
+                print(f"{emoji_id}\t{count}")
+        else:
+            for offset, emoji_id in scanner.scan_stream(stream):
+                print(f"{offset}\t{emoji_id}")
+    finally:
+        if args.file:
+            stream.close()
+
+if __name__ == "__main__":
+    main()
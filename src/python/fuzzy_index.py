@@ -0,0 +1,137 @@
+"""
+タイプミスを許容するあいまい検索のインデックス。
+SymSpell方式の削除辞書を一度だけ構築し、編集距離1〜2の候補を高速に引く。
+"""
+
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+def edit_distance(a: str, b: str, max_distance: int) -> int:
+    """
+    隣接文字の入れ替えを1操作と数える編集距離（OSA距離）を求める
+
+    Args:
+        a: 比較する文字列
+        b: 比較する文字列
+        max_distance: これを超えた時点で打ち切る距離
+
+    Returns:
+        編集距離。max_distanceを超える場合はmax_distance + 1
+    """
+    if abs(len(a) - len(b)) > max_distance:
+        return max_distance + 1
+    if a == b:
+        return 0
+
+    prev_prev: List[int] = []
+    prev = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        current = [i] + [0] * len(b)
+        row_min = i
+        for j in range(1, len(b) + 1):
+            cost = 0 if a[i - 1] == b[j - 1] else 1
+            value = min(prev[j] + 1, current[j - 1] + 1, prev[j - 1] + cost)
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                value = min(value, prev_prev[j - 2] + 1)
+            current[j] = value
+            row_min = min(row_min, value)
+        if row_min > max_distance:
+            return max_distance + 1
+        prev_prev, prev = prev, current
+    return prev[-1] if prev[-1] <= max_distance else max_distance + 1
+
+class FuzzyIndex:
+    """
+    削除辞書（SymSpell方式）によるあいまい検索インデックス
+
+    各語の先頭prefix_length文字から最大max_distance文字を削除した文字列を
+    キーに登録しておき、検索語の削除文字列と突き合わせて候補を絞り込む。
+    候補だけを編集距離で検証するので、全語との距離計算は行わない。
+    """
+
+    def __init__(self, max_distance: int = 2, prefix_length: int = 7):
+        """
+        Args:
+            max_distance: 許容する最大の編集距離
+            prefix_length: 削除文字列を生成する先頭の文字数
+        """
+        self.max_distance = max_distance
+        self.prefix_length = prefix_length
+        self._deletes: Dict[str, Set[str]] = defaultdict(set)
+        self._values: Dict[str, List[int]] = {}
+
+    def __len__(self) -> int:
+        return len(self._values)
+
+    def _generate_deletes(self, term: str, max_distance: int) -> Set[str]:
+        """
+        termから最大max_distance文字を削除した文字列の集合（term自身を含む）
+        """
+        results = {term}
+        frontier = {term}
+        for _ in range(max_distance):
+            next_frontier = set()
+            for word in frontier:
+                if len(word) <= 1:
+                    continue
+                for i in range(len(word)):
+                    deleted = word[:i] + word[i + 1:]
+                    if deleted not in results:
+                        next_frontier.add(deleted)
+            results |= next_frontier
+            frontier = next_frontier
+        return results
+
+    def add(self, term: str, value: int) -> None:
+        """
+        語を登録する。同じ語を複数回登録すると値が追加される
+
+        Args:
+            term: 登録する語
+            value: 語に対応する値（キーワードIDなど）
+        """
+        if not term:
+            return
+        if term in self._values:
+            self._values[term].append(value)
+            return
+        self._values[term] = [value]
+        for deleted in self._generate_deletes(term[:self.prefix_length], self.max_distance):
+            self._deletes[deleted].add(term)
+
+    def add_all(self, items: Iterable[Tuple[str, int]]) -> None:
+        """
+        (語, 値) の組をまとめて登録する
+        """
+        for term, value in items:
+            self.add(term, value)
+
+    def lookup(self, query: str, max_distance: Optional[int] = None,
+               limit: int = 200) -> List[Tuple[str, List[int], int]]:
+        """
+        検索語から編集距離max_distance以内の語を探す
+
+        Args:
+            query: 検索語
+            max_distance: 許容する編集距離（インデックスの最大値以下）。Noneならインデックスの最大値
+            limit: 返す候補の最大数
+
+        Returns:
+            (語, 値のリスト, 距離) のリスト。距離、語の順にソート済み
+        """
+        if not query:
+            return []
+        if max_distance is None or max_distance > self.max_distance:
+            max_distance = self.max_distance
+
+        candidates: Set[str] = set()
+        for deleted in self._generate_deletes(query[:self.prefix_length], max_distance):
+            candidates |= self._deletes.get(deleted, set())
+
+        results = []
+        for term in candidates:
+            distance = edit_distance(query, term, max_distance)
+            if distance <= max_distance:
+                results.append((term, self._values[term], distance))
+        results.sort(key=lambda item: (item[2], item[0]))
+        return results[:limit]
@@ -0,0 +1,152 @@
+"""
+CLIの --profile 用の簡易プロファイラ。
+ステージ（XMLの解析、テーブル作成、挿入など）ごとの経過時間とメモリ使用量のピーク（tracemalloc）を記録し、
+必要ならcProfileの結果をpstats形式で保存する。
+
+使用例:
+    profiler = Profiler(enabled=args.profile, pstats_path=args.profile_output)
+    with profiler:
+        with profiler.stage('parse XML'):
+            parse()
+        with profiler.stage('dump'):
+            dump()
+    profiler.report()
+"""
+
+import cProfile
+import sys
+import time
+import tracemalloc
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, TextIO
+
+class StageTiming:
+    """
+    1つのステージの計測結果（同じ名前のステージを繰り返した場合は合計）
+    """
+
+    def __init__(self, name: str, depth: int):
+        self.name = name
+        self.depth = depth
+        self.calls = 0
+        self.elapsed = 0.0
+        self.peak_bytes = 0
+
+class Profiler:
+    """
+    ステージごとの経過時間とメモリのピークを記録する
+
+    enabled=Falseのときはstage()も何もしないので、プロファイルしない通常の実行に影響しない。
+    メモリのピークはステージの中で確保されたPythonオブジェクトのもの（tracemallocで計測）で、
+    入れ子のステージのピークは外側のステージにも含まれる。
+    """
+
+    def __init__(self, enabled: bool = True, pstats_path: Optional[str] = None):
+        """
+        Args:
+            enabled: Falseなら何も計測しない
+            pstats_path: cProfileの結果を保存するファイル。Noneなら関数単位のプロファイルは取らない
+        """
+        self.enabled = enabled
+        self.pstats_path = pstats_path
+        self.stages: Dict[str, StageTiming] = {}
+        self.elapsed = 0.0
+        self.peak_bytes = 0
+        self._peaks: List[int] = []
+        self._start = 0.0
+        self._profile: Optional[cProfile.Profile] = None
+        self._started_tracemalloc = False
+
+    def __enter__(self) -> 'Profiler':
+        if self.enabled:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+                self._started_tracemalloc = True
+            self._peaks = [0]
+            self._reset_peak()
+            if self.pstats_path:
+                self._profile = cProfile.Profile()
+                self._profile.enable()
+            self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        if not self.enabled:
+            return
+        self.elapsed = time.perf_counter() - self._start
+        if self._profile is not None:
+            self._profile.disable()
+            self._profile.dump_stats(self.pstats_path)
+            self._profile = None
+        self.peak_bytes = max(self._peaks[0], self._reset_peak())
+        if self._started_tracemalloc:
+            tracemalloc.stop()
+            self._started_tracemalloc = False
+
+    @staticmethod
+    def _reset_peak() -> int:
+        """
+        前回のリセット以降のピークを返し、ピークを現在の使用量に戻す
+        """
+        peak = tracemalloc.get_traced_memory()[1]
+        # reset_peakはPython 3.9以降。3.8では外側のステージとピークを区別できない
+        if hasattr(tracemalloc, 'reset_peak'):
+            tracemalloc.reset_peak()
+        return peak
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        """
+        withの中をステージとして計測する
+
+        Args:
+            name: ステージ名（レポートの行見出し）
+        """
+        if not self.enabled or not self._peaks:
+            yield
+            return
+
+        # ここまでのピークを外側のステージに渡してから、このステージの計測を始める
+        self._peaks[-1] = max(self._peaks[-1], self._reset_peak())
+        timing = self.stages.get(name)
+        if timing is None:
+            timing = self.stages[name] = StageTiming(name, len(self._peaks) - 1)
+        self._peaks.append(0)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            timing.elapsed += time.perf_counter() - start
+            timing.calls += 1
+            peak = max(self._peaks.pop(), self._reset_peak())
+            timing.peak_bytes = max(timing.peak_bytes, peak)
+            self._peaks[-1] = max(self._peaks[-1], peak)
+
+    def report(self, file: TextIO = None) -> None:
+        """
+        ステージごとの経過時間とメモリのピークを表示する（既定は標準エラー出力）
+        """
+        if not self.enabled:
+            return
+        file = file or sys.stderr
+        print("プロファイル:", file=file)
+        width = max([len(t.name) + 2 * t.depth for t in self.stages.values()] + [4])
+        for timing in self.stages.values():
+            label = '  ' * timing.depth + timing.name
+            calls = f" ({timing.calls}回)" if timing.calls > 1 else ''
+            print(f"  {label:<{width}}  {timing.elapsed:9.3f}秒  ピーク {_format_bytes(timing.peak_bytes):>9}{calls}",
+                  file=file)
+        print(f"  {'合計':<{width - 2}}  {self.elapsed:9.3f}秒  ピーク {_format_bytes(self.peak_bytes):>9}", file=file)
+        if self.pstats_path:
+            print(f"  関数ごとのプロファイル: {self.pstats_path} "
+                  f"(python -m pstats {self.pstats_path} で表示)", file=file)
+
+def _format_bytes(n: int) -> str:
+    """
+    バイト数を読みやすい単位にする
+    """
+    for unit in ('B', 'KB', 'MB'):
+        if n < 1024:
+            return f"{n:.1f}{unit}" if unit != 'B' else f"{n}{unit}"
+        n /= 1024
+    return f"{n:.1f}GB"
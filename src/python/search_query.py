@@ -0,0 +1,101 @@
+"""
+検索クエリの構文解析。
+「猫 -顔 subgroup:動物-哺乳類 is:fav」のような検索語とフィールド指定の組み合わせを、
+AND（空白区切り）・OR・NOT（先頭の-）からなる条件の木に変換する。
+SQLへの変換はスキーマを知っているEmojiData側で行う。
+"""
+
+import re
+from typing import List, NamedTuple
+
+# フィールド名の別名 → 正式名
+FIELD_ALIASES = {
+    'group': 'group', 'g': 'group',
+    'subgroup': 'subgroup', 'sub': 'subgroup', 'sg': 'subgroup',
+    'is': 'is',
+    'version': 'version', 'v': 'version',
+}
+
+# is: に指定できる値の別名 → 正式名
+IS_VALUES = {
+    'fav': 'favorite', 'favorite': 'favorite', 'お気に入り': 'favorite',
+    'qualified': 'qualified',
+}
+
+# OR演算子として扱うトークン
+OR_TOKENS = ('OR', '|')
+
+_TOKEN = re.compile(r'''
+    (?P<negate>-)?
+    (?:(?P<field>[A-Za-z]+):)?
+    (?:"(?P<quoted>[^"]*)"?|(?P<bare>[^\s"]+))
+''', re.VERBOSE)
+
+class QueryTerm(NamedTuple):
+    """
+    検索条件の最小単位
+
+    field は 'text'（キーワードの部分一致）、'group'、'subgroup'、'is'、'version' のいずれか。
+    """
+    field: str
+    value: str
+    negated: bool = False
+
+# 条件の木: 外側のリストがAND、内側のリストがOR
+ParsedQuery = List[List[QueryTerm]]
+
+def _make_term(negate: bool, field: str, value: str) -> QueryTerm:
+    """
+    トークンを検索条件にする。知らないフィールド名や値は語句の一部として扱う
+    """
+    name = FIELD_ALIASES.get(field.lower()) if field else None
+    if name == 'is':
+        if value.lower() in IS_VALUES:
+            return QueryTerm(name, IS_VALUES[value.lower()], negate)
+    elif name == 'version':
+        try:
+            return QueryTerm(name, str(float(value.lstrip('<='))), negate)
+        except ValueError:
+            pass
+    elif name is not None:
+        return QueryTerm(name, value, negate)
+    return QueryTerm('text', f"{field}:{value}" if field else value, negate)
+
+def parse_query(query: str) -> ParsedQuery:
+    """
+    検索クエリを解析する
+
+    - 空白で区切った条件はすべて満たす必要がある（AND）
+    - 条件の間の OR または | はどちらかを満たせばよい（ORはANDより強く結びつく）
+    - 先頭の - はその条件を満たさないもの（NOT）
+    - group: / subgroup: はグループ名・サブグループ名の完全一致、is:fav はお気に入り、
+      is:qualified はfully-qualifiedの絵文字、version:13.0 はそのバージョン以下の絵文字
+    - 空白を含む値は "..." で囲む
+
+    Args:
+        query: 検索クエリ
+
+    Returns:
+        ORのグループを要素とするANDのリスト
+    """
+    clauses: ParsedQuery = []
+    pending_or = False
+    for match in _TOKEN.finditer(query):
+        negate = bool(match.group('negate'))
+        field = match.group('field')
+        quoted = match.group('quoted')
+        value = quoted if quoted is not None else match.group('bare')
+
+        if quoted is None and not negate and not field and value in OR_TOKENS:
+            pending_or = bool(clauses)
+            continue
+        if not value:
+            continue
+
+        term = _make_term(negate, field, value)
+        if pending_or:
+            clauses[-1].append(term)
+        else:
+            clauses.append([term])
+        pending_or = False
+    return clauses
@@ -0,0 +1,154 @@
+"""
+:キーワード: 形式のショートコードを絵文字に置き換えるストリーミング変換器。
+カタログからキーワード→絵文字の対応表を一度だけ読み込み、テキストをチャンク単位で変換する。
+"""
+
+import re
+from functools import lru_cache
+from typing import Dict, Iterable, Iterator, List, Optional, TextIO, Tuple
+
+from text_normalize import normalize_query, normalize_text
+
+# 曖昧なキーワード（複数の絵文字に付いている）の解決方針
+#   first:   カタログ順で最初の絵文字
+#   popular: 使用履歴の多い絵文字（同数ならカタログ順）
+#   keep:    置き換えずにそのまま残す
+# いずれの方針でも、short_nameが完全一致する絵文字を最優先する
+AMBIGUITY_POLICIES = ('first', 'popular', 'keep')
+
+# ショートコードとして扱うキーワードの最大文字数
+MAX_SHORTCODE_LENGTH = 64
+
+class ShortcodeConverter:
+    """
+    ショートコードを絵文字に置き換える変換器
+    """
+
+    def __init__(self, mapping: Dict[str, str]):
+        """
+        Args:
+            mapping: 正規化したキーワードから絵文字への対応表
+        """
+        self.mapping = mapping
+        self._token = re.compile(r':([^:\s]{1,%d})(?=:)' % MAX_SHORTCODE_LENGTH)
+        self._resolve = lru_cache(maxsize=65536)(self._resolve_uncached)
+        self.replaced = 0
+
+    @classmethod
+    def from_emoji_data(cls, emoji_data, policy: str = 'first') -> 'ShortcodeConverter':
+        """
+        EmojiDataのカタログから対応表を作成する
+
+        Args:
+            emoji_data: EmojiDataのインスタンス
+            policy: 曖昧なキーワードの解決方針（AMBIGUITY_POLICIESのいずれか）
+
+        Returns:
+            ShortcodeConverter
+        """
+        if policy not in AMBIGUITY_POLICIES:
+            raise ValueError(f"不明な解決方針です: {policy}")
+
+        usage = emoji_data.get_usage_counts() if policy == 'popular' else {}
+        candidates: Dict[str, List[Tuple[int, int, int, str]]] = {}
+        for keyword, emoji_id, unicode, is_short_name in emoji_data.get_keyword_entries():
+            # short_name一致 → 使用回数 → カタログ順 の優先度でソートできる形にする
+            rank = (0 if is_short_name else 1, -usage.get(emoji_id, 0), emoji_id, unicode)
+            candidates.setdefault(keyword, []).append(rank)
+
+        mapping = {}
+        for keyword, ranks in candidates.items():
+            ranks.sort()
+            best = ranks[0]
+            ambiguous = len(ranks) > 1 and best[0] == ranks[1][0]
+            if ambiguous and policy == 'keep':
+                continue
+            mapping[keyword] = best[3]
+        return cls(mapping)
+
+    def _resolve_uncached(self, token: str) -> Optional[str]:
+        # 英字のキーワード（:ufo:）はそのままの形で、ローマ字読み（:neko:）はかなにした形で引く
+        emoji = self.mapping.get(normalize_text(token))
+        if emoji is None:
+            emoji = self.mapping.get(normalize_query(token))
+        return emoji
+
+    def _convert_buffer(self, buffer: str, final: bool) -> Tuple[str, str]:
+        """
+        バッファを変換し、(出力, 次のチャンクに持ち越す末尾) を返す
+        """
+        output = []
+        pos = 0
+        while True:
+            match = self._token.search(buffer, pos)
+            if match is None:
+                break
+            emoji = self._resolve(match.group(1))
+            if emoji is None:
+                # 閉じコロンが次のショートコードの開始かもしれないので、その手前まで出力する
+                output.append(buffer[pos:match.end()])
+                pos = match.end()
+                continue
+            output.append(buffer[pos:match.start()])
+            output.append(emoji)
+            self.replaced += 1
+            pos = match.end() + 1
+
+        if not final:
+            # 閉じていないショートコードの途中で切れている場合は持ち越す
+            tail = buffer.rfind(':', pos)
+            if tail != -1 and len(buffer) - tail <= MAX_SHORTCODE_LENGTH + 1 \
+                    and not any(c.isspace() for c in buffer[tail + 1:]):
+                output.append(buffer[pos:tail])
+                return ''.join(output), buffer[tail:]
+
+        output.append(buffer[pos:])
+        return ''.join(output), ''
+
+    def convert(self, text: str) -> str:
+        """
+        テキスト中のショートコードを置き換える
+
+        Args:
+            text: 変換するテキスト
+
+        Returns:
+            変換後のテキスト
+        """
+        return self._convert_buffer(text, final=True)[0]
+
+    def convert_chunks(self, chunks: Iterable[str]) -> Iterator[str]:
+        """
+        分割されたテキストを順に変換する。チャンク境界で切れたショートコードも変換する
+
+        Args:
+            chunks: テキストの断片
+
+        Yields:
+            変換後のテキストの断片
+        """
+        carry = ''
+        for chunk in chunks:
+            output, carry = self._convert_buffer(carry + chunk, final=False)
+            if output:
+                yield output
+        if carry:
+            yield self._convert_buffer(carry, final=True)[0]
+
+    def convert_stream(self, source: TextIO, destination: TextIO,
+                       chunk_size: int = 1 << 20) -> int:
+        """
+        ストリームを一定のメモリで変換して書き出す
+
+        Args:
+            source: 入力ストリーム
+            destination: 出力ストリーム
+            chunk_size: 一度に読み込む文字数
+
+        Returns:
+            置き換えたショートコードの数
+        """
+        before = self.replaced
+        for output in self.convert_chunks(iter(lambda: source.read(chunk_size), '')):
+            destination.write(output)
+        return self.replaced - before
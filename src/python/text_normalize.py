@@ -0,0 +1,179 @@
+"""
+検索用の文字列正規化ユーティリティ。
+カタカナ/ひらがな、全角/半角、大文字/小文字の違いを吸収し、ローマ字入力をかなに変換する。
+絵文字そのものについても、異体字セレクタと肌の色の違いを吸収した照合用のキーを作る。
+seed_db.pyでのキーワード索引の作成とEmojiDataでの検索語の処理の両方で使う。
+"""
+
+import re
+import unicodedata
+from typing import Optional, Tuple
+
+# カタカナ（ァ〜ヶ、ヽヾ）からひらがなへの変換表
+_KATAKANA_TO_HIRAGANA = {c: c - 0x60 for c in range(0x30A1, 0x30F7)}
+_KATAKANA_TO_HIRAGANA.update({0x30FD: 0x309D, 0x30FE: 0x309E})
+
+# ローマ字からひらがなへの変換表（ヘボン式・訓令式の両方を受け付ける）
+_ROMAJI_TABLE = {
+    'a': 'あ', 'i': 'い', 'u': 'う', 'e': 'え', 'o': 'お',
+    'ka': 'か', 'ki': 'き', 'ku': 'く', 'ke': 'け', 'ko': 'こ',
+    'ga': 'が', 'gi': 'ぎ', 'gu': 'ぐ', 'ge': 'げ', 'go': 'ご',
+    'sa': 'さ', 'si': 'し', 'shi': 'し', 'su': 'す', 'se': 'せ', 'so': 'そ',
+    'za': 'ざ', 'zi': 'じ', 'ji': 'じ', 'zu': 'ず', 'ze': 'ぜ', 'zo': 'ぞ',
+    'ta': 'た', 'ti': 'ち', 'chi': 'ち', 'tu': 'つ', 'tsu': 'つ', 'te': 'て', 'to': 'と',
+    'da': 'だ', 'di': 'ぢ', 'du': 'づ', 'de': 'で', 'do': 'ど',
+    'na': 'な', 'ni': 'に', 'nu': 'ぬ', 'ne': 'ね', 'no': 'の',
+    'ha': 'は', 'hi': 'ひ', 'hu': 'ふ', 'fu': 'ふ', 'he': 'へ', 'ho': 'ほ',
+    'ba': 'ば', 'bi': 'び', 'bu': 'ぶ', 'be': 'べ', 'bo': 'ぼ',
+    'pa': 'ぱ', 'pi': 'ぴ', 'pu': 'ぷ', 'pe': 'ぺ', 'po': 'ぽ',
+    'ma': 'ま', 'mi': 'み', 'mu': 'む', 'me': 'め', 'mo': 'も',
+    'ya': 'や', 'yu': 'ゆ', 'yo': 'よ',
+    'ra': 'ら', 'ri': 'り', 'ru': 'る', 're': 'れ', 'ro': 'ろ',
+    'la': 'ら', 'li': 'り', 'lu': 'る', 'le': 'れ', 'lo': 'ろ',
+    'wa': 'わ', 'wi': 'うぃ', 'we': 'うぇ', 'wo': 'を',
+    'nn': 'ん', "n'": 'ん',
+    'kya': 'きゃ', 'kyu': 'きゅ', 'kyo': 'きょ',
+    'gya': 'ぎゃ', 'gyu': 'ぎゅ', 'gyo': 'ぎょ',
+    'sya': 'しゃ', 'syu': 'しゅ', 'syo': 'しょ', 'sha': 'しゃ', 'shu': 'しゅ', 'she': 'しぇ', 'sho': 'しょ',
+    'zya': 'じゃ', 'zyu': 'じゅ', 'zyo': 'じょ', 'ja': 'じゃ', 'ju': 'じゅ', 'je': 'じぇ', 'jo': 'じょ',
+    'jya': 'じゃ', 'jyu': 'じゅ', 'jyo': 'じょ',
+    'tya': 'ちゃ', 'tyu': 'ちゅ', 'tyo': 'ちょ', 'cha': 'ちゃ', 'chu': 'ちゅ', 'che': 'ちぇ', 'cho': 'ちょ',
+    'dya': 'ぢゃ', 'dyu': 'ぢゅ', 'dyo': 'ぢょ',
+    'nya': 'にゃ', 'nyu': 'にゅ', 'nyo': 'にょ',
+    'hya': 'ひゃ', 'hyu': 'ひゅ', 'hyo': 'ひょ',
+    'bya': 'びゃ', 'byu': 'びゅ', 'byo': 'びょ',
+    'pya': 'ぴゃ', 'pyu': 'ぴゅ', 'pyo': 'ぴょ',
+    'mya': 'みゃ', 'myu': 'みゅ', 'myo': 'みょ',
+    'rya': 'りゃ', 'ryu': 'りゅ', 'ryo': 'りょ',
+    'fa': 'ふぁ', 'fi': 'ふぃ', 'fe': 'ふぇ', 'fo': 'ふぉ',
+    'thi': 'てぃ', 'dhi': 'でぃ', 'tsa': 'つぁ',
+    'va': 'ゔぁ', 'vi': 'ゔぃ', 'vu': 'ゔ', 've': 'ゔぇ', 'vo': 'ゔぉ',
+    'xa': 'ぁ', 'xi': 'ぃ', 'xu': 'ぅ', 'xe': 'ぇ', 'xo': 'ぉ',
+    'xya': 'ゃ', 'xyu': 'ゅ', 'xyo': 'ょ', 'xtu': 'っ', 'xtsu': 'っ',
+    '-': 'ー',
+}
+_ROMAJI_MAX_LENGTH = max(len(key) for key in _ROMAJI_TABLE)
+_CONSONANTS = set('bcdfghjklmpqrstvwxyz')
+_ROMAJI_RUN = re.compile(r"[a-z][a-z'\-]*")
+
+# 異体字セレクタ（VS15/VS16）
+VARIATION_SELECTORS = '\ufe0e\ufe0f'
+# 肌の色の修飾子（metadata.emoji_modifierと同じU+1F3FB〜U+1F3FF）
+SKIN_TONE_MODIFIERS = ''.join(chr(c) for c in range(0x1F3FB, 0x1F400))
+_EMOJI_KEY_TABLE = str.maketrans('', '', VARIATION_SELECTORS + SKIN_TONE_MODIFIERS)
+
+def normalize_text(text: str) -> str:
+    """
+    索引・検索で共通の正規化を行う
+
+    NFKCで全角英数字と半角カナを揃え、小文字化し、カタカナをひらがなに変換する。
+
+    Args:
+        text: 正規化する文字列
+
+    Returns:
+        正規化した文字列
+    """
+    return unicodedata.normalize('NFKC', text).lower().translate(_KATAKANA_TO_HIRAGANA)
+
+def romaji_to_kana(text: str, allow_partial: bool = False) -> Optional[str]:
+    """
+    ローマ字をひらがなに変換する
+
+    Args:
+        text: 小文字のローマ字
+        allow_partial: Trueなら末尾の入力途中の子音（"nek"の"k"など）を捨てる
+
+    Returns:
+        ひらがな。変換できない文字を含む場合はNone
+    """
+    result = []
+    i = 0
+    while i < len(text):
+        # 促音: 同じ子音の連続（nnは「ん」なので除く）
+        if (i + 1 < len(text) and text[i] == text[i + 1]
+                and text[i] in _CONSONANTS and text[i] != 'n'):
+            result.append('っ')
+            i += 1
+            continue
+
+        # 「nn」の後に母音・yが続く場合は「ん」+な行（onna → おんな）
+        if text[i:i + 2] == 'nn' and i + 2 < len(text) and text[i + 2] in 'aiueoy':
+            result.append('ん')
+            i += 1
+            continue
+
+        for length in range(min(_ROMAJI_MAX_LENGTH, len(text) - i), 0, -1):
+            kana = _ROMAJI_TABLE.get(text[i:i + length])
+            if kana is not None:
+                result.append(kana)
+                i += length
+                break
+        else:
+            # 子音の前、または末尾のnは「ん」
+            if text[i] == 'n' and (i + 1 == len(text) or text[i + 1] in _CONSONANTS):
+                if i + 1 == len(text) and allow_partial:
+                    # 入力途中の「な行」かもしれないので捨てる
+                    break
+                result.append('ん')
+                i += 1
+                continue
+            if allow_partial and all(c in _CONSONANTS for c in text[i:]):
+                break
+            return None
+    return ''.join(result)
+
+def normalize_query(query: str) -> str:
+    """
+    検索語を正規化する。ローマ字部分はすべて変換できる場合のみかなにする
+
+    Args:
+        query: 入力された検索語
+
+    Returns:
+        keywords.keyword_normと同じ形式に正規化した検索語
+    """
+    normalized = normalize_text(query.strip())
+    runs = _ROMAJI_RUN.findall(normalized)
+    if not runs:
+        return normalized
+
+    converted = []
+    for index, run in enumerate(runs):
+        # 入力途中の子音を許すのは最後の語の末尾だけ
+        allow_partial = index == len(runs) - 1 and normalized.endswith(run)
+        kana = romaji_to_kana(run, allow_partial=allow_partial)
+        if not kana or (allow_partial and len(kana) < 2 and romaji_to_kana(run) is None):
+            # "ok"→「お」のように英単語が1文字に縮むのは避ける
+            return normalized
+        converted.append(kana)
+
+    parts = iter(converted)
+    return _ROMAJI_RUN.sub(lambda _: next(parts), normalized)
+
+def split_emoji_key(text: str) -> Tuple[str, str]:
+    """
+    絵文字を照合用のキーと、取り除いた肌の色の修飾子に分ける
+
+    異体字セレクタ（U+FE0F など）の有無と肌の色の違いを区別しない。ZWJシーケンスの構造は残す。
+
+    Args:
+        text: 絵文字（貼り付けられた文字列など）
+
+    Returns:
+        (照合用のキー, 肌の色の修飾子を出現順に連結した文字列)
+    """
+    modifiers = ''.join(c for c in text if c in SKIN_TONE_MODIFIERS)
+    return text.strip().translate(_EMOJI_KEY_TABLE), modifiers
+
+def emoji_key(text: str) -> str:
+    """
+    絵文字の照合用のキー（emojis.unicode_keyと同じ形式）を求める
+
+    Args:
+        text: 絵文字
+
+    Returns:
+        異体字セレクタと肌の色の修飾子を取り除いた文字列
+    """
+    return split_emoji_key(text)[0]